@@ -169,6 +169,10 @@ on Wikipedia.</p>'''.replace('\n', ' ')
         return self.output_extension(obj.crlDistributionPoints())
     cRLDistributionPoints.short_description = _('CRL Distribution Points')
 
+    def freshestCRL(self, obj):
+        return self.output_extension(obj.freshestCRL())
+    freshestCRL.short_description = _('Freshest CRL')
+
     def subjectAltName(self, obj):
         return self.output_extension(obj.subjectAltName())
     subjectAltName.short_description = _('subjectAltName')
@@ -212,7 +216,8 @@ class CertificateAuthorityAdmin(CertificateMixin, admin.ModelAdmin):
         }),
         (_('Details'), {
             'description': _('Information to add to newly signed certificates.'),
-            'fields': ['crl_url', 'issuer_url', 'ocsp_url', 'issuer_alt_name', ],
+            'fields': ['crl_url', 'crl_shards', 'delta_crl_url', 'issuer_url', 'ocsp_url',
+                       'issuer_alt_name', ],
         }),
         (_('Certificate'), {
             'fields': ['serial', 'pub', 'expires'],
@@ -409,6 +414,7 @@ class CertificateAdmin(CertificateMixin, admin.ModelAdmin):
                 tls_features=data['tlsFeature'],
                 password=data['password']
             )
+            obj.crl_shard = data['ca'].get_crl_shard(obj.x509.serial_number)
         obj.save()
 
     class Media:
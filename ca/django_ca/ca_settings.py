@@ -136,6 +136,10 @@ CA_DEFAULT_EXPIRES = getattr(settings, 'CA_DEFAULT_EXPIRES', 730)
 CA_DEFAULT_PROFILE = getattr(settings, 'CA_DEFAULT_PROFILE', 'webserver')
 CA_DIGEST_ALGORITHM = getattr(settings, 'CA_DIGEST_ALGORITHM', "sha512")
 CA_NOTIFICATION_DAYS = getattr(settings, 'CA_NOTIFICATION_DAYS', [14, 7, 3, 1, ])
+CA_KEY_CACHE = getattr(settings, 'CA_KEY_CACHE', True)
+CA_KEY_CACHE_TIMEOUT = getattr(settings, 'CA_KEY_CACHE_TIMEOUT', 3600)
+CA_DELTA_CRL_EXPIRES = getattr(settings, 'CA_DELTA_CRL_EXPIRES', 60)
+CA_OCSP_INDEX_TIMEOUT = getattr(settings, 'CA_OCSP_INDEX_TIMEOUT', 60)
 
 # Undocumented options, e.g. to share values between different parts of code
 CA_MIN_KEY_SIZE = getattr(settings, 'CA_MIN_KEY_SIZE', 2048)
@@ -13,24 +13,218 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import hashlib
+import os
+import tempfile
+import uuid
 from datetime import datetime
 from datetime import timedelta
 
+from asn1crypto import crl as asn1_crl
+from asn1crypto import x509 as asn1_x509
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.x509.oid import ExtensionOID
+from cryptography.x509.oid import ObjectIdentifier
 
+from django.core.cache import cache
 from django.utils import timezone
 
 from django_ca.models import Certificate
 from django_ca.models import CertificateAuthority
+from django_ca.models import CertificateRevocationList
+from django_ca.utils import get_revoked_certificate
 
+CRL_VERSION_CACHE_KEY = 'crl_version_%s'
+CRL_CHUNK_CACHE_KEY = 'crl_chunk_%s_%s'
 
-def get_crl(ca, encoding, expires, algorithm, password, ca_crl=False):
+# Not yet defined by cryptography
+ISSUING_DISTRIBUTION_POINT_OID = ObjectIdentifier('2.5.29.28')
+
+
+def get_crl_cache_key(serial, encoding, algorithm, ca_crl=False, delta=False, shard=None):
+    """Get the cache key for a CRL of the certificate authority with the given serial.
+
+    The cache key contains a version that changes whenever a certificate is revoked (see
+    :py:func:`invalidate_crl_cache`), so cached CRLs never contain outdated information.
+    """
+    version_key = CRL_VERSION_CACHE_KEY % serial
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, None)
+        version = cache.get(version_key)
+
+    cache_key = 'crl_%s_%s_%s_%s' % (serial, version, encoding, algorithm.name)
+    if ca_crl is True:
+        cache_key += '_ca'
+    if delta is True:
+        cache_key += '_delta'
+    if shard is not None:
+        cache_key += '_shard%s' % shard
+    return cache_key
+
+
+def invalidate_crl_cache(serial):
+    """Invalidate all cached CRLs of the certificate authority with the given serial.
+
+    This is called automatically whenever a certificate or child CA is revoked.
+    """
+    cache.set(CRL_VERSION_CACHE_KEY % serial, uuid.uuid4().hex, None)
+
+
+def set_crl_chunks(crl, timeout, chunk_size):
+    """Store a CRL in the cache, split into chunks of at most ``chunk_size`` bytes.
+
+    Cache backends usually limit the size of a single item (memcached: 1 MB by default), larger items are
+    often silently discarded. Chunk keys are derived from the hash of the CRL, so a list of keys never refers
+    to chunks of a different CRL.
+
+    Returns
+    -------
+
+    list
+        The cache keys of the chunks, in order.
+
+    Raises
+    ------
+
+    ValueError
+        If the cache backend reports that chunks could not be stored.
+    """
+    digest = hashlib.sha256(crl).hexdigest()
+    keys = []
+    chunks = {}
+    for i, offset in enumerate(range(0, len(crl), chunk_size)):
+        key = CRL_CHUNK_CACHE_KEY % (digest, i)
+        keys.append(key)
+        chunks[key] = crl[offset:offset + chunk_size]
+
+    failed = cache.set_many(chunks, timeout)
+    if failed:  # Django 2.0+ returns the keys that could not be stored
+        raise ValueError('Could not store %s of %s chunks.' % (len(failed), len(keys)))
+    return keys
+
+
+def get_crl_chunks(keys):
+    """Get the chunks of a CRL stored with :py:func:`set_crl_chunks`.
+
+    All chunks are fetched with a single call to ``cache.get_many()``, so the CRL is either complete or not
+    returned at all.
+
+    Returns
+    -------
+
+    list
+        The chunks in the order of ``keys``.
+
+    Raises
+    ------
+
+    KeyError
+        If a chunk is no longer in the cache.
+    """
+    chunks = cache.get_many(keys)
+    for key in keys:
+        if key not in chunks:
+            raise KeyError(key)
+    return [chunks[key] for key in keys]
+
+
+def get_crl_builder(ca, expires, revoked):
+    """Get a CRL builder containing the given revoked certificates.
+
+    ``CertificateRevocationListBuilder.add_revoked_certificate()`` copies the list of entries every time it
+    is called, so adding entries one by one takes quadratic time. This function creates all entries first
+    and passes them to the builder at once, so it scales linearly with the number of revoked certificates.
+
+    Parameters
+    ----------
+
+    ca : :py:class:`~django_ca.models.CertificateAuthority`
+    expires : int
+        The time in seconds until a new CRL will be generated
+    revoked : iterable
+        Iterable of ``(serial, revoked_date, revoked_reason)`` tuples, see
+        :py:func:`~django_ca.utils.get_revoked_certificate`.
+    """
+    now = datetime.utcnow()
+    revoked_certificates = [get_revoked_certificate(*entry) for entry in revoked]
+
+    builder = x509.CertificateRevocationListBuilder(revoked_certificates=revoked_certificates)
+    builder = builder.issuer_name(ca.x509.subject)
+    builder = builder.last_update(now)
+    builder = builder.next_update(now + timedelta(seconds=expires))
+    return builder
+
+
+def get_issuing_distribution_point(urls):
+    """Get the Issuing Distribution Point extension for a CRL shard (see :rfc:`5280`, section 5.2.5).
+
+    The extension is not supported by cryptography, so it is encoded with asn1crypto.
+
+    Parameters
+    ----------
+
+    urls : list of str
+        The URLs of the CRL shard, as used in the CRL Distribution Points extension of its certificates.
+    """
+    value = {'only_contains_user_certs': True}
+    if urls:
+        names = [asn1_x509.GeneralName(name='uniform_resource_identifier', value=url) for url in urls]
+        value['distribution_point'] = asn1_x509.DistributionPointName(name='full_name', value=names)
+    idp = asn1_crl.IssuingDistributionPoint(value)
+    return x509.UnrecognizedExtension(ISSUING_DISTRIBUTION_POINT_OID, idp.dump())
+
+
+def get_freshest_crl(urls):
+    """Get the Freshest CRL extension for a base CRL (see :rfc:`5280`, section 5.2.6).
+
+    cryptography supports the extension only in certificates, so it is encoded with asn1crypto.
+
+    Parameters
+    ----------
+
+    urls : list of str
+        The URLs of the delta CRL.
+    """
+    dps = asn1_x509.CRLDistributionPoints([{
+        'distribution_point': asn1_x509.DistributionPointName(name='full_name', value=[
+            asn1_x509.GeneralName(name='uniform_resource_identifier', value=url)
+        ]),
+    } for url in urls])
+    return x509.UnrecognizedExtension(ExtensionOID.FRESHEST_CRL, dps.dump())
+
+
+def get_base_crl(ca, ca_crl=False):
+    """Get the base CRL that a new delta CRL refers to.
+
+    A delta CRL can be applied to any base CRL with the same or a higher CRL number, so this is the oldest
+    base CRL that has not yet expired (or the newest base CRL, if all have expired).
+
+    Raises
+    ------
+
+    ValueError
+        If no base CRL was generated yet.
+    """
+    qs = CertificateRevocationList.objects.filter(ca=ca, ca_crl=ca_crl)
+    base = qs.filter(next_update__gt=timezone.now()).order_by('number').first()
+    if base is None:
+        base = qs.order_by('-number').first()
+    if base is None:
+        raise ValueError('%s: No base CRL has been generated yet.' % ca.serial)
+    return base
+
+
+def get_crl(ca, encoding, expires, algorithm, password, ca_crl=False, delta=False, shard=None):
     """Function to generate a Certificate Revocation List (CRL).
 
     All keyword arguments are passed as-is to :py:func:`OpenSSL.crypto.CRL.export`. Please see the
     documentation of that function for details.
 
+    The full CRL for certificates includes the Freshest CRL extension if the certificate authority has delta
+    CRL URLs (see :py:attr:`~django_ca.models.CertificateAuthority.delta_crl_url`).
+
     Parameters
     ----------
 
@@ -46,27 +240,86 @@ def get_crl(ca, encoding, expires, algorithm, password, ca_crl=False):
         assumed to be unencrypted.
     ca_crl : boolean, optional
         If ``True``, add revoked child CAs instead of revoked certificates.
+    delta : boolean, optional
+        If ``True``, generate a delta CRL (see :rfc:`5280`, section 5.2.4) that contains only certificates
+        revoked since the base CRL returned by :py:func:`get_base_crl` was generated.
+    shard : int, optional
+        If given, generate the CRL for only this shard (see
+        :py:attr:`~django_ca.models.CertificateAuthority.crl_shards`). The CRL includes the Issuing
+        Distribution Point extension.
 
     Returns
     -------
 
     bytes
         The CRL in the requested format.
+
+    Raises
+    ------
+
+    ValueError
+        If no base CRL was generated for a delta CRL or if the shard is invalid.
     """
-    now = datetime.utcnow()
-    builder = x509.CertificateRevocationListBuilder()
-    builder = builder.issuer_name(ca.x509.subject)
-    builder = builder.last_update(now)
-    builder = builder.next_update(now + timedelta(seconds=expires))
+    if shard is not None:
+        if ca_crl is True or delta is True:
+            raise ValueError('CRL shards are only supported for base CRLs of end-entity certificates.')
+        if shard not in ca.get_crl_shards():
+            raise ValueError('%s: Invalid CRL shard, the CA has %s shard(s).' % (shard, ca.crl_shards))
 
+    now = timezone.now()
     if ca_crl is True:
-        qs = CertificateAuthority.objects.filter(parent=ca, expires__gt=timezone.now())
+        qs = CertificateAuthority.objects.filter(parent=ca, expires__gt=now)
     else:
-        qs = CertificateAuthority.objects.filter(parent=ca, expires__gt=timezone.now())
-        qs = Certificate.objects.filter(ca=ca, expires__gt=timezone.now())
+        qs = Certificate.objects.filter(ca=ca, expires__gt=now)
+    qs = qs.revoked()
+
+    if delta is True:
+        base = get_base_crl(ca, ca_crl=ca_crl)
+        qs = qs.filter(revoked_date__gte=base.last_update)
+    if shard is not None:
+        qs = qs.filter(crl_shard=shard)
+
+    # Entries are created from the stored columns, so no certificate has to be parsed. Rows are streamed
+    # from the database, so memory usage does not depend on the number of certificates.
+    qs = qs.values_list('serial', 'revoked_date', 'revoked_reason')
+    builder = get_crl_builder(ca, expires, qs.iterator())
 
-    for cert in qs.revoked():
-        builder = builder.add_revoked_certificate(cert.get_revocation())
+    # Base and delta CRLs share the same sequence of CRL numbers (RFC 5280, section 5.2.3)
+    number = ca.get_next_crl_number()
+    builder = builder.add_extension(x509.CRLNumber(number), critical=False)
+    if delta is True:
+        builder = builder.add_extension(x509.DeltaCRLIndicator(base.number), critical=True)
+    if shard is not None:
+        builder = builder.add_extension(get_issuing_distribution_point(ca.get_crl_urls(shard)), critical=True)
+
+    # Delta CRLs are only generated for the full CRL, so shards do not refer to them
+    delta_crl_urls = ca.get_delta_crl_urls()
+    if delta_crl_urls and delta is False and ca_crl is False and shard is None:
+        builder = builder.add_extension(get_freshest_crl(delta_crl_urls), critical=False)
 
     crl = builder.sign(private_key=ca.key(password), algorithm=algorithm, backend=default_backend())
+
+    if delta is False and shard is None:
+        # Record the base CRL, so that delta CRLs can refer to it. Expired base CRLs are no longer required.
+        CertificateRevocationList.objects.filter(ca=ca, ca_crl=ca_crl, next_update__lt=now).delete()
+        CertificateRevocationList.objects.create(ca=ca, ca_crl=ca_crl, number=number, last_update=now,
+                                                 next_update=now + timedelta(seconds=expires))
+
     return crl.public_bytes(encoding)
+
+
+def write_crl(path, crl):
+    """Write a CRL to ``path``.
+
+    The CRL is first written to a temporary file in the same directory and then renamed, so clients never
+    see an incomplete CRL.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.crl-')
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(crl)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Per-process cache for decrypted private keys of certificate authorities."""
+
+import hashlib
+import os
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+from django.utils.encoding import force_bytes
+
+from . import ca_settings
+
+# Maps (serial, path) to a tuple of (mtime, password digest, expiry timestamp, key)
+_key_cache = {}
+
+
+def _get_password_digest(password):
+    if password is None:
+        return None
+    return hashlib.sha256(force_bytes(password)).digest()
+
+
+def load_private_key(serial, path, password):
+    """Load the private key of a certificate authority.
+
+    The decrypted key is cached per process unless the ``CA_KEY_CACHE`` setting is ``False``. A cached key
+    is only returned if the modification time of the file and the password are unchanged and
+    ``CA_KEY_CACHE_TIMEOUT`` seconds have not yet passed.
+
+    Parameters
+    ----------
+
+    serial : str
+        The serial of the certificate authority.
+    path : str
+        Path to the private key.
+    password : bytes or None
+        Password used to decrypt the private key.
+    """
+    cache_key = (serial, path)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _key_cache.pop(cache_key, None)
+        raise
+
+    digest = _get_password_digest(password)
+    now = time.time()
+
+    if ca_settings.CA_KEY_CACHE is True:
+        cached = _key_cache.get(cache_key)
+        if cached is not None:
+            cached_mtime, cached_digest, expires, key = cached
+            if cached_mtime != mtime or (expires is not None and expires <= now):
+                # key file has changed or the key has expired (another thread may have removed it already)
+                _key_cache.pop(cache_key, None)
+            elif cached_digest == digest:
+                return key
+            # else: the password is different. The cached key is kept, so a wrong password does not evict it.
+
+    with open(path, 'rb') as stream:
+        key = load_pem_private_key(stream.read(), password, default_backend())
+
+    if ca_settings.CA_KEY_CACHE is True:
+        timeout = ca_settings.CA_KEY_CACHE_TIMEOUT
+        _key_cache[cache_key] = (mtime, digest, None if timeout is None else now + timeout, key)
+    return key
+
+
+def evict_private_key(serial=None):
+    """Remove decrypted private keys from the per-process cache.
+
+    Keys are reloaded automatically if the file is modified, so this is only required if you want to make
+    sure that a key is no longer held in memory.
+
+    Parameters
+    ----------
+
+    serial : str, optional
+        Only remove the key of the certificate authority with the given serial. If omitted, all keys are
+        removed.
+    """
+    if serial is None:
+        _key_cache.clear()
+    else:
+        for cache_key in [k for k in _key_cache if k[0] == serial]:
+            _key_cache.pop(cache_key, None)
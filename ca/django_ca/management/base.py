@@ -15,6 +15,7 @@
 
 import argparse
 import getpass
+import multiprocessing
 import os
 import sys
 import textwrap
@@ -294,6 +295,14 @@ class BaseCommand(_BaseCommand):
             help = 'Password used for accessing the private key of the CA.'
         parser.add_argument('-p', '--password', nargs='?', action=PasswordAction, help=help)
 
+    def add_processes(self, parser):
+        """Add the --processes option."""
+
+        default = multiprocessing.cpu_count()
+        parser.add_argument(
+            '--processes', type=int, default=default, metavar='N',
+            help='Number of processes to use (default: %(default)s, the number of CPUs).')
+
     def indent(self, s, prefix='    '):
         if isinstance(s, list):
             return ''.join(['%s* %s\n' % (prefix, l) for l in s])
@@ -348,6 +357,10 @@ class CertificateAuthorityDetailMixin(object):
             '--crl-url', metavar='URL', action=MultipleURLAction, default=[],
             help='URL to a certificate revokation list. Can be given multiple times.'
         )
+        group.add_argument(
+            '--delta-crl-url', metavar='URL', action=MultipleURLAction,
+            help='URL to a delta certificate revokation list. Can be given multiple times.'
+        )
         group.add_argument(
             '--ocsp-url', metavar='URL', action=URLAction,
             help='URL of an OCSP responder.'
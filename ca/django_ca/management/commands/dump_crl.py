@@ -31,6 +31,10 @@ class Command(BaseCommand):
                             help='Path for the output file. Use "-" for stdout.')
         parser.add_argument('--ca-crl', action='store_true', default=False,
                             help="Generate the CRL for revoked child CAs.")
+        parser.add_argument('--delta', action='store_true', default=False,
+                            help="Generate a delta CRL with certificates revoked since the last base CRL.")
+        parser.add_argument('--shard', type=int, metavar='SHARD',
+                            help="Generate the CRL for only this shard of a partitioned CRL.")
         self.add_algorithm(parser)
         self.add_format(parser)
         self.add_ca(parser, allow_disabled=True)
@@ -44,6 +48,8 @@ class Command(BaseCommand):
             'algorithm': options['algorithm'],
             'password': options['password'],
             'ca_crl': options['ca_crl'],
+            'delta': options['delta'],
+            'shard': options['shard'],
         }
 
         try:
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import tempfile
+
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from ...models import Certificate
+from ...models import CertificateAuthority
+from ...ocsp import get_cert_id
+from ...ocsp import get_response_versions
+from ...ocsp import load_pem_certificate
+from ...ocsp import load_responder_key
+from ...ocsp import set_cached_responses
+from ...ocsp import sign_response
+from ..base import BaseCommand
+
+# Set in every worker process by _init_worker()
+_worker_config = {}
+
+
+def _init_worker(ca_pem, responder_key, responder_cert_pem, expires):
+    _worker_config.update({
+        'ca_pem': ca_pem,
+        'responder_key': responder_key,
+        'responder_cert_pem': responder_cert_pem,
+        'expires': expires,
+    })
+
+
+def _sign(args):
+    serial, status, revoked_date = args
+
+    # Key and certificates are only parsed once per worker process, see django_ca.ocsp.
+    ca_cert = load_pem_certificate(_worker_config['ca_pem'])
+    response = sign_response(
+        ca_cert, [(get_cert_id(ca_cert, serial), status, revoked_date)],
+        responder_key=load_responder_key(_worker_config['responder_key']),
+        responder_cert=load_pem_certificate(_worker_config['responder_cert_pem']),
+        expires=_worker_config['expires'])
+    return serial, response.dump()
+
+
+class Command(BaseCommand):
+    help = """Pre-generate signed OCSP responses for all certificates of a certificate authority that are
+not yet expired. Responses are stored in the cache (where they are used by OCSP views with
+"cache_responses" enabled and the same responder certificate, "expires" and "ca_ocsp" settings) or written
+to a directory."""
+
+    def add_arguments(self, parser):
+        self.add_ca(parser, allow_disabled=True)
+        parser.add_argument('--responder-key', metavar='PATH', required=True,
+                            help="Private key used for signing OCSP responses.")
+        parser.add_argument(
+            '--responder-cert', metavar='PATH|SERIAL', required=True,
+            help="Certificate of the OCSP responder, either a path or the serial of a certificate.")
+        parser.add_argument(
+            '-e', '--expires', type=int, default=600, metavar='SECONDS',
+            help="Seconds until the responses expire (default: %(default)s).")
+        parser.add_argument('--ca-ocsp', action='store_true', default=False,
+                            help="Generate responses for child CAs instead.")
+        self.add_processes(parser)
+        parser.add_argument(
+            'path', nargs='?',
+            help="Directory to write responses to, one file per serial (default: store in the cache).")
+
+    def get_responder_cert(self, value):
+        if os.path.exists(value):
+            with open(value, 'rb') as stream:
+                return stream.read()
+
+        try:
+            return Certificate.objects.get(serial=value).pub
+        except Certificate.DoesNotExist:
+            raise CommandError('%s: Responder certificate not found.' % value)
+
+    def handle(self, ca, responder_key, responder_cert, expires, ca_ocsp, processes, path, **options):
+        if processes < 1:
+            raise CommandError('--processes must be at least 1.')
+        if path is not None and not os.path.isdir(path):
+            raise CommandError('%s: Not a directory.' % path)
+        if not os.path.exists(responder_key):
+            raise CommandError('%s: Responder key not found.' % responder_key)
+
+        if ca_ocsp is True:
+            qs = CertificateAuthority.objects.filter(parent=ca)
+        else:
+            qs = Certificate.objects.filter(ca=ca)
+        start = timezone.now()
+        qs = qs.filter(expires__gt=start)
+
+        # Everything is read from the database before any worker process is started.
+        tasks = [(c.serial, c.ocsp_status, c.revoked_date) for c in qs]
+        responder_cert_pem = self.get_responder_cert(responder_cert)
+        initargs = (ca.pub, responder_key, responder_cert_pem, expires)
+
+        if processes == 1:
+            _init_worker(*initargs)
+            responses = [_sign(t) for t in tasks]
+        else:
+            pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs)
+            try:
+                responses = pool.map(_sign, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        responder_cert = load_pem_certificate(responder_cert_pem)
+        self.store(ca, responses, responder_cert, expires, ca_ocsp, path)
+
+        # Certificates revoked while signing would otherwise be stored with a stale "good" response. The
+        # check is done only after storing, so that any later revocation deletes the response again.
+        revoked = [(c.serial, c.ocsp_status, c.revoked_date)
+                   for c in qs.filter(revoked=True, revoked_date__gte=start)]
+        if revoked:
+            _init_worker(*initargs)
+            self.store(ca, [_sign(t) for t in revoked], responder_cert, expires, ca_ocsp, path)
+
+    def store(self, ca, responses, responder_cert, expires, ca_ocsp, path):
+        if path is None:
+            # Responses are only used by OCSP views with the same responder certificate, expires and ca_ocsp
+            versions = get_response_versions(ca.serial, [s for s, r in responses], expires)
+            set_cached_responses(ca.serial, [(s, versions[s], r) for s, r in responses], responder_cert,
+                                 expires, ca_ocsp)
+        else:
+            for serial, response in responses:
+                self.write_response(os.path.join(path, '%s.der' % serial.replace(':', '')), response)
+
+    def write_response(self, path, response):
+        # Responses are first written to a temporary file in the same directory and then renamed, so a web
+        # server never sees an incomplete response (see also django_ca.crl.write_crl()).
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.ocsp-')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                stream.write(response)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
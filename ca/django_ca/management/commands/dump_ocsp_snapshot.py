@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import CommandError
+
+from ...models import Certificate
+from ...models import CertificateAuthority
+from ...snapshot import write_snapshot
+from ..base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = """Write a binary snapshot of the revocation status of all certificates of a certificate
+authority. The file is replaced atomically, so it is safe to run this command while the snapshot is in use."""
+
+    def add_arguments(self, parser):
+        self.add_ca(parser, allow_disabled=True)
+        parser.add_argument('--ca-ocsp', action='store_true', default=False,
+                            help="Write a snapshot of child CAs instead.")
+        parser.add_argument('path', help="Where to write the snapshot.")
+
+    def handle(self, ca, ca_ocsp, path, **options):
+        if ca_ocsp is True:
+            qs = CertificateAuthority.objects.filter(parent=ca)
+        else:
+            qs = Certificate.objects.filter(ca=ca)
+
+        try:
+            write_snapshot(path, qs.values_list('serial', 'revoked', 'revoked_date', 'revoked_reason'))
+        except (IOError, OSError, ValueError) as e:
+            raise CommandError(e)
@@ -13,6 +13,9 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+
 from ..base import BaseCommand
 from ..base import CertificateAuthorityDetailMixin
 
@@ -23,6 +26,9 @@ class Command(BaseCommand, CertificateAuthorityDetailMixin):
     def add_arguments(self, parser):
         self.add_ca(parser, 'ca', allow_disabled=True)
         self.add_ca_args(parser)
+        parser.add_argument(
+            '--crl-shards', type=int, metavar='NUM',
+            help='Partition the CRL into NUM shards, use "{shard}" in the CRL URLs. 0 disables partitioning.')
 
         group = parser.add_mutually_exclusive_group()
         group.add_argument('--enable', action='store_true',
@@ -39,10 +45,18 @@ class Command(BaseCommand, CertificateAuthorityDetailMixin):
             ca.ocsp_url = options['ocsp_url']
         if options['crl_url'] is not None:
             ca.crl_url = '\n'.join(options['crl_url'])
+        if options['delta_crl_url'] is not None:
+            ca.delta_crl_url = '\n'.join(options['delta_crl_url'])
+        if options['crl_shards'] is not None:
+            ca.crl_shards = options['crl_shards']
 
         if options.get('enable') is True:
             ca.enabled = True
         if options.get('disable') is False:
             ca.enabled = False
 
+        try:
+            ca.clean()
+        except ValidationError as e:
+            raise CommandError(' '.join(e.messages))
         ca.save()
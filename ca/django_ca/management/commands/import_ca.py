@@ -65,9 +65,11 @@ Note that the private key will be copied to the directory configured by the CA_D
         pem_data = pem.read()
         key_data = key.read()
         crl_url = '\n'.join(options['crl_url'])
+        delta_crl_url = '\n'.join(options['delta_crl_url'] or [])
 
         ca = CertificateAuthority(name=name, parent=parent, issuer_url=options['issuer_url'],
-                                  issuer_alt_name=options['issuer_alt_name'], crl_url=crl_url)
+                                  issuer_alt_name=options['issuer_alt_name'], crl_url=crl_url,
+                                  delta_crl_url=delta_crl_url)
 
         # load public key
         try:
@@ -132,6 +132,7 @@ class Command(BaseCommand, CertificateAuthorityDetailMixin):
                 issuer_url=options['issuer_url'],
                 issuer_alt_name=options['issuer_alt_name'],
                 crl_url=options['crl_url'],
+                delta_crl_url=options['delta_crl_url'],
                 ocsp_url=options['ocsp_url'],
                 ca_issuer_url=options['ca_issuer_url'],
                 ca_crl_url=options['ca_crl_url'],
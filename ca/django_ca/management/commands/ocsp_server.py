@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import socket
+
+from django.core.management.base import CommandError
+from django.utils import six
+
+from ..base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = """Run a standalone OCSP responder (and optionally serve CRLs). The responder does not access the
+database, certificate status is read from an index file written by "manage.py dump_ocsp_index"."""
+
+    def add_arguments(self, parser):
+        self.add_ca(parser, allow_disabled=True)
+        parser.add_argument('--index', metavar='PATH', required=True,
+                            help='Index file written by "manage.py dump_ocsp_index" or a snapshot written by '
+                            '"manage.py dump_ocsp_snapshot".')
+        parser.add_argument('--responder-key', metavar='PATH', required=True,
+                            help="Private key used for signing OCSP responses.")
+        parser.add_argument('--responder-cert', metavar='PATH', required=True,
+                            help="Certificate of the OCSP responder.")
+        parser.add_argument(
+            '-e', '--expires', type=int, default=600, metavar='SECONDS',
+            help="Seconds until the responses expire (default: %(default)s).")
+        parser.add_argument('--crl-dir', metavar='PATH',
+                            help="Serve files in this directory (e.g. written by dump_crl) under /crl/.")
+        parser.add_argument('--prefix', default='/ocsp/',
+                            help="Path for OCSP requests (default: %(default)s).")
+        parser.add_argument('--bind', default='127.0.0.1', metavar='HOST',
+                            help="Address to listen on (default: %(default)s).")
+        parser.add_argument('--port', type=int, default=8888,
+                            help="Port to listen on (default: %(default)s).")
+        parser.add_argument('--reload-interval', type=int, default=60, metavar='SECONDS',
+                            help="Check the index file for changes this often (default: %(default)s).")
+        self.add_processes(parser)
+
+    def handle(self, ca, index, responder_key, responder_cert, expires, crl_dir, prefix, bind, port,
+               reload_interval, processes, **options):
+        if six.PY2:  # pragma: only py2
+            raise CommandError('This command requires Python 3.4 or later.')
+        from ...ocsp_server import OCSPResponder
+        from ...ocsp_server import serve
+
+        for path in [index, responder_key, responder_cert]:
+            if not os.path.exists(path):
+                raise CommandError('%s: File not found.' % path)
+        if crl_dir is not None and not os.path.isdir(crl_dir):
+            raise CommandError('%s: Not a directory.' % crl_dir)
+
+        # Everything is loaded before forking worker processes
+        responder = OCSPResponder(ca.pub, responder_key=responder_key, responder_cert=responder_cert,
+                                  index=index, expires=expires, crl_dir=crl_dir, prefix=prefix)
+
+        sock = socket.socket(socket.AF_INET6 if ':' in bind else socket.AF_INET)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((bind, port))
+        sock.listen(1024)
+        self.stdout.write('Listening on %s:%s with %s process(es)...' % (bind, port, processes))
+
+        if processes == 1:
+            serve(responder, sock, reload_interval=reload_interval)
+        else:  # pragma: no cover - would block tests
+            workers = [multiprocessing.Process(target=serve, args=(responder, sock, reload_interval))
+                       for i in range(processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
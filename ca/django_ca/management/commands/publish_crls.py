@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+from timeit import default_timer
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from django.core.management.base import CommandError
+from django.db import connections
+
+from ...crl import get_crl
+from ...crl import write_crl
+from ...models import CertificateAuthority
+from ..base import BaseCommand
+
+# Set in every worker process by _init_worker()
+_worker_config = {}
+
+
+def _init_worker(path, expires, algorithm, password):
+    _worker_config.update({
+        'path': path,
+        'expires': expires,
+        'algorithm': algorithm,
+        'password': password,
+    })
+
+
+def get_filename(serial, ca_crl=False, shard=None):
+    """Get the filename (without extension) used for a published CRL."""
+
+    filename = serial.replace(':', '')
+    if ca_crl is True:
+        filename += '_ca'
+    if shard is not None:
+        filename += '_shard%s' % shard
+    return filename
+
+
+def _publish(args):
+    pk, ca_crl, shard = args
+    start = default_timer()
+
+    try:
+        ca = CertificateAuthority.objects.get(pk=pk)
+        crl = get_crl(ca, encoding=Encoding.DER, expires=_worker_config['expires'],
+                      algorithm=_worker_config['algorithm'], password=_worker_config['password'],
+                      ca_crl=ca_crl, shard=shard)
+
+        # The PEM version is converted from the same CRL, so both files have the same CRL number
+        pem = x509.load_der_x509_crl(crl, default_backend()).public_bytes(Encoding.PEM)
+
+        filename = os.path.join(_worker_config['path'], get_filename(ca.serial, ca_crl=ca_crl, shard=shard))
+        write_crl('%s.crl' % filename, crl)
+        write_crl('%s.pem' % filename, pem)
+    except Exception as e:
+        return args, None, str(e)
+    return args, default_timer() - start, None
+
+
+class Command(BaseCommand):
+    help = """Write CRLs of all enabled certificate authorities to a directory (in DER and PEM format),
+e.g. for hosting them with a static webserver. For every CA, a CRL for certificates, one for child CAs
+and (if the CRL is partitioned) one for every shard is written."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-e', '--expires', type=int, default=86400, metavar='SECONDS',
+            help="Seconds until a new CRL will be available (default: %(default)s).")
+        self.add_algorithm(parser)
+        self.add_password(parser, help='Password used for accessing the private keys of the CAs.')
+        self.add_processes(parser)
+        parser.add_argument('path', help='Directory to write CRLs to.')
+
+    def handle(self, path, expires, algorithm, password, processes, **options):
+        if processes < 1:
+            raise CommandError('--processes must be at least 1.')
+        if not os.path.isdir(path):
+            raise CommandError('%s: Not a directory.' % path)
+
+        cas = {}
+        tasks = []
+        for ca in CertificateAuthority.objects.enabled().order_by('name'):
+            cas[ca.pk] = ca
+            tasks += [(ca.pk, False, None), (ca.pk, True, None)]
+            tasks += [(ca.pk, False, shard) for shard in ca.get_crl_shards()]
+
+        initargs = (path, expires, algorithm, password)
+        if processes == 1:
+            _init_worker(*initargs)
+            results = [_publish(t) for t in tasks]
+        else:
+            # Worker processes must not share the database connection of this process
+            for connection in connections.all():
+                connection.close()
+
+            pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs)
+            try:
+                results = pool.map(_publish, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        errors = 0
+        for (pk, ca_crl, shard), duration, error in results:
+            name = get_filename(cas[pk].serial, ca_crl=ca_crl, shard=shard)
+            if error is None:
+                self.stdout.write('%s (%s): %s.{crl,pem} written in %.3f seconds.' % (
+                    cas[pk].name, cas[pk].serial, name, duration))
+            else:
+                errors += 1
+                self.stderr.write('%s (%s): %s: %s' % (cas[pk].name, cas[pk].serial, name, error))
+
+        if errors:
+            raise CommandError('%s of %s CRLs could not be written.' % (errors, len(results)))
@@ -13,19 +13,75 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
 from collections import OrderedDict
+from timeit import default_timer
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import NameOID
 
 from django.core.management.base import CommandError
+from django.db import connections
+from django.db import transaction
 from django.utils import six
 from django.utils import timezone
+from django.utils.encoding import force_bytes
 
 from ... import ca_settings
 from ...management.base import BaseCommand
 from ...models import Certificate
+from ...models import CertificateAuthority
 from ...models import Watcher
 from ...utils import get_cert_profile_kwargs
+from ...utils import parse_name
 from ..base import ExpiresAction
 
+# File extensions of CSRs read in batch mode, the format of "*.csr" files is given by --csr-format
+CSR_EXTENSIONS = ('.csr', '.pem', '.der')
+CSR_FORMATS = {
+    '.pem': Encoding.PEM,
+    '.der': Encoding.DER,
+}
+
+# Set in every worker process by _init_worker()
+_worker_config = {}
+
+
+def _init_worker(ca, private_key=None):
+    _worker_config['ca'] = ca
+    _worker_config['private_key'] = private_key
+
+
+def _sign(args):
+    name, kwargs = args
+    ca = _worker_config['ca']
+
+    try:
+        if not kwargs['subject'].get('CN') and not kwargs['subjectAltName']:
+            # Use the CommonName from the CSR if the job does not name the certificate
+            if kwargs['csr_format'] == Encoding.DER:
+                req = x509.load_der_x509_csr(force_bytes(kwargs['csr']), default_backend())
+            else:
+                req = x509.load_pem_x509_csr(force_bytes(kwargs['csr']), default_backend())
+            cn = req.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+            if not cn:
+                raise ValueError('CSR does not contain a CommonName, pass a subject or subjectAltNames.')
+            kwargs['subject']['CN'] = cn[0].value
+
+        # The private key of the CA is loaded only once, see Command.handle_batch() and handle_serve()
+        if _worker_config['private_key'] is not None:
+            kwargs['private_key'] = _worker_config['private_key']
+        cert, req = Certificate.objects.sign_cert(ca, **kwargs)
+    except Exception as e:
+        return name, None, None, str(e)
+    return name, cert.public_bytes(Encoding.DER), req.public_bytes(Encoding.PEM).decode('utf-8'), None
+
 
 class Command(BaseCommand):
     help = """Sign a CSR and output signed certificate. The defaults depend on the configured
@@ -90,7 +146,16 @@ default profile, currently %s.""" % ca_settings.CA_DEFAULT_PROFILE
             help='Email EMAIL when this certificate expires (may be given multiple times)')
         parser.add_argument(
             '--out', metavar='FILE',
-            help='Save signed certificate to FILE. If omitted, print to stdout.')
+            help='Save signed certificate to FILE (a directory with --batch). If omitted, print to stdout.')
+        parser.add_argument(
+            '--batch', metavar='PATH',
+            help='Sign many CSRs at once. PATH is a directory or tar file containing CSRs or a file with one '
+            'JSON object per line (keys "csr", "name", "subject", "alt" and "profile", "-" for stdin).')
+        parser.add_argument(
+            '--serve', default=False, action='store_true',
+            help='Read signing requests (one JSON object per line) from stdin and write results (one JSON '
+            'object per line) to stdout until stdin is closed.')
+        self.add_processes(parser)
 
         group = parser.add_argument_group('X509 v3 certificate extensions')
         group.add_argument(
@@ -115,18 +180,22 @@ the default values, options like --key-usage still override the profile.""")
             return True, value[9:]
         return False, value
 
-    def handle(self, *args, **options):
-        ca = options['ca']
-        if ca.expires < options['expires']:
-            max_days = (ca.expires - timezone.now()).days
-            raise CommandError(
-                'Certificate would outlive CA, maximum expiry for this CA is %s days.' % max_days)
+    def get_sign_kwargs(self, options, job=None):
+        """Get keyword arguments for ``Certificate.objects.sign_cert()``.
 
-        # get list of watchers
-        watchers = [Watcher.from_addr(addr) for addr in options['watch']]
+        Values from the command line are overridden by ``job`` (a dict with the optional keys ``subject``,
+        ``alt`` and ``profile``), if given.
+        """
+        if job is None:
+            job = {}
 
         # get keyUsage and extendedKeyUsage flags based on profiles
-        kwargs = get_cert_profile_kwargs(options['profile'])
+        profile = job.get('profile') or options['profile']
+        if profile is not None and profile not in ca_settings.CA_PROFILES:
+            raise ValueError('%s: Unknown profile.' % profile)
+        kwargs = get_cert_profile_kwargs(profile)
+        kwargs['algorithm'] = options['algorithm']
+        kwargs['expires'] = options['expires']
         kwargs['password'] = options['password']
         kwargs['csr_format'] = options['csr_format']
         if options['cn_in_san'] is not None:
@@ -142,10 +211,248 @@ the default values, options like --key-usage still override the profile.""")
         kwargs.setdefault('subject', OrderedDict())
         if options.get('subject'):
             kwargs['subject'].update(options['subject'])  # update from command line
+        subject = job.get('subject')
+        if isinstance(subject, six.string_types):
+            subject = parse_name(subject)
+        if subject:
+            kwargs['subject'].update(subject)
 
         # filter empty values
         kwargs['subject'] = OrderedDict([(k, v) for k, v in kwargs['subject'].items() if v])
+        kwargs['subjectAltName'] = job.get('alt', options['alt'])
+        return kwargs
+
+    def validate_job(self, job):
+        """Validate a signing job loaded from JSON."""
+
+        if not isinstance(job, dict) or 'csr' not in job:
+            raise ValueError('Job must be a JSON object with at least a "csr" key.')
+
+    def validate_ca(self, ca):
+        """Validate that the CA (as currently stored in the database) may still sign certificates."""
+
+        state = CertificateAuthority.objects.filter(pk=ca.pk).values_list('enabled', 'revoked').first()
+        if state is None:
+            raise ValueError('%s: Certificate authority not found.' % ca.serial)
+        elif state[0] is False:
+            raise ValueError('%s: Certificate authority is disabled.' % ca.serial)
+        elif state[1] is True:
+            raise ValueError('%s: Certificate authority is revoked.' % ca.serial)
+
+    def get_certificate(self, ca, der, csr):
+        """Get an unsaved certificate for a certificate signed by :py:func:`_sign`."""
+
+        cert = Certificate(ca=ca, csr=csr)
+        cert.x509 = x509.load_der_x509_certificate(der, default_backend())
+        cert.crl_shard = ca.get_crl_shard(cert.x509.serial_number)
+        return cert
+
+    def read_batch(self, path, csr_format):
+        """Read signing jobs for batch mode.
+
+        Yields ``(name, job, error)`` tuples, where ``job`` is a dict with at least the keys ``csr`` and
+        ``csr_format``. The format of CSRs in a directory or tar file is given by the file extension,
+        ``csr_format`` is only used for ``*.csr`` files and for files with one JSON object per line.
+        """
+        if path != '-' and os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(CSR_EXTENSIONS):
+                    with open(os.path.join(path, filename), 'rb') as stream:
+                        yield os.path.splitext(filename)[0], {
+                            'csr': stream.read(),
+                            'csr_format': CSR_FORMATS.get(os.path.splitext(filename)[1], csr_format),
+                        }, None
+        elif path != '-' and tarfile.is_tarfile(path):
+            with tarfile.open(path) as tar:
+                for member in tar:
+                    if member.isfile() and member.name.endswith(CSR_EXTENSIONS):
+                        name, ext = os.path.splitext(os.path.basename(member.name))
+                        yield name, {
+                            'csr': tar.extractfile(member).read(),
+                            'csr_format': CSR_FORMATS.get(ext, csr_format),
+                        }, None
+        else:
+            stream = sys.stdin if path == '-' else open(path)
+            try:
+                for i, line in enumerate(stream, 1):
+                    if not line.strip():
+                        continue
+
+                    try:
+                        job = json.loads(line)
+                        self.validate_job(job)
+                    except ValueError as e:
+                        yield 'line %s' % i, None, str(e)
+                    else:
+                        job['csr_format'] = csr_format
+                        yield os.path.basename(six.text_type(job.get('name', i))), job, None
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    def handle_batch(self, ca, watchers, options):
+        out = options['out']
+        if out is None or not os.path.isdir(out):
+            raise CommandError('--out must name an existing directory in batch mode.')
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        if options['batch'] != '-' and not os.path.exists(options['batch']):
+            raise CommandError('%s: No such file or directory.' % options['batch'])
+
+        # Load the private key before starting any worker process, so it is only decrypted once (worker
+        # processes inherit it)
+        try:
+            private_key = ca.key(options['password'])
+        except Exception as e:
+            raise CommandError(e)
+
+        start = default_timer()
+        tasks = []
+        errors = []
+        names = set()
+        for name, job, error in self.read_batch(options['batch'], options['csr_format']):
+            # Certificates are written to <name>.pem, so existing files or other certificates are never
+            # overwritten
+            if error is None and name in names:
+                error = 'Duplicate name, another CSR is written to %s.pem.' % name
+            elif error is None and os.path.exists(os.path.join(out, '%s.pem' % name)):
+                error = '%s.pem: File exists.' % name
+
+            if error is None:
+                names.add(name)
+                try:
+                    kwargs = self.get_sign_kwargs(options, job)
+                    kwargs['csr'] = job['csr']
+                    kwargs['csr_format'] = job['csr_format']
+                    tasks.append((name, kwargs))
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                errors.append((name, error))
+
+        if options['processes'] == 1:
+            _init_worker(ca, private_key)
+            results = [_sign(t) for t in tasks]
+        else:
+            # Worker processes must not share the database connection of this process
+            for connection in connections.all():
+                connection.close()
+
+            pool = multiprocessing.Pool(options['processes'], initializer=_init_worker,
+                                        initargs=(ca, private_key))
+            try:
+                results = pool.map(_sign, tasks, chunksize=max(1, len(tasks) // (options['processes'] * 4)))
+            finally:
+                pool.close()
+                pool.join()
+
+        cert_names = []
+        certs = []
+        for name, der, csr, error in results:
+            if error is not None:
+                errors.append((name, error))
+                continue
+
+            cert_names.append(name)
+            certs.append(self.get_certificate(ca, der, csr))
+
+        # Certificates are only handed out once they are stored, as they could not be revoked otherwise
+        try:
+            with transaction.atomic():
+                Certificate.objects.bulk_save(certs, watchers=[watchers] * len(certs))
+        except Exception as e:
+            raise CommandError(e)
+
+        write_errors = []
+        for name, cert in zip(cert_names, certs):
+            try:
+                with open(os.path.join(out, '%s.pem' % name), 'w') as stream:
+                    stream.write(cert.pub)
+            except (IOError, OSError) as e:
+                write_errors.append((name, '%s.pem: %s' % (name, e)))
+        duration = default_timer() - start
+
+        for name, error in errors + write_errors:
+            self.stderr.write('%s: %s' % (name, error))
+        self.stdout.write('Signed %s certificates in %.2f seconds (%.1f certificates/second).' % (
+            len(certs), duration, len(certs) / duration if duration else 0))
+        if errors:
+            raise CommandError('%s of %s CSRs could not be signed.' % (len(errors), len(certs) + len(errors)))
+        if write_errors:
+            raise CommandError('%s of %s certificates could not be written.' % (
+                len(write_errors), len(certs)))
+
+    def handle_serve(self, ca, watchers, options):
+        # The certificate of the CA is loaded once. The private key is loaded for every request if it is
+        # cached per process (so CA_KEY_CACHE_TIMEOUT and changes to the file are honoured, see
+        # django_ca.keys), otherwise it is only loaded once.
+        try:
+            private_key = ca.key(options['password'])
+            ca.x509
+        except Exception as e:
+            raise CommandError(e)
+        _init_worker(ca, None if ca_settings.CA_KEY_CACHE is True else private_key)
+        watcher_cache = {}
+
+        # The process may run for a long time, so certificates expire relative to the time of the request
+        # and the state of the CA is checked for every request.
+        lifetime = options['expires'] - timezone.now()
+
+        # NOTE: Iterating over stdin reads ahead (and thus blocks) in Python 2, so readline() is used instead
+        for line in iter(sys.stdin.readline, ''):
+            if not line.strip():
+                continue
+
+            response = {'id': None}
+            try:
+                job = json.loads(line)
+                if isinstance(job, dict):
+                    response['id'] = job.get('id')
+                self.validate_job(job)
+                self.validate_ca(ca)
+
+                kwargs = self.get_sign_kwargs(options, job)
+                kwargs['csr'] = job['csr']
+                kwargs['expires'] = timezone.now() + lifetime
+                if ca.expires < kwargs['expires']:
+                    raise ValueError('Certificate would outlive CA, maximum expiry for this CA is %s days.' %
+                                     (ca.expires - timezone.now()).days)
+                _name, der, csr, error = _sign((response['id'], kwargs))
+                if error is not None:
+                    raise ValueError(error)
+
+                cert = self.get_certificate(ca, der, csr)
+                cert.save()
+
+                for addr in job.get('watch', []):
+                    if addr not in watcher_cache:
+                        watcher_cache[addr] = Watcher.from_addr(addr)
+                cert.watchers.add(*(watchers + [watcher_cache[addr] for addr in job.get('watch', [])]))
+                response.update({'serial': cert.serial, 'cert': cert.pub})
+            except Exception as e:
+                response['error'] = str(e)
+
+            self.stdout.write(json.dumps(response, sort_keys=True))
+            self.stdout.flush()
+
+    def handle(self, *args, **options):
+        ca = options['ca']
+        if ca.expires < options['expires']:
+            max_days = (ca.expires - timezone.now()).days
+            raise CommandError(
+                'Certificate would outlive CA, maximum expiry for this CA is %s days.' % max_days)
+
+        # get list of watchers
+        watchers = [Watcher.from_addr(addr) for addr in options['watch']]
+
+        if options['serve'] is True:
+            if options['batch'] is not None:
+                raise CommandError('--serve and --batch are mutually exclusive.')
+            return self.handle_serve(ca, watchers, options)
+        elif options['batch'] is not None:
+            return self.handle_batch(ca, watchers, options)
 
+        kwargs = self.get_sign_kwargs(options)
         if not kwargs['subject'].get('CN') and not options['alt']:
             raise CommandError(
                 "Must give at least a CN in --subject or one or more --alt arguments.")
@@ -162,9 +469,7 @@ the default values, options like --key-usage still override the profile.""")
                 csr = stream.read()
 
         try:
-            cert = Certificate.objects.init(
-                ca=ca, csr=csr, algorithm=options['algorithm'], expires=options['expires'],
-                subjectAltName=options['alt'], **kwargs)
+            cert = Certificate.objects.init(ca=ca, csr=csr, **kwargs)
         except Exception as e:
             raise CommandError(e)
 
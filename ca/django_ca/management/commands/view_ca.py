@@ -55,6 +55,7 @@ class Command(BaseCommand):
         self.stdout.write('')
         self.stdout.write('X509 v3 certificate extensions for signed certificates:')
         self.stdout.write('* Certificate Revokation List (CRL): %s' % (ca.crl_url or None))
+        self.stdout.write('* Delta CRL: %s' % (ca.delta_crl_url or None))
         self.stdout.write('* Issuer URL: %s' % (ca.issuer_url or None))
         self.stdout.write('* OCSP URL: %s' % (ca.ocsp_url or None))
         self.stdout.write('* Issuer Alternative Name: %s' % (ca.issuer_alt_name or None))
@@ -14,6 +14,7 @@
 # see <http://www.gnu.org/licenses/>.
 
 import os
+from collections import OrderedDict
 
 import idna
 
@@ -28,31 +29,51 @@ from cryptography.x509 import TLSFeature
 from cryptography.x509.oid import AuthorityInformationAccessOID
 from cryptography.x509.oid import ExtensionOID
 
+from django.core.cache import cache
 from django.db import models
+from django.db import transaction
 from django.utils import six
 from django.utils.encoding import force_bytes
 from django.utils.encoding import force_text
 
 from . import ca_settings
+from .ocsp import get_response_cache_key
+from .ocsp import get_unknown_cache_key
 from .utils import EXTENDED_KEY_USAGE_MAPPING
 from .utils import KEY_USAGE_MAPPING
 from .utils import TLS_FEATURE_MAPPING
 from .utils import get_cert_builder
+from .utils import get_cert_profile_kwargs
 from .utils import is_power2
 from .utils import parse_general_name
 from .utils import x509_name
 
+# Per-process cache of extensions derived from a CA, see CertificateManager.get_ca_extension_template()
+_ca_extension_templates = {}
+
+
+def invalidate_ca_extension_template(serial):
+    """Remove cached extension templates of the certificate authority with the given serial.
+
+    This is called automatically whenever a certificate authority is saved or deleted. Templates are also
+    cached by the values they are derived from, so changes made by other processes are noticed as well.
+    """
+    for key in [k for k in list(_ca_extension_templates) if k[0] == serial]:
+        _ca_extension_templates.pop(key, None)  # another thread might have removed it already
+
 
 class CertificateManagerMixin(object):
+    def get_distribution_points(self, urls):
+        urls = [x509.UniformResourceIdentifier(force_text(c)) for c in urls]
+        return [x509.DistributionPoint(full_name=[c], relative_name=None, crl_issuer=None, reasons=None)
+                for c in urls]
+
     def get_common_extensions(self, issuer_url=None, crl_url=None, ocsp_url=None):
         extensions = []
         if crl_url:
             if isinstance(crl_url, six.string_types):
                 crl_url = [url.strip() for url in crl_url.split()]
-            urls = [x509.UniformResourceIdentifier(force_text(c)) for c in crl_url]
-            dps = [x509.DistributionPoint(full_name=[c], relative_name=None, crl_issuer=None, reasons=None)
-                   for c in urls]
-            extensions.append((False, x509.CRLDistributionPoints(dps)))
+            extensions.append((False, x509.CRLDistributionPoints(self.get_distribution_points(crl_url))))
         auth_info_access = []
         if ocsp_url:
             uri = x509.UniformResourceIdentifier(force_text(ocsp_url))
@@ -69,7 +90,7 @@ class CertificateManagerMixin(object):
 
 class CertificateAuthorityManager(CertificateManagerMixin, models.Manager):
     def init(self, name, key_size, key_type, algorithm, expires, parent, subject, pathlen=None,
-             issuer_url=None, issuer_alt_name=None, crl_url=None, ocsp_url=None,
+             issuer_url=None, issuer_alt_name=None, crl_url=None, ocsp_url=None, delta_crl_url=None,
              ca_issuer_url=None, ca_crl_url=None, ca_ocsp_url=None, name_constraints=None,
              password=None, parent_password=None):
         """Create a new certificate authority.
@@ -164,9 +185,11 @@ class CertificateAuthorityManager(CertificateManagerMixin, models.Manager):
 
         if crl_url is not None:
             crl_url = '\n'.join(crl_url)
+        if delta_crl_url is not None:
+            delta_crl_url = '\n'.join(delta_crl_url)
 
         ca = self.model(name=name, issuer_url=issuer_url, issuer_alt_name=issuer_alt_name,
-                        ocsp_url=ocsp_url, crl_url=crl_url, parent=parent)
+                        ocsp_url=ocsp_url, crl_url=crl_url, delta_crl_url=delta_crl_url, parent=parent)
         ca.x509 = certificate
         ca.private_key_path = os.path.join(ca_settings.CA_DIR, '%s.key' % ca.serial)
         ca.save()
@@ -189,9 +212,69 @@ class CertificateAuthorityManager(CertificateManagerMixin, models.Manager):
 
 
 class CertificateManager(CertificateManagerMixin, models.Manager):
+    def get_ca_extensions(self, ca, shard=None):
+        """Get the extensions that are added to every certificate signed by the given CA.
+
+        Parameters
+        ----------
+
+        ca : :py:class:`~django_ca.models.CertificateAuthority`
+        shard : int, optional
+            The CRL shard of the certificate, see
+            :py:meth:`~django_ca.models.CertificateAuthority.get_crl_shard`.
+
+        Returns
+        -------
+
+        list
+            List of ``(critical, extension)`` tuples (authorityKeyIdentifier, cRLDistributionPoints,
+            freshestCRL, authorityInfoAccess and issuerAltName).
+        """
+        # Get authorityKeyIdentifier from subjectKeyIdentifier from signing CA
+        ca_subject_key_id = ca.x509.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_KEY_IDENTIFIER)
+        auth_key_id = x509.AuthorityKeyIdentifier(
+            key_identifier=ca_subject_key_id.value.digest, authority_cert_issuer=None,
+            authority_cert_serial_number=None)
+        extensions = [(False, auth_key_id)]
+
+        # If the CRL is partitioned, the certificate points to the CRL of its shard
+        crl_url = ca.get_crl_urls(shard=shard)
+        extensions += self.get_common_extensions(ca.issuer_url, crl_url, ca.ocsp_url)
+
+        # Delta CRLs always cover all certificates, so they can only be used with the full CRL
+        delta_crl_url = ca.get_delta_crl_urls()
+        if delta_crl_url and shard is None:
+            extensions.append((False, x509.FreshestCRL(self.get_distribution_points(delta_crl_url))))
+
+        if ca.issuer_alt_name:
+            extensions.append((False, x509.IssuerAlternativeName([parse_general_name(ca.issuer_alt_name)])))
+        return extensions
+
+    def get_ca_extension_template(self, ca):
+        """Get the extensions that are added to every certificate signed by the given CA for all CRL shards.
+
+        The template is computed only once per process and reused until any of the fields it is derived from
+        changes.
+
+        Returns
+        -------
+
+        tuple
+            A tuple of the return values of :py:meth:`get_ca_extensions` (as tuple) for every CRL shard,
+            indexed by shard. If the CRL is not partitioned, the tuple has exactly one element.
+        """
+        key = (ca.serial, ca.crl_url, ca.crl_shards, ca.delta_crl_url, ca.issuer_url, ca.ocsp_url,
+               ca.issuer_alt_name)
+        template = _ca_extension_templates.get(key)
+        if template is None:
+            shards = range(ca.crl_shards) if ca.crl_shards else [None]
+            template = tuple(tuple(self.get_ca_extensions(ca, shard=shard)) for shard in shards)
+            _ca_extension_templates[key] = template
+        return template
+
     def sign_cert(self, ca, csr, expires, algorithm, subject=None, cn_in_san=True, csr_format=Encoding.PEM,
                   subjectAltName=None, keyUsage=None, extendedKeyUsage=None, tls_features=None,
-                  password=None):
+                  password=None, private_key=None):
         """Create a signed certificate from a CSR.
 
         X509 extensions (`key_usage`, `ext_key_usage`) may either be None (in which case they are
@@ -236,6 +319,9 @@ class CertificateManager(CertificateManagerMixin, models.Manager):
         password : bytes, optional
             Password used to load the private key of the certificate authority. If not passed, the private key
             is assumed to be unencrypted.
+        private_key : optional
+            The already loaded private key of the certificate authority. If passed, ``password`` is ignored
+            and the key is not loaded again.
 
         Returns
         -------
@@ -273,7 +359,8 @@ class CertificateManager(CertificateManagerMixin, models.Manager):
 
         public_key = req.public_key()
 
-        builder = get_cert_builder(expires)
+        serial = x509.random_serial_number()
+        builder = get_cert_builder(expires, serial=serial)
         builder = builder.public_key(public_key)
         builder = builder.issuer_name(ca.x509.subject)
 
@@ -284,14 +371,9 @@ class CertificateManager(CertificateManagerMixin, models.Manager):
         builder = builder.add_extension(
             x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
 
-        # Get authorityKeyIdentifier from subjectKeyIdentifier from signing CA
-        ca_subject_key_id = ca.x509.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_KEY_IDENTIFIER)
-        auth_key_id = x509.AuthorityKeyIdentifier(
-            key_identifier=ca_subject_key_id.value.digest, authority_cert_issuer=None,
-            authority_cert_serial_number=None)
-        builder = builder.add_extension(auth_key_id, critical=False)
-
-        for critical, ext in self.get_common_extensions(ca.issuer_url, ca.crl_url, ca.ocsp_url):
+        # get_crl_shard() returns None if the CRL is not partitioned
+        shard = ca.get_crl_shard(serial) or 0
+        for critical, ext in self.get_ca_extension_template(ca)[shard]:
             builder = builder.add_extension(ext, critical=critical)
 
         if subjectAltName:
@@ -314,15 +396,118 @@ class CertificateManager(CertificateManagerMixin, models.Manager):
             features = [TLS_FEATURE_MAPPING[f] for f in features.split(',')]
             builder = builder.add_extension(TLSFeature(features), critical=critical)
 
-        if ca.issuer_alt_name:
-            builder = builder.add_extension(x509.IssuerAlternativeName(
-                [parse_general_name(ca.issuer_alt_name)]), critical=False)
-
-        return builder.sign(private_key=ca.key(password), algorithm=algorithm, backend=default_backend()), req
+        if private_key is None:
+            private_key = ca.key(password)
+        return builder.sign(private_key=private_key, algorithm=algorithm, backend=default_backend()), req
 
     def init(self, ca, csr, *args, **kwargs):
         c = self.model(ca=ca)
         c.x509, csr = self.sign_cert(ca, csr, *args, **kwargs)
+        c.crl_shard = ca.get_crl_shard(c.x509.serial_number)
         c.csr = csr.public_bytes(Encoding.PEM).decode('utf-8')
         c.save()
         return c
+
+    def bulk_init(self, ca, requests, expires, algorithm, password=None):
+        """Sign many CSRs and save all certificates at once.
+
+        The private key of the CA and the extensions derived from the CA are only loaded/computed once and
+        all certificates are saved with a single query.
+
+        Parameters
+        ----------
+
+        ca : :py:class:`~django_ca.models.CertificateAuthority`
+            The certificate authority to sign the certificates with.
+        requests : list of dict
+            Keyword arguments for :py:meth:`sign_cert` for every certificate (at least ``csr``). A ``profile``
+            key adds the values of the named profile (see
+            :py:func:`~django_ca.utils.get_cert_profile_kwargs`) as defaults, a ``subject`` is merged into
+            the subject of the profile. A ``watchers`` key may contain a list of
+            :py:class:`~django_ca.models.Watcher` instances.
+        expires, algorithm, password
+            Passed to :py:meth:`sign_cert`, unless given in ``requests``.
+
+        Returns
+        -------
+
+        list of :py:class:`~django_ca.models.Certificate`
+            The saved certificates, in the same order as ``requests``.
+        """
+        certs = []
+        watchers = []
+
+        # Load the key only once, even if the per-process key cache is disabled (CA_KEY_CACHE=False)
+        private_key = ca.key(password)
+
+        for kwargs in requests:
+            kwargs = dict(kwargs)
+            watchers.append(kwargs.pop('watchers', []))
+            profile = kwargs.pop('profile', None)
+            if profile is not None:
+                profile_kwargs = get_cert_profile_kwargs(profile)
+
+                # The subject is merged into the subject of the profile (like ``manage.py sign_cert`` does),
+                # empty values remove a field from the subject.
+                subject = profile_kwargs['subject']
+                subject.update(kwargs.pop('subject', None) or {})
+                profile_kwargs['subject'] = OrderedDict([(k, v) for k, v in subject.items() if v])
+
+                profile_kwargs.update(kwargs)
+                kwargs = profile_kwargs
+
+            kwargs.setdefault('expires', expires)
+            kwargs.setdefault('algorithm', algorithm)
+            if 'password' not in kwargs:
+                kwargs['private_key'] = private_key
+
+            c = self.model(ca=ca)
+            c.x509, csr = self.sign_cert(ca, **kwargs)
+            c.crl_shard = ca.get_crl_shard(c.x509.serial_number)
+            c.csr = csr.public_bytes(Encoding.PEM).decode('utf-8')
+            certs.append(c)
+
+        return self.bulk_save(certs, watchers=watchers)
+
+    def bulk_save(self, certs, watchers=None):
+        """Save many (new) certificates with a single query.
+
+        Parameters
+        ----------
+
+        certs : list of :py:class:`~django_ca.models.Certificate`
+            The certificates to save.
+        watchers : list, optional
+            A list of :py:class:`~django_ca.models.Watcher` instances for every certificate.
+
+        Returns
+        -------
+
+        list of :py:class:`~django_ca.models.Certificate`
+            The saved certificates with their primary keys.
+        """
+        if watchers is None:
+            watchers = [[] for c in certs]
+
+        serials = [c.serial for c in certs]
+        with transaction.atomic():
+            self.bulk_create(certs)
+
+            # Most databases do not return primary keys from bulk inserts. Serials are fetched in batches,
+            # as some databases limit the number of query parameters.
+            pks = {}
+            for i in range(0, len(serials), 500):
+                pks.update(self.filter(serial__in=serials[i:i + 500]).values_list('serial', 'pk'))
+            for c in certs:
+                c.pk = pks[c.serial]
+                c._state.adding = False
+
+            through = self.model.watchers.through
+            through.objects.bulk_create([through(certificate_id=c.pk, watcher_id=w.pk)
+                                         for c, cert_watchers in zip(certs, watchers) for w in cert_watchers])
+
+        # Serials might have been requested via OCSP before, see Certificate.save()
+        keys = [get_response_cache_key(c.ca.serial, c.serial) for c in certs]
+        keys += [get_unknown_cache_key(c.ca.serial, c.serial) for c in certs]
+        cache.delete_many(keys)
+        return certs
@@ -0,0 +1,48 @@
+# Generated by Django 2.0 on 2018-01-20 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ca', '0008_auto_20171203_2001'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertificateRevocationList',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ca_crl', models.BooleanField(default=False, help_text='If this CRL contains child CAs.')),
+                ('number', models.PositiveIntegerField(verbose_name='CRL number')),
+                ('last_update', models.DateTimeField()),
+                ('next_update', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Certificate Revocation List',
+                'verbose_name_plural': 'Certificate Revocation Lists',
+            },
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='crl_shard',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, help_text='The partition of the CRL containing this certificate if it is revoked.', null=True, verbose_name='CRL shard'),
+        ),
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='crl_number',
+            field=models.PositiveIntegerField(default=0, help_text='Number of the last CRL issued by this CA.', verbose_name='CRL number'),
+        ),
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='crl_shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Partition the CRL into this many shards, use "{shard}" in the CRL URLs. 0 disables partitioning.', verbose_name='CRL shards'),
+        ),
+        migrations.AddField(
+            model_name='certificaterevocationlist',
+            name='ca',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crls', to='django_ca.CertificateAuthority', verbose_name='Certificate Authority'),
+        ),
+    ]
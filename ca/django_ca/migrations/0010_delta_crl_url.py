@@ -0,0 +1,19 @@
+# Generated by Django 2.0 on 2018-01-20 12:05
+
+from django.db import migrations, models
+import django_ca.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ca', '0009_crl_number_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificateauthority',
+            name='delta_crl_url',
+            field=models.TextField(blank=True, help_text='URLs, one per line, where you can retrieve the delta CRL.', null=True, validators=[django_ca.utils.multiline_url_validator], verbose_name='Delta CRL URLs'),
+        ),
+    ]
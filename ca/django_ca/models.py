@@ -26,20 +26,28 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import Encoding
 from cryptography.hazmat.primitives.serialization import PublicFormat
-from cryptography.hazmat.primitives.serialization import load_pem_private_key
 from cryptography.x509 import TLSFeatureType
 from cryptography.x509.oid import AuthorityInformationAccessOID
 from cryptography.x509.oid import ExtensionOID
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.encoding import force_str
 from django.utils.translation import ugettext_lazy as _
 
+from .keys import load_private_key
 from .managers import CertificateAuthorityManager
 from .managers import CertificateManager
+from .managers import invalidate_ca_extension_template
+from .ocsp import get_response_cache_key
+from .ocsp import get_unknown_cache_key
+from .ocsp import invalidate_issuer_index
 from .querysets import CertificateAuthorityQuerySet
 from .querysets import CertificateQuerySet
 from .utils import EXTENDED_KEY_USAGE_REVERSED
@@ -49,6 +57,7 @@ from .utils import add_colons
 from .utils import format_general_name
 from .utils import format_general_names
 from .utils import format_name
+from .utils import get_revoked_certificate
 from .utils import int_to_hex
 from .utils import multiline_url_validator
 
@@ -171,8 +180,14 @@ class X509CertMixin(models.Model):
         return ext.critical, [format_general_name(name) for name in ext.value]
 
     def crlDistributionPoints(self):
+        return self._distribution_points(ExtensionOID.CRL_DISTRIBUTION_POINTS)
+
+    def freshestCRL(self):
+        return self._distribution_points(ExtensionOID.FRESHEST_CRL)
+
+    def _distribution_points(self, oid):
         try:
-            ext = self.x509.extensions.get_extension_for_oid(ExtensionOID.CRL_DISTRIBUTION_POINTS)
+            ext = self.x509.extensions.get_extension_for_oid(oid)
         except x509.ExtensionNotFound:
             return None
 
@@ -312,14 +327,7 @@ class X509CertMixin(models.Model):
         if self.revoked is False:
             raise ValueError('Certificate is not revoked.')
 
-        revoked_cert = x509.RevokedCertificateBuilder().serial_number(self.x509.serial).revocation_date(
-            self.revoked_date)
-
-        if self.revoked_reason:
-            reason_flag = getattr(x509.ReasonFlags, self.revoked_reason)
-            revoked_cert = revoked_cert.add_extension(x509.CRLReason(reason_flag), critical=False)
-
-        return revoked_cert.build(default_backend())
+        return get_revoked_certificate(self.serial, self.revoked_date, self.revoked_reason)
 
     @property
     def ocsp_status(self):
@@ -353,14 +361,39 @@ class CertificateAuthority(X509CertMixin):
                                help_text=_("URL of a OCSP responser for the CA."))
     issuer_alt_name = models.URLField(blank=True, null=True, verbose_name=_('issuerAltName'),
                                       help_text=_("URL for your CA."))
-
-    _key = None
+    delta_crl_url = models.TextField(
+        blank=True, null=True, validators=[multiline_url_validator], verbose_name=_('Delta CRL URLs'),
+        help_text=_("URLs, one per line, where you can retrieve the delta CRL."))
+    crl_number = models.PositiveIntegerField(default=0, verbose_name=_('CRL number'),
+                                             help_text=_("Number of the last CRL issued by this CA."))
+    crl_shards = models.PositiveSmallIntegerField(
+        default=0, verbose_name=_('CRL shards'),
+        help_text=_("Partition the CRL into this many shards, use \"{shard}\" in the CRL URLs. 0 disables "
+                    "partitioning."))
+
+    def clean(self):
+        # Not every database enforces the range of PositiveSmallIntegerField (e.g. SQLite)
+        if not 0 <= self.crl_shards <= 32767:
+            raise ValidationError({
+                'crl_shards': _('The number of CRL shards must be between 0 and 32767.'),
+            })
+        if not self.crl_shards and self.crl_url and '{shard}' in self.crl_url:
+            raise ValidationError({
+                'crl_url': _('"{shard}" can only be used in CRL URLs if the CRL is partitioned.'),
+            })
+        if self.crl_shards > 1 and any('{shard}' not in url for url in self.get_crl_urls()):
+            # Otherwise every shard would advertise the same distribution point
+            raise ValidationError({
+                'crl_url': _('All CRL URLs must contain "{shard}" if the CRL is partitioned.'),
+            })
 
     def key(self, password):
-        if self._key is None:
-            with open(self.private_key_path, 'rb') as f:
-                self._key = load_pem_private_key(f.read(), password, default_backend())
-        return self._key
+        """Get the private key of this CA.
+
+        The decrypted key is cached per process (not per instance), see
+        :py:func:`~django_ca.keys.load_private_key`.
+        """
+        return load_private_key(self.serial, self.private_key_path, password)
 
     @property
     def pathlen(self):
@@ -409,6 +442,73 @@ class CertificateAuthority(X509CertMixin):
 
         return ext.critical, value
 
+    def get_crl_shard(self, serial):
+        """Get the CRL shard for a certificate with the given serial (as int).
+
+        Returns ``None`` if the CRL is not partitioned.
+        """
+        if self.crl_shards:
+            return serial % self.crl_shards
+
+    def get_crl_shards(self):
+        """Get the list of CRL shards of this CA.
+
+        Certificates keep the shard they were assigned when they were issued, so shards of existing
+        certificates are included even if :py:attr:`crl_shards` was reduced later.
+        """
+        used = self.certificate_set.filter(crl_shard__isnull=False).values_list('crl_shard', flat=True)
+        return sorted(set(range(self.crl_shards)) | set(used.distinct()))
+
+    def get_crl_urls(self, shard=None):
+        """Get the list of CRL URLs, with ``{shard}`` replaced by the given shard."""
+
+        urls = self.crl_url.split() if self.crl_url else []
+        if shard is not None:
+            urls = [url.replace('{shard}', str(shard)) for url in urls]
+        return urls
+
+    def get_delta_crl_urls(self):
+        """Get the list of delta CRL URLs, added as Freshest CRL extension to base CRLs and certificates."""
+
+        return self.delta_crl_url.split() if self.delta_crl_url else []
+
+    def get_next_crl_number(self):
+        """Get the number for the next CRL (base or delta CRL) issued by this CA.
+
+        The number is incremented in the database, so it is unique even if CRLs are generated concurrently.
+        """
+        qs = CertificateAuthority.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            qs.update(crl_number=F('crl_number') + 1)
+            self.crl_number = qs.values_list('crl_number', flat=True).get()
+        return self.crl_number
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(CertificateAuthority, self).save(*args, **kwargs)
+        invalidate_issuer_index()  # CAs are looked up by their name/key hashes in OCSP requests
+        invalidate_ca_extension_template(self.serial)
+
+        if adding is True and self.parent_id is not None:
+            # the serial might have been requested via OCSP before
+            cache.delete_many([get_response_cache_key(self.parent.serial, self.serial),
+                               get_unknown_cache_key(self.parent.serial, self.serial, ca_ocsp=True)])
+
+    def delete(self, *args, **kwargs):
+        super(CertificateAuthority, self).delete(*args, **kwargs)
+        invalidate_issuer_index()
+        invalidate_ca_extension_template(self.serial)
+
+    def revoke(self, reason=None):
+        super(CertificateAuthority, self).revoke(reason=reason)
+
+        if self.parent_id is not None:
+            from .crl import invalidate_crl_cache  # avoid circular import, crl uses this module
+
+            # invalidate any pre-signed OCSP response and cached CRLs of the parent CA
+            cache.delete(get_response_cache_key(self.parent.serial, self.serial))
+            invalidate_crl_cache(self.parent.serial)
+
     class Meta:
         verbose_name = _('Certificate Authority')
         verbose_name_plural = _('Certificate Authorities')
@@ -426,6 +526,46 @@ class Certificate(X509CertMixin):
     ca = models.ForeignKey(CertificateAuthority, on_delete=models.CASCADE,
                            verbose_name=_('Certificate Authority'))
     csr = models.TextField(verbose_name=_('CSR'), blank=True)
+    crl_shard = models.PositiveSmallIntegerField(
+        null=True, blank=True, db_index=True, verbose_name=_('CRL shard'),
+        help_text=_('The partition of the CRL containing this certificate if it is revoked.'))
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(Certificate, self).save(*args, **kwargs)
+
+        if adding is True:
+            # the serial might have been requested via OCSP before
+            cache.delete_many([get_response_cache_key(self.ca.serial, self.serial),
+                               get_unknown_cache_key(self.ca.serial, self.serial)])
+
+    def revoke(self, reason=None):
+        from .crl import invalidate_crl_cache  # avoid circular import, crl uses this module
+
+        super(Certificate, self).revoke(reason=reason)
+
+        # invalidate any pre-signed OCSP response and cached CRLs. CRLs are rebuilt lazily by the next
+        # request, as only the views know how to generate them.
+        cache.delete(get_response_cache_key(self.ca.serial, self.serial))
+        invalidate_crl_cache(self.ca.serial)
 
     def __str__(self):
         return self.cn
+
+
+class CertificateRevocationList(models.Model):
+    """A base CRL issued by a certificate authority, required for generating delta CRLs."""
+
+    ca = models.ForeignKey(CertificateAuthority, on_delete=models.CASCADE, related_name='crls',
+                           verbose_name=_('Certificate Authority'))
+    ca_crl = models.BooleanField(default=False, help_text=_('If this CRL contains child CAs.'))
+    number = models.PositiveIntegerField(verbose_name=_('CRL number'))
+    last_update = models.DateTimeField()
+    next_update = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _('Certificate Revocation List')
+        verbose_name_plural = _('Certificate Revocation Lists')
+
+    def __str__(self):
+        return '%s #%s' % (self.ca, self.number)
@@ -13,11 +13,520 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import binascii
+import logging
+import os
+import time
+import uuid
 from datetime import datetime
+from datetime import timedelta
+
+from asn1crypto import core
+from asn1crypto import ocsp
+from asn1crypto import x509
+from asn1crypto.util import timezone
+from oscrypto import asymmetric
+from oscrypto.asymmetric import load_certificate
+from oscrypto.asymmetric import load_private_key
+
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
+
+from . import ca_settings
+from .utils import int_to_hex
 
 # We need a two-letter year, otherwise OCSP doesn't work
 date_format = '%y%m%d%H%M%SZ'
 
+# Per-process cache for responder keys and certificates, see load_responder_key() & co.
+_responder_cache = {}
+
+# Per-process index of issuer name/key hashes of all enabled CAs, see get_issuer().
+_issuer_index = {}
+ISSUER_INDEX_VERSION_CACHE_KEY = 'ocsp_issuer_index_version'
+
+log = logging.getLogger(__name__)
+
+
+def parse_request(data):
+    """Parse an OCSP request.
+
+    Parameters
+    ----------
+
+    data : bytes
+        The DER-encoded OCSP request.
+
+    Returns
+    -------
+
+    req_certs : list
+        The :py:class:`asn1crypto.ocsp.CertId` of every certificate in the request.
+    serials : list
+        The serials (as stored in the database) of all requested certificates.
+    nonce : bytes
+        The nonce of the request or ``None`` if the request does not include a nonce.
+
+    Raises
+    ------
+
+    ValueError
+        If the request cannot be parsed, does not request any certificate or contains an unknown critical
+        extension.
+    """
+    ocsp_request = ocsp.OCSPRequest.load(data)
+
+    tbs_request = ocsp_request['tbs_request']
+    req_certs = [r['req_cert'] for r in tbs_request['request_list']]
+    if not req_certs:
+        raise ValueError('Received OCSP request without any sub requests.')
+    serials = [int_to_hex(c['serial_number'].native) for c in req_certs]
+
+    nonce = None
+    for extension in tbs_request['request_extensions']:
+        extn_id = extension['extn_id'].native
+
+        if extn_id == 'nonce':
+            nonce = extension['extn_value'].parsed.native
+
+        # If an unknown critical extension is encountered (which should not
+        # usually happen, according to RFC 6960 4.1.2), we should throw our
+        # hands up in despair and run.
+        elif extension['critical'].native is True:  # pragma: no cover
+            raise ValueError('Could not parse unknown critical extension: %r' % dict(extension.native))
+
+        # If it's an unknown non-critical extension, we can safely ignore it.
+        else:  # pragma: no cover
+            log.info('Ignored unknown non-critical extension: %r', dict(extension.native))
+
+    return req_certs, serials, nonce
+
+
+def get_cert_id(ca_cert, serial, algorithm='sha1'):
+    """Get the CertID identifying a certificate in OCSP requests and responses.
+
+    Parameters
+    ----------
+
+    ca_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The certificate of the certificate authority that issued the certificate.
+    serial : str
+        The serial of the certificate, as stored in the database.
+    algorithm : str, optional
+        The algorithm used for hashing name and public key of the issuer, either ``"sha1"`` (the
+        default) or ``"sha256"``.
+    """
+    return ocsp.CertId({
+        'hash_algorithm': {'algorithm': algorithm},
+        'issuer_name_hash': getattr(ca_cert.asn1.subject, algorithm),
+        'issuer_key_hash': getattr(ca_cert.asn1.public_key, algorithm),
+        'serial_number': int(serial.replace(':', ''), 16),
+    })
+
+
+def get_issuer_hashes(ca_cert):
+    """Get the set of ``(algorithm, name hash, key hash)`` tuples identifying a CA in a CertID.
+
+    Both SHA1 and SHA256 hashes are included, compare them with :py:func:`get_cert_id_hashes`.
+    """
+    subject, public_key = ca_cert.asn1.subject, ca_cert.asn1.public_key
+    return set((algo, getattr(subject, algo), getattr(public_key, algo)) for algo in ['sha1', 'sha256'])
+
+
+def get_cert_id_hashes(cert_id):
+    """Get the ``(algorithm, name hash, key hash)`` tuple identifying the issuer in a CertID."""
+
+    return (cert_id['hash_algorithm']['algorithm'].native, cert_id['issuer_name_hash'].native,
+            cert_id['issuer_key_hash'].native)
+
+
+def sign_response(ca_cert, responses, responder_key, responder_cert, expires, nonce=None):
+    """Build a signed OCSP response for one or more certificates.
+
+    All certificates must be issued by the same certificate authority and the response is signed only
+    once, no matter how many certificates it contains.
+
+    Parameters
+    ----------
+
+    ca_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The certificate of the certificate authority that issued the certificates.
+    responses : list
+        A list of ``(cert_id, status, revocation_date)`` tuples. ``cert_id`` is the
+        :py:class:`asn1crypto.ocsp.CertId` from the request (see also :py:func:`get_cert_id`),
+        ``status`` is the OCSP status of the certificate (see
+        :py:attr:`~django_ca.models.X509CertMixin.ocsp_status`) and ``revocation_date`` is ``None``
+        if the certificate is not revoked.
+    responder_key : :py:class:`oscrypto.asymmetric.PrivateKey`
+        The private key used for signing the response.
+    responder_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The certificate of the OCSP responder.
+    expires : int
+        Time in seconds that the response remains valid.
+    nonce : bytes, optional
+        The nonce to include in the response.
+
+    Returns
+    -------
+
+    :py:class:`asn1crypto.ocsp.OCSPResponse`
+    """
+    # Modelled after OCSPResponseBuilder.build(), which only supports a single certificate.
+    produced_at = datetime.now(timezone.utc)
+    next_update = produced_at + timedelta(seconds=expires)
+    issuer_ext = {
+        'extn_id': 'certificate_issuer',
+        'critical': False,
+        'extn_value': [x509.GeneralName(name='directory_name', value=ca_cert.asn1.subject)],
+    }
+
+    single_responses = []
+    for cert_id, status, revocation_date in responses:
+        status = force_text(status)
+        if status in ('good', 'unknown'):
+            cert_status = ocsp.CertStatus(name=status, value=core.Null())
+        else:
+            cert_status = ocsp.CertStatus(name='revoked', value={
+                'revocation_time': revocation_date,
+                'revocation_reason': status if status != 'revoked' else 'unspecified',
+            })
+
+        single_responses.append({
+            'cert_id': cert_id,
+            'cert_status': cert_status,
+            'this_update': produced_at,
+            'next_update': next_update,
+            'single_extensions': [issuer_ext],
+        })
+
+    response_extensions = None
+    if nonce is not None:
+        response_extensions = [{'extn_id': 'nonce', 'critical': False, 'extn_value': nonce}]
+
+    response_data = ocsp.ResponseData({
+        'responder_id': ocsp.ResponderId(name='by_key', value=responder_cert.asn1.public_key.sha1),
+        'produced_at': produced_at,
+        'responses': single_responses,
+        'response_extensions': response_extensions,
+    })
+
+    if responder_key.algorithm == 'rsa':
+        sign_func = asymmetric.rsa_pkcs1v15_sign
+        signature_algo = 'rsa'
+    elif responder_key.algorithm == 'dsa':
+        sign_func = asymmetric.dsa_sign
+        signature_algo = 'dsa'
+    else:  # ec
+        sign_func = asymmetric.ecdsa_sign
+        signature_algo = 'ecdsa'
+    signature = sign_func(responder_key, response_data.dump(), 'sha256')
+
+    return ocsp.OCSPResponse({
+        'response_status': 'successful',
+        'response_bytes': {
+            'response_type': 'basic_ocsp_response',
+            'response': {
+                'tbs_response_data': response_data,
+                'signature_algorithm': {'algorithm': 'sha256_%s' % signature_algo},
+                'signature': signature,
+                'certs': [responder_cert.asn1],
+            },
+        },
+    })
+
+
+def is_cacheable_response(response):
+    """Return ``True`` if the given OCSP response may be cached by shared caches (e.g. proxies).
+
+    Only successful responses that do not contain a nonce are cacheable, a response with a nonce is only
+    valid for the client that sent the request.
+
+    Parameters
+    ----------
+
+    response : :py:class:`asn1crypto.ocsp.OCSPResponse`
+    """
+    if response['response_status'].native != 'successful':
+        return False
+
+    response_data = response['response_bytes']['response'].parsed['tbs_response_data']
+    extensions = response_data['response_extensions'].native or []
+    return not any(e['extn_id'] == 'nonce' for e in extensions)
+
+
+def get_response_cache_key(ca_serial, serial):
+    """Get the cache key that holds the version of all cached OCSP responses for a certificate.
+
+    Cached responses (see :py:func:`get_cached_response`) are only valid as long as this key holds the
+    version they were stored with, so deleting this key invalidates all cached responses for the
+    certificate, regardless of the responder that signed them.
+
+    Parameters
+    ----------
+
+    ca_serial : str
+        Serial of the certificate authority that issued the certificate.
+    serial : str
+        Serial of the certificate the response is for.
+    """
+    return 'ocsp_%s_%s' % (ca_serial, serial)
+
+
+def get_signed_response_cache_key(ca_serial, serial, responder_cert, expires, ca_ocsp=False):
+    """Get the cache key for a pre-signed OCSP response.
+
+    Responders with a different responder certificate, lifetime of responses or ``ca_ocsp`` flag use
+    different cache keys, so they never return responses signed by another responder.
+
+    Parameters
+    ----------
+
+    ca_serial : str
+        Serial of the certificate authority that issued the certificate.
+    serial : str
+        Serial of the certificate the response is for.
+    responder_cert : :py:class:`oscrypto.asymmetric.Certificate`
+        The certificate of the responder.
+    expires : int
+        Seconds until the response expires.
+    ca_ocsp : bool, optional
+        If ``True``, the response is for a child CA instead of a certificate.
+    """
+    fingerprint = binascii.hexlify(responder_cert.asn1.sha1).decode('utf-8')
+    return 'ocsp_%s_%s_%s_%s_%s' % (ca_serial, serial, fingerprint, expires, 'ca' if ca_ocsp else 'cert')
+
+
+def get_cached_response(ca_serial, serial, responder_cert, expires, ca_ocsp=False):
+    """Get a pre-signed OCSP response from the cache.
+
+    Returns a tuple of the DER-encoded response (or ``None`` if no valid response is cached) and the
+    version that must be passed to :py:func:`set_cached_responses` when storing a new response. Call this
+    function before reading the status of the certificate: If the certificate is revoked in the meantime,
+    the version is invalidated and the stale response will not be used.
+
+    Parameters are the same as for :py:func:`get_signed_response_cache_key`.
+    """
+    version_key = get_response_cache_key(ca_serial, serial)
+    cache_key = get_signed_response_cache_key(ca_serial, serial, responder_cert, expires, ca_ocsp)
+    cached = cache.get_many([version_key, cache_key])
+
+    version = cached.get(version_key)
+    if version is not None and cached.get(cache_key, (None, ))[0] == version:
+        return cached[cache_key][1], version
+
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, int(expires / 2))
+        version = cache.get(version_key)
+    return None, version
+
+
+def get_response_versions(ca_serial, serials, expires):
+    """Get the versions for storing pre-signed OCSP responses for many certificates.
+
+    This is the same as calling :py:func:`get_cached_response` for every serial, but only needs two cache
+    operations. Returns a dict mapping serials to versions.
+    """
+    keys = {get_response_cache_key(ca_serial, serial): serial for serial in serials}
+    versions = {keys[k]: v for k, v in cache.get_many(list(keys)).items()}
+
+    missing = {k: uuid.uuid4().hex for k, serial in keys.items() if serial not in versions}
+    cache.set_many(missing, int(expires / 2))
+    versions.update({keys[k]: v for k, v in missing.items()})
+    return versions
+
+
+def set_cached_responses(ca_serial, responses, responder_cert, expires, ca_ocsp=False, timeout=None):
+    """Store pre-signed OCSP responses in the cache.
+
+    Parameters
+    ----------
+
+    ca_serial : str
+        Serial of the certificate authority that issued the certificates.
+    responses : list
+        A list of ``(serial, version, response)`` tuples, where ``version`` was returned by
+        :py:func:`get_cached_response` and ``response`` is the DER-encoded response. Responses with a
+        version of ``None`` are not cached.
+    responder_cert, expires, ca_ocsp
+        See :py:func:`get_signed_response_cache_key`.
+    timeout : int, optional
+        Seconds that responses are cached, the default is half of ``expires``.
+    """
+    if timeout is None:
+        timeout = int(expires / 2)
+
+    values = {}
+    for serial, version, response in responses:
+        if version is not None:
+            key = get_signed_response_cache_key(ca_serial, serial, responder_cert, expires, ca_ocsp)
+            values[key] = (version, response)
+    cache.set_many(values, timeout)
+
+
+def get_unknown_cache_key(ca_serial, serial, ca_ocsp=False):
+    """Get the cache key used to remember that a serial is not known to a certificate authority.
+
+    Parameters
+    ----------
+
+    ca_serial : str
+        Serial of the certificate authority.
+    serial : str
+        The requested serial.
+    ca_ocsp : bool, optional
+        If ``True``, the serial is not known as a child CA instead of a certificate.
+    """
+    if ca_ocsp is True:
+        return 'ocsp_unknown_ca_%s_%s' % (ca_serial, serial)
+    return 'ocsp_unknown_%s_%s' % (ca_serial, serial)
+
+
+def clear_responder_cache():
+    """Clear the per-process cache of OCSP responder keys and certificates.
+
+    Cached files are reloaded automatically if their modification time changes, so this is only required if
+    you replaced material that is not read from a file, e.g. a responder certificate in the database.
+    """
+    _responder_cache.clear()
+
+
+def _get_cached(key, version, loader):
+    cached = _responder_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    value = loader()
+    _responder_cache[key] = (version, value)
+    return value
+
+
+def _read_file(path):
+    with open(path, 'rb') as stream:
+        return stream.read()
+
+
+def load_responder_key(path):
+    """Load the private key used for signing OCSP responses.
+
+    The key is read only once per process and reloaded if the modification time of the file changes.
+    """
+    return _get_cached(('key', path), os.path.getmtime(path), lambda: load_private_key(_read_file(path)))
+
+
+def load_responder_cert(path):
+    """Load the certificate used for signing OCSP responses.
+
+    The certificate is read only once per process and reloaded if the modification time of the file changes.
+    """
+    return _get_cached(('cert', path), os.path.getmtime(path), lambda: load_certificate(_read_file(path)))
+
+
+def load_cached_certificate(key, loader):
+    """Load a certificate from any other source (e.g. the database) only once per process.
+
+    ``loader`` is a callable returning the certificate in PEM or DER format. It is only called if there is
+    no cached certificate under ``key`` yet.
+    """
+    return _get_cached(('loader', key), None, lambda: load_certificate(force_bytes(loader())))
+
+
+def load_pem_certificate(pem):
+    """Load a certificate from the given PEM, cached per process by the PEM itself.
+
+    This is useful for certificates stored in the database (e.g. of a certificate authority), since any
+    change to the PEM will automatically result in a cache miss.
+    """
+    pem = force_bytes(pem)
+    return _get_cached(('pem', pem), None, lambda: load_certificate(pem))
+
+
+def invalidate_issuer_index():
+    """Invalidate the index used by :py:func:`get_issuer` and :py:func:`get_ca` in all processes.
+
+    This is called automatically whenever a certificate authority is saved or deleted. Other processes
+    are notified via the cache, so they will only notice the change immediately if they share the same cache
+    backend (i.e. not with the default ``LocMemCache``). Otherwise, they rebuild the index after
+    ``CA_OCSP_INDEX_TIMEOUT`` seconds.
+    """
+    _issuer_index.clear()
+    cache.set(ISSUER_INDEX_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def _get_issuer_index():
+    version = cache.get(ISSUER_INDEX_VERSION_CACHE_KEY)
+    now = time.time()
+    if _issuer_index and _issuer_index['version'] == version and (
+            _issuer_index['expires'] is None or _issuer_index['expires'] > now):
+        return _issuer_index
+
+    from .models import CertificateAuthority  # avoid circular import, models use this module
+
+    hashes = {}
+    cas = {}
+    for ca in CertificateAuthority.objects.enabled():
+        cas[ca.pk] = ca
+        try:
+            cert = load_pem_certificate(ca.pub).asn1
+        except Exception:
+            log.warning('CA with primary key %s: Could not load certificate.', ca.pk)
+            continue
+
+        for algo in ['sha1', 'sha256']:
+            hashes[(algo, getattr(cert.subject, algo), getattr(cert.public_key, algo))] = ca.pk
+
+    timeout = ca_settings.CA_OCSP_INDEX_TIMEOUT
+    _issuer_index.clear()
+    _issuer_index.update({'version': version, 'expires': None if timeout is None else now + timeout,
+                          'hashes': hashes, 'cas': cas, 'identifiers': {}})
+    return _issuer_index
+
+
+def get_issuer(cert_id):
+    """Get the primary key of the certificate authority identified by the given CertID.
+
+    The certificate authority is looked up by the hash of its name and public key in an index that is
+    computed only once per process (see :py:func:`invalidate_issuer_index`). Disabled certificate
+    authorities are not included. Both SHA1 and SHA256 hashes are supported.
+
+    Parameters
+    ----------
+
+    cert_id : :py:class:`asn1crypto.ocsp.CertId`
+        The CertID from an OCSP request.
+
+    Returns
+    -------
+
+    int
+        The primary key of the certificate authority or ``None`` if no certificate authority matches.
+    """
+    return _get_issuer_index()['hashes'].get(get_cert_id_hashes(cert_id))
+
+
+def get_ca(pk):
+    """Get the certificate authority with the given primary key without a database query.
+
+    Certificate authorities are loaded together with the index used by :py:func:`get_issuer`. Returns
+    ``None`` if no enabled certificate authority with the given primary key exists.
+    """
+    return _get_issuer_index()['cas'].get(pk)
+
+
+def get_ca_by_serial_or_cn(identifier):
+    """Get a certificate authority by serial or common name, queried only once per process.
+
+    Like ``CertificateAuthority.objects.get_by_serial_or_cn()``, this raises ``DoesNotExist`` if no
+    enabled certificate authority matches. The result is cached until the index used by
+    :py:func:`get_issuer` is invalidated.
+    """
+    identifiers = _get_issuer_index()['identifiers']
+    ca = identifiers.get(identifier)
+    if ca is None:
+        from .models import CertificateAuthority  # avoid circular import, models use this module
+        ca = identifiers[identifier] = CertificateAuthority.objects.enabled().get_by_serial_or_cn(identifier)
+    return ca
+
 
 def get_index(ca):
     now = datetime.utcnow()
@@ -29,12 +538,15 @@ def get_index(ca):
             status = 'E'
         elif cert.revoked:
             status = 'R'
+        else:
+            status = 'V'
 
+        # NOTE: The revocation is also kept for expired certificates, so that they are still reported as
+        #       revoked by the standalone OCSP responder.
+        if cert.revoked:
             revocation = cert.revoked_date.strftime(date_format)
             if cert.revoked_reason:
                 revocation += ',%s' % cert.revoked_reason
-        else:
-            status = 'V'
 
         # Format see: http://pki-tutorial.readthedocs.org/en/latest/cadb.html
         yield '%s\n' % '\t'.join([
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""A standalone OCSP/CRL responder based on asyncio.
+
+The responder does not use the database at all. Certificate status is read from an index file written by
+``manage.py dump_ocsp_index`` (or a snapshot written by ``manage.py dump_ocsp_snapshot``) and CRLs are
+served from files written by ``manage.py dump_crl``. This module requires Python 3.4 or later.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+from datetime import datetime
+from http.client import responses as http_reasons
+from urllib.parse import unquote
+
+from asn1crypto import ocsp
+
+from .ocsp import date_format
+from .ocsp import get_cert_id_hashes
+from .ocsp import get_issuer_hashes
+from .ocsp import is_cacheable_response
+from .ocsp import load_pem_certificate
+from .ocsp import load_responder_cert
+from .ocsp import load_responder_key
+from .ocsp import parse_request
+from .ocsp import sign_response
+from .snapshot import Snapshot
+from .snapshot import is_snapshot
+
+log = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 8192
+MAX_BODY_SIZE = 65536
+
+
+def load_index(path):
+    """Load an index file as written by ``manage.py dump_ocsp_index``.
+
+    Returns a dictionary mapping the serial (as int) to a tuple of the OCSP status and the revocation
+    date. Certificates are reported as revoked if the revocation column is set, even if they are
+    expired.
+    """
+    index = {}
+    with open(path) as stream:
+        for line in stream:
+            status, _expires, revocation, serial = line.split('\t')[:4]
+
+            # Expired certificates ("E") also have a revocation if they were revoked
+            if status == 'R' or (status == 'E' and revocation):
+                revocation = revocation.split(',', 1)
+                revoked_date = datetime.strptime(revocation[0], date_format)
+                reason = revocation[1] if len(revocation) > 1 else 'revoked'
+                index[int(serial, 16)] = (reason, revoked_date)
+            else:
+                # NOTE: The OCSP status 'good' does not say if the certificate has expired.
+                index[int(serial, 16)] = ('good', None)
+    return index
+
+
+class OCSPResponder(object):
+    """Answers OCSP requests and CRL downloads without touching the database.
+
+    Parameters
+    ----------
+
+    ca_pem : str
+        The certificate of the certificate authority in PEM format.
+    responder_key : str
+        Path to the private key used for signing responses.
+    responder_cert : str
+        Path to the certificate used for signing responses.
+    index : str
+        Path to the index file written by ``manage.py dump_ocsp_index`` or to a snapshot written by
+        ``manage.py dump_ocsp_snapshot``. The file is reloaded if its modification time changes.
+    expires : int, optional
+        Time in seconds that the responses remain valid.
+    crl_dir : str, optional
+        A directory containing CRLs served under ``/crl/<filename>``.
+    prefix : str, optional
+        The path under which OCSP requests are served.
+    """
+
+    def __init__(self, ca_pem, responder_key, responder_cert, index, expires=600, crl_dir=None,
+                 prefix='/ocsp/'):
+        self.ca_cert = load_pem_certificate(ca_pem)
+        self.responder_key = load_responder_key(responder_key)
+        self.responder_cert = load_responder_cert(responder_cert)
+        self.index_path = index
+        self.expires = expires
+        self.crl_dir = crl_dir
+        self.prefix = prefix
+
+        # hashes in requests identifying the certificate authority
+        self.issuer_hashes = get_issuer_hashes(self.ca_cert)
+
+        self._index_mtime = None
+        self.index = {}
+        self.reload_index()
+
+    def reload_index(self):
+        """Reload the index if the file was modified."""
+
+        mtime = os.path.getmtime(self.index_path)
+        if mtime != self._index_mtime:
+            if is_snapshot(self.index_path):
+                # snapshots are memory-mapped and thus shared between worker processes
+                self.index = Snapshot(self.index_path)
+            else:
+                self.index = load_index(self.index_path)
+            self._index_mtime = mtime
+            log.info('%s: Loaded %s certificates.', self.index_path, len(self.index))
+
+    def fail(self, reason):
+        return ocsp.OCSPResponse({'response_status': reason}).dump()
+
+    def get_ocsp_response(self, data):
+        try:
+            req_certs, serials, nonce = parse_request(data)
+        except Exception as e:
+            log.exception('Error parsing OCSP request: %s', e)
+            return self.fail('malformed_request')
+
+        responses = []
+        for req_cert in req_certs:
+            if get_cert_id_hashes(req_cert) not in self.issuer_hashes:
+                log.warning('OCSP request for unknown CA received.')
+                return self.fail('unauthorized')
+
+            status, revoked_date = self.index.get(req_cert['serial_number'].native, ('unknown', None))
+            responses.append((req_cert, status, revoked_date))
+
+        return sign_response(self.ca_cert, responses, responder_key=self.responder_key,
+                             responder_cert=self.responder_cert, expires=self.expires, nonce=nonce).dump()
+
+    def get_crl(self, name):
+        path = os.path.join(self.crl_dir, name)
+        if '/' in name or name.startswith('.') or not os.path.isfile(path):
+            return 404, {}, b''
+
+        with open(path, 'rb') as stream:
+            crl = stream.read()
+
+        content_type = 'text/plain' if name.endswith('.pem') else 'application/pkix-crl'
+        return 200, {'Content-Type': content_type}, crl
+
+    def handle(self, method, path, body):
+        """Handle a single HTTP request.
+
+        Returns
+        -------
+
+        A tuple of the HTTP status code, a dictionary of headers and the response body.
+        """
+        if path.startswith(self.prefix):
+            headers = {'Content-Type': 'application/ocsp-response'}
+            if method == 'POST':
+                return 200, headers, self.get_ocsp_response(body)
+            elif method == 'GET':
+                try:
+                    data = base64.b64decode(unquote(path[len(self.prefix):]), validate=True)
+                except Exception:
+                    return 400, {}, b''
+
+                content = self.get_ocsp_response(data)
+                if is_cacheable_response(ocsp.OCSPResponse.load(content)):
+                    headers['Cache-Control'] = 'max-age=%s, public, no-transform, must-revalidate' % (
+                        self.expires)
+                else:
+                    headers['Cache-Control'] = 'private, no-cache'
+                return 200, headers, content
+            return 405, {}, b''
+        elif path.startswith('/crl/') and self.crl_dir is not None:
+            if method != 'GET':
+                return 405, {}, b''
+            return self.get_crl(path[5:])
+
+        return 404, {}, b''
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """A minimal HTTP/1.1 implementation (with keep-alive) sufficient for OCSP and CRL clients."""
+
+    def __init__(self, responder):
+        self.responder = responder
+        self.transport = None
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+
+        while self.transport is not None:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end == -1:
+                if len(self.buffer) > MAX_HEADER_SIZE:
+                    self.respond(431, {}, b'', keep_alive=False)
+                return
+
+            try:
+                lines = self.buffer[:end].decode('latin-1').split('\r\n')
+                method, path, version = lines[0].split(' ')
+                headers = dict((k.strip().lower(), v.strip())
+                               for k, v in (line.split(':', 1) for line in lines[1:]))
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                self.respond(400, {}, b'', keep_alive=False)
+                return
+
+            if length > MAX_BODY_SIZE:
+                self.respond(413, {}, b'', keep_alive=False)
+                return
+            if len(self.buffer) < end + 4 + length:
+                return  # body not yet fully received
+
+            body = self.buffer[end + 4:end + 4 + length]
+            self.buffer = self.buffer[end + 4 + length:]
+
+            connection = headers.get('connection', '').lower()
+            if version == 'HTTP/1.1':
+                keep_alive = connection != 'close'
+            else:
+                keep_alive = connection == 'keep-alive'
+
+            try:
+                status, response_headers, content = self.responder.handle(method, path, body)
+            except Exception as e:  # pragma: no cover
+                log.exception(e)
+                status, response_headers, content = 500, {}, b''
+            self.respond(status, response_headers, content, keep_alive=keep_alive)
+
+    def respond(self, status, headers, content, keep_alive=True):
+        headers['Content-Length'] = len(content)
+        if keep_alive is False:
+            headers['Connection'] = 'close'
+
+        head = ['HTTP/1.1 %s %s' % (status, http_reasons.get(status, ''))]
+        head += ['%s: %s' % (k, v) for k, v in sorted(headers.items())]
+        self.transport.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + content)
+
+        if keep_alive is False:
+            self.transport.close()
+            self.transport = None
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+def serve(responder, sock, reload_interval=60):
+    """Serve requests on the given (already bound) socket until interrupted.
+
+    The index is checked for modifications every ``reload_interval`` seconds.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(loop.create_server(lambda: HTTPProtocol(responder), sock=sock))
+
+    def reload_index():
+        try:
+            responder.reload_index()
+        except Exception as e:  # pragma: no cover
+            log.exception(e)
+        loop.call_later(reload_interval, reload_index)
+    loop.call_later(reload_interval, reload_index)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
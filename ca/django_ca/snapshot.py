@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Compact, memory-mappable snapshots of the revocation status of all certificates of a CA.
+
+A snapshot consists of a header (magic bytes and the number of records) followed by fixed-size records
+sorted by serial, so a status lookup is a binary search over a file that is shared by all processes via
+mmap. Each record contains the serial (20 bytes, big-endian), the status (see ``STATUSES``) and the
+revocation date (seconds since the epoch, 0 if the certificate is not revoked).
+"""
+
+import binascii
+import calendar
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+
+from django.utils import six
+
+MAGIC = b'DJCASNP1'
+HEADER = struct.Struct('>8sI')
+RECORD = struct.Struct('>20sBq')
+SERIAL_SIZE = 20
+
+# Status values as stored in a snapshot. Never reorder this list, as it is part of the file format.
+STATUSES = (
+    'good',
+    'revoked',  # revoked without a reason
+    'aa_compromise',
+    'affiliation_changed',
+    'ca_compromise',
+    'certificate_hold',
+    'cessation_of_operation',
+    'key_compromise',
+    'privilege_withdrawn',
+    'remove_from_crl',
+    'superseded',
+    'unspecified',
+)
+
+# Per-process cache of open snapshots, see get_snapshot().
+_snapshots = {}
+
+
+def pack_serial(serial):
+    """Convert a serial (either an int or a hex string, optionally with colons) to 20 bytes."""
+
+    if not isinstance(serial, six.integer_types):
+        serial = int(serial.replace(':', ''), 16)
+    if serial < 0 or serial.bit_length() > SERIAL_SIZE * 8:
+        raise ValueError('%s: Serial does not fit into %s bytes.' % (serial, SERIAL_SIZE))
+    return binascii.unhexlify('%040x' % serial)
+
+
+def write_snapshot(path, certs):
+    """Write a snapshot to ``path``.
+
+    The file is first written to a temporary file in the same directory and then renamed, so readers
+    will never see an incomplete file.
+
+    Parameters
+    ----------
+
+    path : str
+        Where to write the snapshot.
+    certs : iterable
+        Iterable of ``(serial, revoked, revoked_date, revoked_reason)`` tuples, as returned by
+        ``Certificate.objects.values_list('serial', 'revoked', 'revoked_date', 'revoked_reason')``.
+    """
+    records = []
+    for serial, revoked, revoked_date, reason in certs:
+        if revoked:
+            status = STATUSES.index(reason or 'revoked')
+            revoked_date = calendar.timegm(revoked_date.utctimetuple())
+        else:
+            status = revoked_date = 0
+        records.append((pack_serial(serial), status, revoked_date))
+    records.sort()
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(HEADER.pack(MAGIC, len(records)))
+            for record in records:
+                stream.write(RECORD.pack(*record))
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def is_snapshot(path):
+    """Return ``True`` if the file at ``path`` is a snapshot."""
+
+    with open(path, 'rb') as stream:
+        return stream.read(len(MAGIC)) == MAGIC
+
+
+class Snapshot(object):
+    """Read-only access to a snapshot written by :py:func:`write_snapshot`.
+
+    Use :py:func:`get_snapshot` to open a snapshot only once per process.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as stream:
+            self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('%s: Not a revocation snapshot.' % path)
+        if len(self._mmap) != HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError('%s: Snapshot is truncated.' % path)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._mmap.close()
+
+    def get(self, serial, default=None):
+        """Get the OCSP status and revocation date of the given serial.
+
+        Parameters
+        ----------
+
+        serial : int or str
+            The serial of the certificate, either as int or as hex string (optionally with colons).
+        default : optional
+            Returned if the serial is not in the snapshot.
+
+        Returns
+        -------
+
+        A tuple of the OCSP status and the revocation date (a naive datetime in UTC or ``None``) or
+        ``default`` if the serial was not found.
+        """
+        try:
+            key = pack_serial(serial)
+        except ValueError:
+            return default
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            current = self._mmap[offset:offset + SERIAL_SIZE]
+
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                _serial, status, revoked_date = RECORD.unpack_from(self._mmap, offset)
+                if status == 0:
+                    return STATUSES[status], None
+                return STATUSES[status], datetime.utcfromtimestamp(revoked_date)
+        return default
+
+
+def get_snapshot(path):
+    """Get a :py:class:`Snapshot`, opened only once per process.
+
+    The snapshot is reopened if the file was replaced (e.g. by ``manage.py dump_ocsp_snapshot``).
+    """
+    stat = os.stat(path)
+    version = (stat.st_ino, stat.st_mtime)
+
+    cached = _snapshots.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    # NOTE: A replaced snapshot is not closed explicitly, as other threads might still use it.
+    snapshot = Snapshot(path)
+    _snapshots[path] = (version, snapshot)
+    return snapshot
@@ -222,6 +222,7 @@ class DjangoCATestCase(TestCase):
 
     if six.PY2:  # pragma: only py2
         assertRaisesRegex = TestCase.assertRaisesRegexp
+        assertRegex = TestCase.assertRegexpMatches
 
     @classmethod
     def tearDownClass(cls):
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for CRL generation, run with ``python setup.py benchmark --suite=benchmarks_crl``."""
+
+import sys
+import unittest
+from datetime import datetime
+from timeit import default_timer
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.utils import timezone
+
+from ..crl import get_crl_builder
+from ..models import Certificate
+from ..utils import int_to_hex
+from ..views import CertificateRevocationListView
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: only py2
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+def get_max_rss():
+    """Get the peak resident set size of this process in KiB (or ``None`` if not available).
+
+    Unlike tracemalloc, this includes memory allocated by OpenSSL.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # macOS reports bytes instead of KiB
+        max_rss = max_rss // 1024
+    return max_rss
+
+
+@unittest.skipIf(tracemalloc is None, 'tracemalloc is not available.')
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024)
+class CRLMemoryBenchmark(DjangoCAWithCertTestCase):
+    revoked = 100
+    counts = [1000, 5000, 20000]
+
+    def create_certs(self, count, revoked=False):
+        now = timezone.now()
+        start = Certificate.objects.count() + 1
+        certs = [Certificate(ca=self.ca, pub=self.cert.pub, cn='bench%s.example.com' % i,
+                             serial=int_to_hex(0x100000 + i), expires=self.cert.expires, revoked=revoked,
+                             revoked_date=now if revoked else None)
+                 for i in range(start, start + count)]
+        Certificate.objects.bulk_create(certs)
+
+    def get_crl(self):
+        cache.clear()
+        view = CertificateRevocationListView.as_view()
+        request = RequestFactory().get('/crl/%s/' % self.ca.serial)
+
+        max_rss = get_max_rss()
+        tracemalloc.start()
+        try:
+            response = view(request, serial=self.ca.serial)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # The peak RSS of the process can only grow, so the growth while generating the CRL is reported
+        rss_growth = None if max_rss is None else get_max_rss() - max_rss
+
+        self.assertEqual(response.status_code, 200)
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertEqual(len(list(crl)), self.revoked)
+        return peak, rss_growth
+
+    def test_memory(self):
+        self.create_certs(self.revoked, revoked=True)
+        self.get_crl()  # warm up caches (e.g. loading the private key)
+
+        peaks = []
+        for count in self.counts:
+            self.create_certs(count - Certificate.objects.count())
+            peak, rss_growth = self.get_crl()
+            peaks.append(peak)
+            sys.stderr.write('\n%7d certificates: peak memory %.1f KiB (Python heap)' % (count, peak / 1024.))
+            if rss_growth is not None:
+                sys.stderr.write(', peak RSS grew by %d KiB (process)' % rss_growth)
+        if resource is not None:
+            sys.stderr.write('\nPeak RSS of the process: %d KiB' % get_max_rss())
+        sys.stderr.write('\n')
+
+        # Memory usage must not grow with the number of (not revoked) certificates
+        self.assertLess(peaks[-1], peaks[0] * 1.5)
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024)
+class CRLAssemblyBenchmark(DjangoCAWithCertTestCase):
+    counts = [1000, 10000, 100000, 1000000]
+
+    def revoked(self, count):
+        now = datetime.utcnow()
+        reasons = ['', 'key_compromise', 'superseded']
+        return ((int_to_hex(i), now, reasons[i % 3]) for i in range(1, count + 1))
+
+    def test_time(self):
+        key = self.ca.key(None)
+        timings = []
+        for count in self.counts:
+            start = default_timer()
+            builder = get_crl_builder(self.ca, 600, self.revoked(count))
+            crl = builder.sign(private_key=key, algorithm=hashes.SHA256(), backend=default_backend())
+            crl = crl.public_bytes(Encoding.DER)
+            timings.append(default_timer() - start)
+            sys.stderr.write('\n%7d revoked certificates: %.2f seconds (%d bytes)'
+                             % (count, timings[-1], len(crl)))
+        sys.stderr.write('\n')
+
+        # Time per entry must not grow with the number of entries (quadratic assembly would take ~100 times
+        # as long per entry for 1M entries as for 10k entries).
+        self.assertLess(timings[-1] / self.counts[-1], timings[1] / self.counts[1] * 5)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for signing certificates, run with ``python setup.py benchmark --suite=benchmarks_sign``."""
+
+import sys
+from timeit import default_timer
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+
+from ..models import Certificate
+from ..models import CertificateAuthority
+from ..utils import get_cert_builder
+from ..utils import get_cert_profile_kwargs
+from .base import DjangoCAWithCSRTestCase
+from .base import override_tmpcadir
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024)
+class SignBenchmark(DjangoCAWithCSRTestCase):
+    count = 2000
+
+    def setUp(self):
+        super(SignBenchmark, self).setUp()
+        self.ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        self.ca.crl_url = 'http://crl.example.com/{shard}/\nhttp://crl.example.net/{shard}/'
+        self.ca.crl_shards = 16
+        self.ca.issuer_url = 'http://ca.example.com/ca.crt'
+        self.ca.ocsp_url = 'http://ocsp.example.com'
+        self.ca.issuer_alt_name = 'http://ca.example.com'
+        self.ca.save()
+
+    def build(self, get_extensions):
+        start = default_timer()
+        for i in range(self.count):
+            serial = x509.random_serial_number()
+            builder = get_cert_builder(self.expires(720), serial=serial)
+            for critical, ext in get_extensions(serial):
+                builder = builder.add_extension(ext, critical=critical)
+        return (default_timer() - start) / self.count
+
+    def test_builder(self):
+        manager = Certificate.objects
+
+        def uncached(serial):
+            return manager.get_ca_extensions(self.ca, shard=self.ca.get_crl_shard(serial))
+
+        def template(serial):
+            return manager.get_ca_extension_template(self.ca)[self.ca.get_crl_shard(serial) or 0]
+
+        uncached_time = self.build(uncached)
+        template_time = self.build(template)
+        sys.stderr.write('\nCA extensions computed per certificate: %.1f us/certificate' %
+                         (uncached_time * 1000000))
+        sys.stderr.write('\nCA extensions from template:            %.1f us/certificate' %
+                         (template_time * 1000000))
+
+        kwargs = get_cert_profile_kwargs()
+        self.ca.key(None)  # load the private key before timing
+        start = default_timer()
+        for i in range(100):
+            manager.sign_cert(self.ca, self.csr_pem, expires=self.expires(720), algorithm=hashes.SHA256(),
+                              subjectAltName=['example.com'], **kwargs)
+        sys.stderr.write('\nsign_cert() total:                      %.1f us/certificate\n' %
+                         ((default_timer() - start) / 100 * 1000000))
+
+        self.assertLess(template_time, uncached_time)
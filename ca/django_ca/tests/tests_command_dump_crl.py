@@ -14,6 +14,7 @@
 # see <http://www.gnu.org/licenses/>
 
 import os
+from datetime import timedelta
 from io import BytesIO
 
 from cryptography import x509
@@ -49,6 +50,49 @@ class DumpCRLTestCase(DjangoCAWithCertTestCase):
     def test_basic_with_use_tz(self):
         self.test_basic()
 
+    def test_delta(self):
+        with self.assertRaisesRegex(CommandError, r': No base CRL has been generated yet\.$'):
+            self.cmd('dump_crl', delta=True, stdout=BytesIO(), stderr=BytesIO())
+
+        stdout, stderr = self.cmd('dump_crl', stdout=BytesIO(), stderr=BytesIO())
+        base = x509.load_pem_x509_crl(stdout, default_backend())
+        base_number = base.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+        # make sure that the revocation date is after the base CRL, even if the clock is frozen in tests
+        last_update = self.ca.crls.get().last_update
+        Certificate.objects.filter(pk=cert.pk).update(revoked_date=last_update + timedelta(seconds=1))
+        stdout, stderr = self.cmd('dump_crl', delta=True, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(stderr, b'')
+
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+        self.assertEqual(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number,
+                         base_number + 1)
+        indicator = crl.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertTrue(indicator.critical)
+        self.assertEqual(indicator.value.crl_number, base_number)
+
+    def test_shard(self):
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(crl_shards=2)
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+        Certificate.objects.filter(pk=cert.pk).update(crl_shard=1)
+
+        stdout, stderr = self.cmd('dump_crl', shard=1, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(stderr, b'')
+        crl = x509.load_pem_x509_crl(stdout, default_backend())
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+
+        stdout, stderr = self.cmd('dump_crl', shard=0, stdout=BytesIO(), stderr=BytesIO())
+        self.assertEqual(list(x509.load_pem_x509_crl(stdout, default_backend())), [])
+
+        with self.assertRaisesRegex(CommandError, r'^2: Invalid CRL shard, the CA has 2 shard\(s\)\.$'):
+            self.cmd('dump_crl', shard=2, stdout=BytesIO(), stderr=BytesIO())
+        with self.assertRaisesRegex(CommandError, r'^CRL shards are only supported for base CRLs'):
+            self.cmd('dump_crl', shard=0, ca_crl=True, stdout=BytesIO(), stderr=BytesIO())
+
     def test_file(self):
         path = os.path.join(ca_settings.CA_DIR, 'crl-test.crl')
         stdout, stderr = self.cmd('dump_crl', path, stdout=BytesIO(), stderr=BytesIO())
@@ -33,12 +33,14 @@ class OCSPIndexTestCase(DjangoCAWithCertTestCase):
             status = 'E'
         elif cert.revoked is True:
             status = 'R'
+        else:
+            status = 'V'
+
+        if cert.revoked is True:
             revocation = cert.revoked_date.strftime(date_format)
 
             if cert.revoked_reason:
                 revocation += ',%s' % cert.revoked_reason
-        else:
-            status = 'V'
 
         return '%s\t%s\t%s\t%s\tunknown\t%s' % (
             status,
@@ -72,6 +74,21 @@ class OCSPIndexTestCase(DjangoCAWithCertTestCase):
         self.assertEqual(stdout, '%s\n' % self.line(cert))
         self.assertEqual(stderr, '')
 
+        # expired certificates that are not revoked have an empty revocation field
+        self.assertTrue(stdout.startswith('E\t%s\t\t%s\t' % (
+            cert.x509.not_valid_after.strftime(date_format), cert.serial.replace(':', ''))))
+
+    def test_expired_revoked(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('key_compromise')
+        cert.expires = timezone.now() - timedelta(days=3)
+        cert.save()
+
+        stdout, stderr = self.cmd('dump_ocsp_index')
+        self.assertEqual(stdout, '%s\n' % self.line(cert))
+        self.assertTrue(stdout.startswith('E\t'))
+        self.assertIn(',key_compromise\t', stdout)
+
     def test_revoked(self):
         cert = Certificate.objects.get(serial=self.cert.serial)
         cert.revoke()
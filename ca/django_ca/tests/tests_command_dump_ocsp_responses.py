@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import base64
+import os
+from datetime import timedelta
+
+from mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.test import Client
+from django.utils import timezone
+
+from .. import ca_settings
+from ..management.commands import dump_ocsp_responses
+from ..models import Certificate
+from ..ocsp import get_ca_by_serial_or_cn
+from ..ocsp import get_cached_response
+from ..ocsp import load_responder_cert
+from ..ocsp import set_cached_responses
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+from .tests_views_ocsp import OCSPViewTestMixin
+from .tests_views_ocsp import req1
+
+try:
+    from django.urls import reverse
+except ImportError:  # Django 1.8 import
+    from django.core.urlresolvers import reverse
+
+
+@override_tmpcadir(ROOT_URLCONF='django_ca.tests.tests_views_ocsp')
+class DumpOCSPResponsesTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(DumpOCSPResponsesTestCase, self).setUp()
+        self.client = Client()
+
+    def tearDown(self):
+        cache.clear()
+        super(DumpOCSPResponsesTestCase, self).tearDown()
+
+    def dump(self, *args, **kwargs):
+        # required options must be passed as arguments in Django<2.0
+        args = ['--responder-key', kwargs.pop('responder_key', settings.OCSP_KEY_PATH),
+                '--responder-cert', kwargs.pop('responder_cert', settings.OCSP_PEM_PATH)] + list(args)
+        kwargs.setdefault('processes', 1)
+        return self.cmd('dump_ocsp_responses', *args, ca=self.ca, **kwargs)
+
+    def get(self):
+        data = base64.b64encode(req1).decode('utf-8')
+        return self.client.get(reverse('cached', kwargs={'data': data}))
+
+    def get_cached(self, expires=600, ca_ocsp=False):
+        responder_cert = load_responder_cert(settings.OCSP_PEM_PATH)
+        return get_cached_response(self.ca.serial, self.cert.serial, responder_cert, expires, ca_ocsp)[0]
+
+    def test_cache(self):
+        stdout, stderr = self.dump()
+        self.assertEqual(stdout, '')
+        self.assertEqual(stderr, '')
+
+        cached = self.get_cached()
+        self.assertIsNotNone(cached)
+
+        # Responses are not used by responders with different settings
+        self.assertIsNone(self.get_cached(expires=1200))
+        self.assertIsNone(self.get_cached(ca_ocsp=True))
+
+        # The view serves the pre-generated response without signing anything
+        get_ca_by_serial_or_cn(self.ca.serial)  # CA is cached per process
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, cached)
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_revoked(self):
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke()
+        self.dump()
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_revoked_while_signing(self):
+        sign = dump_ocsp_responses._sign
+
+        def revoke_and_sign(args):
+            # revoke the certificate after its status was read, but before the response is stored
+            cert = Certificate.objects.get(serial=args[0])
+            if cert.revoked is False:
+                cert.revoke()
+            return sign(args)
+
+        with patch('django_ca.management.commands.dump_ocsp_responses._sign', side_effect=revoke_and_sign):
+            self.dump()
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_responder_cert_from_db(self):
+        self.dump(responder_cert=self.ocsp_cert.serial)
+        self.assertOCSP(self.get(), requested=[self.cert])
+
+    def test_directory(self):
+        stdout, stderr = self.dump(ca_settings.CA_DIR, processes=2)
+        self.assertEqual(stdout, '')
+        self.assertEqual(stderr, '')
+
+        path = os.path.join(ca_settings.CA_DIR, '%s.der' % self.cert.serial.replace(':', ''))
+        responder_cert = load_responder_cert(settings.OCSP_PEM_PATH)
+        version = get_cached_response(self.ca.serial, self.cert.serial, responder_cert, 600)[1]
+        with open(path, 'rb') as stream:
+            set_cached_responses(self.ca.serial, [(self.cert.serial, version, stream.read())], responder_cert,
+                                 600)
+        self.assertOCSP(self.get(), requested=[self.cert])
+
+    def test_directory_replace(self):
+        # Existing responses are replaced atomically, so a failed write leaves the old response in place
+        self.dump(ca_settings.CA_DIR)
+        path = os.path.join(ca_settings.CA_DIR, '%s.der' % self.cert.serial.replace(':', ''))
+        with open(path, 'rb') as stream:
+            old = stream.read()
+
+        with patch('django_ca.management.commands.dump_ocsp_responses.os.rename', side_effect=OSError()):
+            with self.assertRaises(OSError):
+                self.dump(ca_settings.CA_DIR)
+        with open(path, 'rb') as stream:
+            self.assertEqual(stream.read(), old)
+        self.assertEqual([f for f in os.listdir(ca_settings.CA_DIR) if f.startswith('.ocsp-')], [])
+
+        inode = os.stat(path).st_ino
+        self.dump(ca_settings.CA_DIR)
+        self.assertNotEqual(os.stat(path).st_ino, inode)  # file was replaced, not overwritten
+        self.assertEqual([f for f in os.listdir(ca_settings.CA_DIR) if f.startswith('.ocsp-')], [])
+
+    def test_expired(self):
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.expires = timezone.now() - timedelta(days=3)
+        cert.save()
+
+        self.dump()
+        self.assertIsNone(self.get_cached())
+
+    def test_errors(self):
+        with self.assertRaisesRegex(CommandError, r'^--processes must be at least 1\.$'):
+            self.dump(processes=0)
+        with self.assertRaisesRegex(CommandError, r'^/does/not/exist: Not a directory\.$'):
+            self.dump('/does/not/exist')
+        with self.assertRaisesRegex(CommandError, r'^/false/key: Responder key not found\.$'):
+            self.dump(responder_key='/false/key')
+        with self.assertRaisesRegex(CommandError, r'^AB:CD: Responder certificate not found\.$'):
+            self.dump(responder_cert='AB:CD')
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>
 
+from django.core.management.base import CommandError
+
 from ..models import CertificateAuthority
 from .base import DjangoCAWithCATestCase
 from .base import override_tmpcadir
@@ -24,11 +26,12 @@ class SignCertTestCase(DjangoCAWithCATestCase):
         issuer = 'https://issuer-test.example.org'
         ian = 'http://ian-test.example.org'
         ocsp = 'http://ocsp-test.example.org'
-        crl = ['http://example.org/crl-test']
+        crl = ['http://example.org/crl-test/{shard}/']
+        delta = 'http://example.org/delta-test'
 
         stdout, stderr = self.cmd(
             'edit_ca', self.ca.serial, issuer_url=issuer, issuer_alt_name=ian,
-            ocsp_url=ocsp, crl_url=crl, disable=False)
+            ocsp_url=ocsp, crl_url=crl, crl_shards=4, delta_crl_url=[delta], disable=False)
         self.assertEqual(stdout, '')
         self.assertEqual(stderr, '')
 
@@ -37,6 +40,8 @@ class SignCertTestCase(DjangoCAWithCATestCase):
         self.assertEqual(ca.issuer_alt_name, ian)
         self.assertEqual(ca.ocsp_url, ocsp)
         self.assertEqual(ca.crl_url, '\n'.join(crl))
+        self.assertEqual(ca.crl_shards, 4)
+        self.assertEqual(ca.delta_crl_url, delta)
         self.assertFalse(ca.enabled)
 
     def test_enable(self):
@@ -54,4 +59,28 @@ class SignCertTestCase(DjangoCAWithCATestCase):
         self.assertEqual(ca.issuer_alt_name, self.ca.issuer_alt_name)
         self.assertEqual(ca.ocsp_url, self.ca.ocsp_url)
         self.assertEqual(ca.crl_url, self.ca.crl_url)
+        self.assertEqual(ca.crl_shards, 0)
+        self.assertEqual(ca.delta_crl_url, self.ca.delta_crl_url)
         self.assertTrue(ca.enabled)
+
+    def test_shard_without_crl_shards(self):
+        crl = ['http://example.org/crl/{shard}/']
+        with self.assertRaisesRegex(CommandError, r'"\{shard\}" can only be used in CRL URLs if the CRL is'):
+            self.cmd('edit_ca', self.ca.serial, crl_url=crl)
+        self.assertEqual(CertificateAuthority.objects.get(pk=self.ca.pk).crl_url, self.ca.crl_url)
+
+        self.cmd('edit_ca', self.ca.serial, crl_url=crl, crl_shards=2)
+        self.assertEqual(CertificateAuthority.objects.get(pk=self.ca.pk).crl_url, crl[0])
+
+    def test_crl_shards_without_shard(self):
+        with self.assertRaisesRegex(CommandError, r'^All CRL URLs must contain "\{shard\}" if the CRL is'):
+            self.cmd('edit_ca', self.ca.serial, crl_url=['http://example.org/crl/'], crl_shards=2)
+        self.assertEqual(CertificateAuthority.objects.get(pk=self.ca.pk).crl_shards, 0)
+
+    def test_invalid_crl_shards(self):
+        msg = r'^The number of CRL shards must be between 0 and 32767\.$'
+        with self.assertRaisesRegex(CommandError, msg):
+            self.cmd('edit_ca', self.ca.serial, '--crl-shards', '-1')
+        with self.assertRaisesRegex(CommandError, msg):
+            self.cmd('edit_ca', self.ca.serial, crl_shards=32768)
+        self.assertEqual(CertificateAuthority.objects.get(pk=self.ca.pk).crl_shards, 0)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+from django.core.management.base import CommandError
+
+from .. import ca_settings
+from ..models import Certificate
+from ..models import CertificateAuthority
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
+class PublishCRLsTestCase(DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(PublishCRLsTestCase, self).setUp()
+        self.path = tempfile.mkdtemp(dir=ca_settings.CA_DIR)
+
+    def load(self, name):
+        with open(os.path.join(self.path, '%s.crl' % name), 'rb') as stream:
+            crl = x509.load_der_x509_crl(stream.read(), default_backend())
+        with open(os.path.join(self.path, '%s.pem' % name), 'rb') as stream:
+            self.assertEqual(x509.load_pem_x509_crl(stream.read(), default_backend()), crl)
+        return crl
+
+    def test_basic(self):
+        child = self.create_ca(name='child', parent=self.ca)
+        child.revoke()
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke()
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(crl_shards=2)
+        Certificate.objects.filter(pk=cert.pk).update(crl_shard=1)
+
+        stdout, stderr = self.cmd('publish_crls', self.path, processes=1)
+        self.assertEqual(stderr, '')
+        name = self.ca.serial.replace(':', '')
+        child_name = child.serial.replace(':', '')
+        self.assertEqual(len(stdout.splitlines()), 6)
+        self.assertRegex(stdout, r'root \(%s\): %s_ca\.\{crl,pem\} written in [0-9.]+ seconds\.' % (
+            self.ca.serial, name))
+
+        self.assertEqual([c.serial_number for c in self.load(name)], [cert.x509.serial])
+        self.assertEqual([c.serial_number for c in self.load('%s_ca' % name)], [child.x509.serial])
+        self.assertEqual(list(self.load('%s_shard0' % name)), [])
+        self.assertEqual([c.serial_number for c in self.load('%s_shard1' % name)], [cert.x509.serial])
+        self.assertEqual(list(self.load(child_name)), [])
+        self.assertEqual(list(self.load('%s_ca' % child_name)), [])
+
+        # only temporary files were renamed
+        self.assertEqual(len(os.listdir(self.path)), 12)
+
+    def test_processes(self):
+        stdout, stderr = self.cmd('publish_crls', self.path, processes=2)
+        self.assertEqual(stderr, '')
+        self.assertEqual(len(stdout.splitlines()), 2)
+        self.assertEqual(list(self.load(self.ca.serial.replace(':', ''))), [])
+
+    def test_disabled(self):
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(enabled=False)
+        stdout, stderr = self.cmd('publish_crls', self.path, processes=1)
+        self.assertEqual(stdout, '')
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_error(self):
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(private_key_path='/does/not/exist')
+        with self.assertRaisesRegex(CommandError, r'^2 of 2 CRLs could not be written\.$'):
+            self.cmd('publish_crls', self.path, processes=1)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(CommandError, r'^/does/not/exist: Not a directory\.$'):
+            self.cmd('publish_crls', '/does/not/exist')
+        with self.assertRaisesRegex(CommandError, r'^--processes must be at least 1\.$'):
+            self.cmd('publish_crls', self.path, processes=0)
@@ -13,11 +13,17 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>
 
+import json
 import os
+import tarfile
+import tempfile
 from collections import OrderedDict
 from datetime import datetime
 from datetime import timedelta
 
+from mock import patch
+
+from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import Encoding
 
 from django.core.management.base import CommandError
@@ -26,6 +32,7 @@ from django.utils import six
 from .. import ca_settings
 from ..models import Certificate
 from ..models import CertificateAuthority
+from ..models import Watcher
 from .base import DjangoCAWithCSRTestCase
 from .base import child_pubkey
 from .base import override_settings
@@ -287,6 +294,316 @@ class SignCertTestCase(DjangoCAWithCSRTestCase):
             self.cmd('sign_cert', alt=['example.com'], csr_format='foo', stdin=stdin)
 
 
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
+class SignCertBatchTestCase(DjangoCAWithCSRTestCase):
+    def setUp(self):
+        super(SignCertBatchTestCase, self).setUp()
+        self.batch_dir = tempfile.mkdtemp(dir=ca_settings.CA_DIR)
+        self.out = tempfile.mkdtemp(dir=ca_settings.CA_DIR)
+
+    def get_csr(self, cn):
+        return self.create_csr({'CN': cn})[1].public_bytes(Encoding.PEM).decode('utf-8')
+
+    def assertSigned(self, stdout, names):
+        self.assertRegex(stdout, r'^Signed %s certificates in [0-9.]+ seconds \([0-9.]+ certificates/second\)'
+                                 r'\.\n$' % len(names))
+        self.assertEqual(sorted(os.listdir(self.out)), sorted(['%s.pem' % n for n in names]))
+
+        certs = []
+        for name in names:
+            with open(os.path.join(self.out, '%s.pem' % name)) as stream:
+                cert = Certificate.objects.get(pub=stream.read())
+            self.assertSignature([self.ca], cert)
+            certs.append(cert)
+        return certs
+
+    def test_directory(self):
+        for cn in ['a.example.com', 'b.example.com']:
+            with open(os.path.join(self.batch_dir, '%s.csr' % cn), 'w') as stream:
+                stream.write(self.get_csr(cn))
+        with open(os.path.join(self.batch_dir, 'README'), 'w') as stream:
+            stream.write('ignored')
+
+        stdout, stderr = self.cmd('sign_cert', batch=self.batch_dir, out=self.out, processes=1,
+                                  watch=['user@example.com'])
+        self.assertEqual(stderr, '')
+        certs = self.assertSigned(stdout, ['a.example.com', 'b.example.com'])
+
+        for cert, cn in zip(certs, ['a.example.com', 'b.example.com']):
+            # CommonName is taken from the CSR if not given
+            self.assertSubject(cert.x509, {'CN': cn})
+            self.assertEqual(cert.subjectAltName(), (False, ['DNS:%s' % cn]))
+            self.assertEqual(cert.crl_shard, None)
+            self.assertEqual(list(cert.watchers.all()), [Watcher.objects.get(mail='user@example.com')])
+
+    @override_settings(CA_KEY_CACHE=False)
+    def test_key_loaded_once(self):
+        names = ['%s.example.com' % i for i in range(3)]
+        for cn in names:
+            with open(os.path.join(self.batch_dir, '%s.csr' % cn), 'w') as stream:
+                stream.write(self.get_csr(cn))
+
+        with patch('django_ca.keys.load_pem_private_key',
+                   side_effect=serialization.load_pem_private_key) as load_mock:
+            stdout, stderr = self.cmd('sign_cert', batch=self.batch_dir, out=self.out, processes=1)
+        self.assertEqual(stderr, '')
+        self.assertSigned(stdout, names)
+        self.assertEqual(load_mock.call_count, 1)
+
+    def test_mixed_formats(self):
+        # The format is given by the file extension, --csr-format only applies to *.csr files
+        for cn, ext, encoding in [('a.example.com', 'pem', Encoding.PEM),
+                                  ('b.example.com', 'der', Encoding.DER),
+                                  ('c.example.com', 'csr', Encoding.DER)]:
+            with open(os.path.join(self.batch_dir, '%s.%s' % (cn, ext)), 'wb') as stream:
+                stream.write(self.create_csr({'CN': cn})[1].public_bytes(encoding))
+
+        stdout, stderr = self.cmd('sign_cert', batch=self.batch_dir, out=self.out, processes=1,
+                                  csr_format=Encoding.DER)
+        self.assertEqual(stderr, '')
+        certs = self.assertSigned(stdout, ['a.example.com', 'b.example.com', 'c.example.com'])
+        for cert, cn in zip(certs, ['a.example.com', 'b.example.com', 'c.example.com']):
+            self.assertSubject(cert.x509, {'CN': cn})
+
+    def test_tar(self):
+        path = os.path.join(self.batch_dir, 'csrs.tar.gz')
+        csr_path = os.path.join(self.batch_dir, 'example.pem')
+        der_path = os.path.join(self.batch_dir, 'example-der.der')
+        with open(csr_path, 'w') as stream:
+            stream.write(self.csr_pem)
+        with open(der_path, 'wb') as stream:
+            stream.write(self.create_csr({'CN': 'der.example.com'})[1].public_bytes(Encoding.DER))
+
+        with tarfile.open(path, 'w:gz') as tar:
+            tar.add(csr_path, arcname='csrs/example.pem')
+            tar.add(der_path, arcname='csrs/example-der.der')
+
+        stdout, stderr = self.cmd('sign_cert', batch=path, out=self.out, processes=1,
+                                  subject={'CN': 'example.com'})
+        self.assertEqual(stderr, '')
+        cert, der_cert = self.assertSigned(stdout, ['example', 'example-der'])
+        self.assertSubject(cert.x509, {'CN': 'example.com'})
+        self.assertSubject(der_cert.x509, {'CN': 'example.com'})
+
+    def test_ndjson(self):
+        jobs = [
+            {'csr': self.get_csr('a.example.com'), 'name': 'a'},
+            {'csr': self.get_csr('b.example.com'), 'subject': '/CN=example.net', 'alt': ['example.org'],
+             'profile': 'client'},
+            {'csr': self.csr_pem, 'name': '../c', 'subject': {'CN': 'c.example.com'}},
+        ]
+        stdin = six.StringIO('\n'.join([json.dumps(j) for j in jobs]) + '\n\n')
+
+        stdout, stderr = self.cmd('sign_cert', batch='-', out=self.out, processes=2, stdin=stdin)
+        self.assertEqual(stderr, '')
+        a, b, c = self.assertSigned(stdout, ['a', '2', 'c'])
+
+        self.assertSubject(a.x509, {'CN': 'a.example.com'})
+        self.assertSubject(b.x509, {'CN': 'example.net'})
+        self.assertEqual(b.subjectAltName(), (False, ['DNS:example.net', 'DNS:example.org']))
+        self.assertEqual(b.extendedKeyUsage(), (False, ['clientAuth']))
+        self.assertSubject(c.x509, {'CN': 'c.example.com'})
+
+    def test_errors(self):
+        path = os.path.join(self.batch_dir, 'jobs.json')
+        with open(path, 'w') as stream:
+            stream.write('%s\n' % json.dumps({'csr': self.get_csr('a.example.com'), 'name': 'a'}))
+            stream.write('%s\n' % json.dumps({'csr': self.csr_pem, 'name': 'no-cn'}))
+            stream.write('%s\n' % json.dumps({'csr': self.csr_pem, 'profile': 'foo'}))
+            stream.write('%s\n' % json.dumps({'name': 'no-csr'}))
+            stream.write('foobar\n')
+
+        with self.assertRaisesRegex(CommandError, r'^4 of 5 CSRs could not be signed\.$'):
+            self.cmd('sign_cert', batch=path, out=self.out, processes=1)
+
+        stdout, stderr = six.StringIO(), six.StringIO()
+        out = tempfile.mkdtemp(dir=ca_settings.CA_DIR)
+        with self.assertRaises(CommandError):
+            self.cmd('sign_cert', batch=path, out=out, processes=1, stdout=stdout, stderr=stderr)
+        errors = stderr.getvalue().splitlines()
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(errors[0], '3: foo: Unknown profile.')
+        self.assertEqual(errors[1], 'line 4: Job must be a JSON object with at least a "csr" key.')
+        self.assertTrue(errors[2].startswith('line 5: '))  # message depends on the Python version
+        self.assertEqual(errors[3],
+                         'no-cn: CSR does not contain a CommonName, pass a subject or subjectAltNames.')
+        self.assertEqual(Certificate.objects.count(), 2)
+
+    def test_duplicate_names(self):
+        path = os.path.join(self.batch_dir, 'csrs.tar')
+        for name in ['a', 'b']:
+            csr_path = os.path.join(self.batch_dir, '%s.csr' % name)
+            with open(csr_path, 'w') as stream:
+                stream.write(self.get_csr('%s.example.com' % name))
+        with tarfile.open(path, 'w') as tar:
+            tar.add(os.path.join(self.batch_dir, 'a.csr'), arcname='a/example.csr')
+            tar.add(os.path.join(self.batch_dir, 'b.csr'), arcname='b/example.csr')
+
+        stdout, stderr = six.StringIO(), six.StringIO()
+        with self.assertRaisesRegex(CommandError, r'^1 of 2 CSRs could not be signed\.$'):
+            self.cmd('sign_cert', batch=path, out=self.out, processes=1, stdout=stdout, stderr=stderr)
+        self.assertEqual(stderr.getvalue(),
+                         'example: Duplicate name, another CSR is written to example.pem.\n')
+        cert, = self.assertSigned(stdout.getvalue(), ['example'])
+        self.assertSubject(cert.x509, {'CN': 'a.example.com'})
+
+    def test_existing_file(self):
+        with open(os.path.join(self.out, 'a.pem'), 'w') as stream:
+            stream.write('foo')
+        jobs = [{'csr': self.get_csr('a.example.com'), 'name': 'a'}, {'csr': self.csr_pem, 'name': 'a'}]
+        stdin = six.StringIO('\n'.join([json.dumps(j) for j in jobs]))
+
+        stdout, stderr = six.StringIO(), six.StringIO()
+        with self.assertRaisesRegex(CommandError, r'^2 of 2 CSRs could not be signed\.$'):
+            self.cmd('sign_cert', batch='-', out=self.out, processes=1, stdin=stdin, stdout=stdout,
+                     stderr=stderr)
+        self.assertEqual(stderr.getvalue(), 'a: a.pem: File exists.\n' * 2)
+        with open(os.path.join(self.out, 'a.pem')) as stream:
+            self.assertEqual(stream.read(), 'foo')
+        self.assertEqual(Certificate.objects.count(), 0)
+
+    def test_save_error(self):
+        stdin = six.StringIO(json.dumps({'csr': self.get_csr('a.example.com'), 'name': 'a'}))
+
+        # No certificate is written if certificates cannot be stored
+        with patch.object(Certificate.objects, 'bulk_save', side_effect=Exception('foo')), \
+                self.assertRaisesRegex(CommandError, r'^foo$'):
+            self.cmd('sign_cert', batch='-', out=self.out, processes=1, stdin=stdin)
+        self.assertEqual(os.listdir(self.out), [])
+
+    def test_write_error(self):
+        jobs = [{'csr': self.get_csr('a.example.com'), 'name': 'a'},
+                {'csr': self.get_csr('b.example.com'), 'name': 'b'}]
+        stdin = six.StringIO('\n'.join([json.dumps(j) for j in jobs]))
+
+        # Certificates are stored even if they cannot be written, so they can still be revoked
+        stdout, stderr = six.StringIO(), six.StringIO()
+        with patch('django_ca.management.commands.sign_cert.open', create=True,
+                   side_effect=IOError('Disk full')), \
+                self.assertRaisesRegex(CommandError, r'^2 of 2 certificates could not be written\.$'):
+            self.cmd('sign_cert', batch='-', out=self.out, processes=1, stdin=stdin, stdout=stdout,
+                     stderr=stderr)
+        self.assertEqual(stderr.getvalue(), 'a: a.pem: Disk full\nb: b.pem: Disk full\n')
+        self.assertEqual(Certificate.objects.count(), 2)
+
+    def test_wrong_arguments(self):
+        msg = r'^--out must name an existing directory in batch mode\.$'
+        with self.assertRaisesRegex(CommandError, msg):
+            self.cmd('sign_cert', batch=self.batch_dir)
+        with self.assertRaisesRegex(CommandError, msg):
+            self.cmd('sign_cert', batch=self.batch_dir, out=os.path.join(self.out, 'foo'))
+
+        with self.assertRaisesRegex(CommandError, r'^--processes must be at least 1\.$'):
+            self.cmd('sign_cert', batch=self.batch_dir, out=self.out, processes=0)
+
+        path = os.path.join(self.batch_dir, 'foo')
+        with self.assertRaisesRegex(CommandError, r'^%s: No such file or directory\.$' % path):
+            self.cmd('sign_cert', batch=path, out=self.out, processes=1)
+
+        self.assertEqual(Certificate.objects.count(), 0)
+
+
+@override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
+class SignCertServeTestCase(DjangoCAWithCSRTestCase):
+    def serve(self, *jobs, **kwargs):
+        stdin = six.StringIO(''.join(['%s\n' % (j if isinstance(j, str) else json.dumps(j)) for j in jobs]))
+        stdout, stderr = self.cmd('sign_cert', serve=True, stdin=stdin, **kwargs)
+        self.assertEqual(stderr, '')
+        return [json.loads(line) for line in stdout.splitlines()]
+
+    def test_basic(self):
+        csr = self.create_csr({'CN': 'b.example.com'})[1].public_bytes(Encoding.PEM).decode('utf-8')
+        responses = self.serve(
+            {'id': 1, 'csr': self.csr_pem, 'alt': ['a.example.com'], 'watch': ['user@example.net']},
+            '',
+            {'id': 'b', 'csr': csr, 'profile': 'client'},
+            watch=['user@example.com'],
+        )
+        self.assertEqual([r['id'] for r in responses], [1, 'b'])
+
+        a = Certificate.objects.get(pub=responses[0]['cert'])
+        self.assertEqual(responses[0], {'id': 1, 'serial': a.serial, 'cert': a.pub})
+        self.assertSignature([self.ca], a)
+        self.assertSubject(a.x509, {'CN': 'a.example.com'})
+        self.assertEqual(sorted([w.mail for w in a.watchers.all()]), ['user@example.com', 'user@example.net'])
+
+        b = Certificate.objects.get(pub=responses[1]['cert'])
+        self.assertEqual(responses[1], {'id': 'b', 'serial': b.serial, 'cert': b.pub})
+        self.assertSubject(b.x509, {'CN': 'b.example.com'})
+        self.assertEqual(b.extendedKeyUsage(), (False, ['clientAuth']))
+        self.assertEqual([w.mail for w in b.watchers.all()], ['user@example.com'])
+
+    def test_errors(self):
+        responses = self.serve(
+            'foobar',
+            {'id': 1},
+            {'id': 2, 'csr': self.csr_pem},
+            {'id': 3, 'csr': self.csr_pem, 'alt': ['example.com'], 'profile': 'foo'},
+            {'id': 4, 'csr': 'foobar', 'alt': ['example.com']},
+            {'id': 5, 'csr': self.csr_pem, 'alt': ['example.com']},
+        )
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(responses[0]['id'], None)
+        self.assertIn('error', responses[0])
+        self.assertEqual(responses[1],
+                         {'id': 1, 'error': 'Job must be a JSON object with at least a "csr" key.'})
+        self.assertEqual(responses[2], {
+            'id': 2, 'error': 'CSR does not contain a CommonName, pass a subject or subjectAltNames.'})
+        self.assertEqual(responses[3], {'id': 3, 'error': 'foo: Unknown profile.'})
+        self.assertEqual(responses[4]['id'], 4)
+        self.assertIn('error', responses[4])
+
+        # errors do not stop the process
+        cert = Certificate.objects.get()
+        self.assertEqual(responses[5], {'id': 5, 'serial': cert.serial, 'cert': cert.pub})
+
+    @patch('django_ca.management.commands.sign_cert.timezone')
+    def test_expires(self, tz_mock):
+        # Certificates expire relative to the time of the request, not when the process was started
+        now = datetime.utcnow().replace(second=0, microsecond=0)
+        tz_mock.now.side_effect = [now, now + timedelta(days=30)]
+        cert = Certificate.objects.get(pub=self.serve({'csr': self.csr_pem, 'alt': ['example.com']},
+                                                      expires=now + timedelta(days=10))[0]['cert'])
+        self.assertEqual(cert.expires, now + timedelta(days=40))
+
+        # The certificate would outlive the CA at the time of the request
+        request_time = now + timedelta(days=5)
+        tz_mock.now.side_effect = [now, request_time, request_time]
+        self.assertEqual(self.serve({'id': 1, 'csr': self.csr_pem}, expires=self.ca.expires), [{
+            'id': 1, 'error': 'Certificate would outlive CA, maximum expiry for this CA is %s days.' % (
+                self.ca.expires - request_time).days}])
+
+    def test_ca_state(self):
+        # The state of the CA is loaded from the database for every request
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        job = {'id': 1, 'csr': self.csr_pem, 'alt': ['example.com']}
+
+        CertificateAuthority.objects.filter(pk=ca.pk).update(enabled=False)
+        self.assertEqual(self.serve(job, ca=ca),
+                         [{'id': 1, 'error': '%s: Certificate authority is disabled.' % ca.serial}])
+
+        CertificateAuthority.objects.filter(pk=ca.pk).update(enabled=True, revoked=True)
+        self.assertEqual(self.serve(job, ca=ca),
+                         [{'id': 1, 'error': '%s: Certificate authority is revoked.' % ca.serial}])
+        self.assertEqual(Certificate.objects.count(), 0)
+
+    @override_settings(CA_KEY_CACHE=False)
+    def test_key_loaded_once(self):
+        # The private key is not loaded for every request, even if it is not cached per process
+        jobs = [{'id': i, 'csr': self.csr_pem, 'alt': ['%s.example.com' % i]} for i in range(3)]
+        with patch('django_ca.keys.load_pem_private_key',
+                   side_effect=serialization.load_pem_private_key) as load_mock:
+            self.serve(jobs[0])
+            single = load_mock.call_count
+            load_mock.reset_mock()
+            self.assertEqual(len([r for r in self.serve(*jobs) if 'cert' in r]), 3)
+        self.assertEqual(load_mock.call_count, single)
+
+    def test_wrong_arguments(self):
+        with self.assertRaisesRegex(CommandError, r'^--serve and --batch are mutually exclusive\.$'):
+            self.cmd('sign_cert', serve=True, batch='-')
+
+
 @override_tmpcadir(CA_MIN_KEY_SIZE=1024, CA_PROFILES={}, CA_DEFAULT_SUBJECT={})
 class SignCertChildCATestCase(DjangoCAWithCSRTestCase):
     @classmethod
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+
+from mock import patch
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from .. import ca_settings
+from .. import keys
+from ..keys import evict_private_key
+from ..keys import load_private_key
+from ..models import CertificateAuthority
+from ..ocsp import get_ca_by_serial_or_cn
+from .base import DjangoCAWithCATestCase
+from .base import override_settings
+from .base import override_tmpcadir
+
+
+@override_tmpcadir()
+class PrivateKeyCacheTestCase(DjangoCAWithCATestCase):
+    def setUp(self):
+        super(PrivateKeyCacheTestCase, self).setUp()
+        evict_private_key()
+        self.path = os.path.join(tempfile.mkdtemp(dir=ca_settings.CA_DIR), 'test.key')
+        self.write_key(b'foobar')
+
+    def tearDown(self):
+        super(PrivateKeyCacheTestCase, self).tearDown()
+        evict_private_key()
+
+    def write_key(self, password):
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=1024,
+                                                    backend=default_backend())
+        if password is None:
+            encryption = serialization.NoEncryption()
+        else:
+            encryption = serialization.BestAvailableEncryption(password)
+
+        with open(self.path, 'wb') as stream:
+            stream.write(self.private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, encryption))
+
+    def assertKey(self, key, expected=None):
+        if expected is None:
+            expected = self.private_key
+        self.assertEqual(key.private_numbers(), expected.private_numbers())
+
+    def load(self, password=b'foobar', serial='AB:CD'):
+        loader = serialization.load_pem_private_key
+        with patch('django_ca.keys.load_pem_private_key', side_effect=loader) as load_mock:
+            key = load_private_key(serial, self.path, password)
+        return key, load_mock.call_count
+
+    def test_basic(self):
+        key, calls = self.load()
+        self.assertKey(key)
+        self.assertEqual(calls, 1)
+
+        cached, calls = self.load()
+        self.assertIs(cached, key)
+        self.assertEqual(calls, 0)
+
+        # Other CAs are cached separately
+        other, calls = self.load(serial='12:34')
+        self.assertIsNot(other, key)
+        self.assertEqual(calls, 1)
+
+    def test_ca(self):
+        self.assertEqual(len(keys._key_cache), 0)
+
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        key = ca.key(None)
+        self.assertEqual(list(keys._key_cache), [(ca.serial, ca.private_key_path)])
+
+        # Another instance of the same CA gets the cached key
+        self.assertIs(CertificateAuthority.objects.get(pk=self.ca.pk).key(None), key)
+
+    def test_evict_ca(self):
+        # CAs used by the OCSP responder are cached per process
+        ca = get_ca_by_serial_or_cn(self.ca.serial)
+        key = ca.key(None)
+        self.assertIs(get_ca_by_serial_or_cn(self.ca.serial), ca)
+
+        # The instance does not keep the key after it is evicted
+        evict_private_key(ca.serial)
+        self.assertEqual(keys._key_cache, {})
+        with patch('django_ca.keys.load_pem_private_key', side_effect=serialization.load_pem_private_key) \
+                as load_mock:
+            self.assertIsNot(ca.key(None), key)
+        self.assertEqual(load_mock.call_count, 1)
+
+    def test_modified(self):
+        key, calls = self.load()
+        self.write_key(None)
+        os.utime(self.path, (0, 0))  # make sure that the mtime changes
+
+        key, calls = self.load(password=None)
+        self.assertKey(key)
+        self.assertEqual(calls, 1)
+
+    def test_password(self):
+        key = self.load()[0]
+
+        # A cached key is not returned with a different password
+        with self.assertRaises(TypeError):
+            self.load(password=None)
+        with self.assertRaises(ValueError):
+            self.load(password=b'wrong')
+
+        # ... failed attempts did not remove the key from the cache
+        self.assertEqual(self.load(), (key, 0))
+
+    def test_timeout(self):
+        with patch('django_ca.keys.time.time', return_value=1000):
+            key = self.load()[0]
+        with patch('django_ca.keys.time.time', return_value=1000 + ca_settings.CA_KEY_CACHE_TIMEOUT - 1):
+            self.assertEqual(self.load(), (key, 0))
+        with patch('django_ca.keys.time.time', return_value=1000 + ca_settings.CA_KEY_CACHE_TIMEOUT):
+            self.assertEqual(self.load()[1], 1)
+
+    @override_settings(CA_KEY_CACHE_TIMEOUT=None)
+    def test_no_timeout(self):
+        with patch('django_ca.keys.time.time', return_value=1000):
+            key = self.load()[0]
+        with patch('django_ca.keys.time.time', return_value=10 ** 10):
+            self.assertEqual(self.load(), (key, 0))
+
+    @override_settings(CA_KEY_CACHE=False)
+    def test_disabled(self):
+        self.assertEqual(self.load()[1], 1)
+        self.assertEqual(self.load()[1], 1)
+        self.assertEqual(keys._key_cache, {})
+
+    def test_evict(self):
+        self.load()
+        self.load(serial='12:34')
+
+        evict_private_key('12:34')
+        self.assertEqual(list(keys._key_cache), [('AB:CD', self.path)])
+        self.assertEqual(self.load()[1], 0)
+        self.assertEqual(self.load(serial='12:34')[1], 1)
+
+        evict_private_key()
+        self.assertEqual(keys._key_cache, {})
+        self.assertEqual(self.load()[1], 1)
+
+    def test_removed(self):
+        self.load()
+        os.remove(self.path)
+
+        with self.assertRaises(OSError):
+            self.load()
+        self.assertEqual(keys._key_cache, {})
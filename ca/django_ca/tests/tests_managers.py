@@ -13,12 +13,20 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+from mock import patch
+
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from ..models import Certificate
 from ..models import CertificateAuthority
+from ..models import Watcher
 from ..utils import get_cert_profile_kwargs
 from .base import DjangoCAWithCSRTestCase
+from .base import override_settings
 from .base import override_tmpcadir
 
 
@@ -185,6 +193,64 @@ class GetCertTestCase(DjangoCAWithCSRTestCase):
         expected = ['Full Name: URI:%s' % url for url in ca.crl_url.splitlines()]
         self.assertEqual(self.get_extensions(cert.x509)['crlDistributionPoints'], (False, expected))
 
+    def test_crl_shards(self):
+        ca = CertificateAuthority.objects.first()
+        ca.crl_url = 'http://crl.example.com/{shard}/'
+        ca.crl_shards = 4
+
+        kwargs = get_cert_profile_kwargs()
+        cert = Certificate.objects.init(
+            ca, self.csr_pem, expires=self.expires(720), algorithm=hashes.SHA256(),
+            subjectAltName=['example.com'], **kwargs)
+        self.assertEqual(cert.crl_shard, cert.x509.serial_number % 4)
+        self.assertEqual(self.get_extensions(cert.x509)['crlDistributionPoints'],
+                         (False, ['Full Name: URI:http://crl.example.com/%s/' % cert.crl_shard]))
+
+    def test_delta_crl(self):
+        ca = CertificateAuthority.objects.first()
+        ca.delta_crl_url = 'http://crl.example.com/delta/'
+
+        kwargs = get_cert_profile_kwargs()
+        cert = Certificate.objects.init(
+            ca, self.csr_pem, expires=self.expires(720), algorithm=hashes.SHA256(),
+            subjectAltName=['example.com'], **kwargs)
+        self.assertEqual(self.get_extensions(cert.x509)['freshestCRL'],
+                         (False, ['Full Name: URI:http://crl.example.com/delta/']))
+
+        # Delta CRLs cover all certificates, so certificates in a shard do not refer to them
+        ca.crl_url = 'http://crl.example.com/{shard}/'
+        ca.crl_shards = 4
+        kwargs = get_cert_profile_kwargs()
+        cert = Certificate.objects.init(
+            ca, self.csr_pem, expires=self.expires(720), algorithm=hashes.SHA256(),
+            subjectAltName=['example.com'], **kwargs)
+        self.assertNotIn('freshestCRL', self.get_extensions(cert.x509))
+
+    def test_ca_extension_template(self):
+        ca = CertificateAuthority.objects.first()
+        template = Certificate.objects.get_ca_extension_template(ca)
+        self.assertEqual(template, (tuple(Certificate.objects.get_ca_extensions(ca)), ))
+
+        # Other instances of the same CA get the same template
+        with patch.object(Certificate.objects, 'get_ca_extensions') as get_mock:
+            self.assertIs(Certificate.objects.get_ca_extension_template(CertificateAuthority.objects.first()),
+                          template)
+        self.assertEqual(get_mock.call_count, 0)
+
+        # Changed fields result in a new template, even if the CA is not saved
+        ca.crl_url = 'http://crl.example.com/{shard}/'
+        ca.crl_shards = 2
+        sharded = Certificate.objects.get_ca_extension_template(ca)
+        self.assertEqual(sharded, tuple(tuple(Certificate.objects.get_ca_extensions(ca, shard=s))
+                                        for s in range(2)))
+        self.assertIsNot(Certificate.objects.get_ca_extension_template(ca), template)
+
+        # Saving the CA removes old templates
+        ca.save()
+        with patch.object(Certificate.objects, 'get_ca_extensions', return_value=[]) as get_mock:
+            self.assertEqual(Certificate.objects.get_ca_extension_template(ca), ((), ()))
+        self.assertEqual(get_mock.call_count, 2)
+
     def test_issuer_alt_name(self):
         ca = CertificateAuthority.objects.first()
         ca.issuer_alt_name = 'http://ian.example.com'
@@ -227,3 +293,65 @@ class GetCertTestCase(DjangoCAWithCSRTestCase):
 
         self.assertEqual(self.get_extensions(cert.x509)['authorityInfoAccess'],
                          (False, ['CA Issuers - URI:%s' % ca.issuer_url]))
+
+    def test_bulk_init(self):
+        ca = CertificateAuthority.objects.first()
+        ca.crl_url = 'http://crl.example.com/{shard}/'
+        ca.crl_shards = 2
+        watcher = Watcher.from_addr('user@example.com')
+        requests = [
+            {'csr': self.csr_pem, 'subjectAltName': ['a.example.com'], 'watchers': [watcher]},
+            {'csr': self.csr_pem, 'subjectAltName': ['b.example.com'], 'profile': 'client'},
+            {'csr': self.csr_pem, 'subjectAltName': ['c.example.com'], 'algorithm': hashes.SHA512()},
+        ]
+
+        with CaptureQueriesContext(connection) as context:
+            certs = Certificate.objects.bulk_init(ca, requests, expires=self.expires(720),
+                                                  algorithm=hashes.SHA256())
+
+        # The number of queries does not depend on the number of certificates
+        with CaptureQueriesContext(connection) as context2:
+            Certificate.objects.bulk_init(ca, requests * 2, expires=self.expires(720),
+                                          algorithm=hashes.SHA256())
+        self.assertEqual(len(context.captured_queries), len(context2.captured_queries))
+
+        self.assertEqual([c.cn for c in certs], ['a.example.com', 'b.example.com', 'c.example.com'])
+        for cert in certs:
+            self.assertEqual(Certificate.objects.get(pk=cert.pk).serial, cert.serial)
+            self.assertEqual(cert.crl_shard, cert.x509.serial_number % 2)
+            self.assertEqual(self.get_extensions(cert.x509)['crlDistributionPoints'],
+                             (False, ['Full Name: URI:http://crl.example.com/%s/' % cert.crl_shard]))
+
+        self.assertEqual(list(certs[0].watchers.all()), [watcher])
+        self.assertEqual(list(certs[1].watchers.all()), [])
+        self.assertEqual(self.get_extensions(certs[1].x509)['extendedKeyUsage'], (False, ['clientAuth']))
+        self.assertIsInstance(certs[0].x509.signature_hash_algorithm, hashes.SHA256)
+        self.assertIsInstance(certs[2].x509.signature_hash_algorithm, hashes.SHA512)
+
+    @override_settings(CA_KEY_CACHE=False)
+    def test_bulk_init_key_loaded_once(self):
+        ca = CertificateAuthority.objects.first()
+        requests = [{'csr': self.csr_pem, 'subjectAltName': ['%s.example.com' % i]} for i in range(3)]
+
+        with patch('django_ca.keys.load_pem_private_key',
+                   side_effect=serialization.load_pem_private_key) as load_mock:
+            certs = Certificate.objects.bulk_init(ca, requests, expires=self.expires(720),
+                                                  algorithm=hashes.SHA256())
+        self.assertEqual(len(certs), 3)
+        self.assertEqual(load_mock.call_count, 1)
+
+    @override_settings(CA_DEFAULT_SUBJECT={'C': 'AT', 'O': 'MyOrg', 'OU': 'MyOrgUnit'})
+    def test_bulk_init_profile_subject(self):
+        # The subject is merged into the subject of the profile, like "manage.py sign_cert" does
+        ca = CertificateAuthority.objects.first()
+        requests = [
+            {'csr': self.csr_pem, 'profile': 'webserver', 'subject': {'CN': 'a.example.com', 'OU': 'Other'}},
+            {'csr': self.csr_pem, 'profile': 'webserver', 'subject': {'CN': 'b.example.com', 'C': ''}},
+            {'csr': self.csr_pem, 'profile': 'webserver', 'subjectAltName': ['c.example.com']},
+        ]
+        certs = Certificate.objects.bulk_init(ca, requests, expires=self.expires(720),
+                                              algorithm=hashes.SHA256())
+
+        self.assertSubject(certs[0].x509, {'C': 'AT', 'O': 'MyOrg', 'OU': 'Other', 'CN': 'a.example.com'})
+        self.assertSubject(certs[1].x509, {'O': 'MyOrg', 'OU': 'MyOrgUnit', 'CN': 'b.example.com'})
+        self.assertSubject(certs[2].x509, {'C': 'AT', 'O': 'MyOrg', 'OU': 'MyOrgUnit', 'CN': 'c.example.com'})
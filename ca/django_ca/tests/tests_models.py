@@ -17,6 +17,7 @@ from django.core.exceptions import ValidationError
 from django.test import TestCase
 
 from ..models import Certificate
+from ..models import CertificateAuthority
 from ..models import Watcher
 from .base import DjangoCAWithCertTestCase
 from .base import cert2_pubkey
@@ -213,6 +214,49 @@ class CertificateTests(DjangoCAWithCertTestCase):
     def test_nameConstraints(self):
         self.assertEqual(self.ca.nameConstraints(), None)
 
+    def test_get_next_crl_number(self):
+        self.assertEqual(self.ca.get_next_crl_number(), 1)
+        self.assertEqual(self.ca.get_next_crl_number(), 2)
+        self.assertEqual(self.ca.crl_number, 2)
+
+        # the number is incremented in the database, not based on the (possibly outdated) instance
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        self.assertEqual(ca.crl_number, 2)
+        self.ca.crl_number = 0
+        self.assertEqual(self.ca.get_next_crl_number(), 3)
+
+    def test_get_crl_shards(self):
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        self.assertEqual(ca.get_crl_shards(), [])
+        ca.crl_shards = 2
+        self.assertEqual(ca.get_crl_shards(), [0, 1])
+
+        # shards of existing certificates are included after reducing the number of shards
+        Certificate.objects.filter(pk=self.cert.pk).update(crl_shard=3)
+        ca.crl_shards = 1
+        self.assertEqual(ca.get_crl_shards(), [0, 3])
+        ca.crl_shards = 0
+        self.assertEqual(ca.get_crl_shards(), [3])
+
+    def test_clean_crl_url(self):
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        ca.crl_url = 'http://crl.example.com/{shard}/'
+        with self.assertRaises(ValidationError) as cm:
+            ca.clean()
+        self.assertEqual(list(cm.exception.message_dict), ['crl_url'])
+
+        ca.crl_shards = 2
+        ca.clean()
+
+        # all CRL URLs must contain the shard if the CRL is partitioned
+        ca.crl_url = 'http://crl.example.com/{shard}/\nhttp://crl.example.com/'
+        with self.assertRaises(ValidationError) as cm:
+            ca.clean()
+        self.assertEqual(list(cm.exception.message_dict), ['crl_url'])
+
+        ca.crl_shards = 1
+        ca.clean()
+
     def test_hpkp_pin(self):
 
         # get hpkp pins using
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import base64
+import os
+import socket
+import threading
+import unittest
+from datetime import timedelta
+
+from mock import patch
+
+import asn1crypto
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .. import ca_settings
+from .. import ocsp
+from ..models import Certificate
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+from .tests_views_ocsp import OCSPViewTestMixin
+from .tests_views_ocsp import req1
+from .tests_views_ocsp import req1_nonce
+from .tests_views_ocsp import unknown_req
+
+try:
+    from .. import ocsp_server
+except ImportError:  # pragma: only py2
+    ocsp_server = None
+
+
+@unittest.skipIf(ocsp_server is None, 'asyncio is not available.')
+@override_tmpcadir()
+class OCSPServerTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(OCSPServerTestCase, self).setUp()
+        self.index = os.path.join(ca_settings.CA_DIR, 'ocsp.index')
+        self.crl_dir = os.path.join(ca_settings.CA_DIR, 'crl')
+        if not os.path.exists(self.crl_dir):
+            os.mkdir(self.crl_dir)
+        self.cmd('dump_ocsp_index', self.index, ca=self.ca)
+        self.cmd('dump_crl', os.path.join(self.crl_dir, 'root.crl'), ca=self.ca)
+
+    def responder(self):
+        return ocsp_server.OCSPResponder(
+            self.ca.pub, responder_key=settings.OCSP_KEY_PATH, responder_cert=settings.OCSP_PEM_PATH,
+            index=self.index, crl_dir=self.crl_dir)
+
+    def assertResponse(self, result, requested, nonce=None):
+        status, headers, content = result
+        self.assertEqual(status, 200)
+        self.assertOCSP(HttpResponse(content, content_type=headers['Content-Type']), requested=requested,
+                        nonce=nonce)
+
+    def test_post(self):
+        self.assertResponse(self.responder().handle('POST', '/ocsp/', req1), [self.cert], nonce=req1_nonce)
+
+    def test_get(self):
+        data = base64.b64encode(req1).decode('utf-8')
+        result = self.responder().handle('GET', '/ocsp/%s' % data, b'')
+        self.assertResponse(result, [self.cert], nonce=req1_nonce)
+
+        # responses with a nonce must not be cached by proxies
+        self.assertEqual(result[1]['Cache-Control'], 'private, no-cache')
+
+    def test_get_no_nonce(self):
+        req = asn1crypto.ocsp.OCSPRequest({'tbs_request': {'request_list': [
+            {'req_cert': ocsp.get_cert_id(ocsp.load_pem_certificate(self.ca.pub), self.cert.serial)},
+        ]}})
+        data = base64.b64encode(req.dump()).decode('utf-8')
+        result = self.responder().handle('GET', '/ocsp/%s' % data, b'')
+        self.assertEqual(result[0], 200)
+        self.assertEqual(result[1]['Cache-Control'], 'max-age=600, public, no-transform, must-revalidate')
+
+        # failed responses are not cacheable
+        result = self.responder().handle('GET', '/ocsp/%s' % base64.b64encode(b'foo').decode('utf-8'), b'')
+        self.assertEqual(result[1]['Cache-Control'], 'private, no-cache')
+
+    def test_revoked(self):
+        responder = self.responder()
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+        self.cmd('dump_ocsp_index', self.index, ca=self.ca)
+        os.utime(self.index, (0, 0))  # make sure that the mtime changes
+        responder.reload_index()
+
+        # assertOCSP() also verifies revocation date and reason
+        self.assertResponse(responder.handle('POST', '/ocsp/', req1), [self.cert], nonce=req1_nonce)
+
+    def test_expired_revoked(self):
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+        cert.expires = timezone.now() - timedelta(days=3)
+        cert.save()
+        self.cmd('dump_ocsp_index', self.index, ca=self.ca)
+        with open(self.index) as stream:
+            self.assertTrue(stream.read().startswith('E\t'))
+
+        responder = self.responder()
+        self.assertEqual(responder.index[cert.x509.serial_number][0], 'key_compromise')
+
+        # assertOCSP() also verifies revocation date and reason
+        self.assertResponse(responder.handle('POST', '/ocsp/', req1), [self.cert], nonce=req1_nonce)
+
+    def test_snapshot(self):
+        snapshot = os.path.join(ca_settings.CA_DIR, 'ocsp.snapshot')
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+        self.cmd('dump_ocsp_snapshot', snapshot, ca=self.ca)
+
+        responder = ocsp_server.OCSPResponder(
+            self.ca.pub, responder_key=settings.OCSP_KEY_PATH, responder_cert=settings.OCSP_PEM_PATH,
+            index=snapshot)
+        self.assertIsInstance(responder.index, ocsp_server.Snapshot)
+        self.assertResponse(responder.handle('POST', '/ocsp/', req1), [self.cert], nonce=req1_nonce)
+
+    def test_unknown(self):
+        req = asn1crypto.ocsp.OCSPRequest({'tbs_request': {'request_list': [
+            {'req_cert': ocsp.get_cert_id(ocsp.load_pem_certificate(self.ca.pub), '12:34')},
+        ]}})
+        status, headers, content = self.responder().handle('POST', '/ocsp/', req.dump())
+        self.assertEqual(status, 200)
+        response = asn1crypto.ocsp.OCSPResponse.load(content)
+        responses = response['response_bytes']['response'].parsed['tbs_response_data']['responses']
+        self.assertEqual([r['cert_status'].name for r in responses], ['unknown'])
+
+    def test_unknown_ca(self):
+        # request was created for a different CA
+        status, headers, content = self.responder().handle('POST', '/ocsp/', unknown_req)
+        self.assertEqual(status, 200)
+        self.assertEqual(asn1crypto.ocsp.OCSPResponse.load(content)['response_status'].native,
+                         'unauthorized')
+
+    def test_errors(self):
+        responder = self.responder()
+        status, headers, content = responder.handle('POST', '/ocsp/', b'foobar')
+        self.assertEqual(status, 200)
+        self.assertEqual(asn1crypto.ocsp.OCSPResponse.load(content)['response_status'].native,
+                         'malformed_request')
+
+        self.assertEqual(responder.handle('GET', '/ocsp/%%%', b'')[0], 400)
+        self.assertEqual(responder.handle('PUT', '/ocsp/', b'')[0], 405)
+        self.assertEqual(responder.handle('GET', '/foo', b'')[0], 404)
+        self.assertEqual(responder.handle('GET', '/crl/../ocsp.index', b'')[0], 404)
+        self.assertEqual(responder.handle('GET', '/crl/missing.crl', b'')[0], 404)
+        self.assertEqual(responder.handle('POST', '/crl/root.crl', b'')[0], 405)
+
+    def test_crl(self):
+        status, headers, content = self.responder().handle('GET', '/crl/root.crl', b'')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, {'Content-Type': 'application/pkix-crl'})
+        with open(os.path.join(self.crl_dir, 'root.crl'), 'rb') as stream:
+            self.assertEqual(content, stream.read())
+
+    def test_server(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(5)
+        port = sock.getsockname()[1]
+
+        loop = ocsp_server.asyncio.new_event_loop()
+        server = loop.run_until_complete(loop.create_server(
+            lambda: ocsp_server.HTTPProtocol(self.responder()), sock=sock))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+
+        try:
+            client = socket.create_connection(('127.0.0.1', port))
+            request = b'POST /ocsp/ HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n' % len(req1)
+
+            # two pipelined requests on the same connection, the second one closes the connection
+            close_request = request.replace(b'\r\n\r\n', b'\r\nConnection: close\r\n\r\n')
+            client.sendall(request + req1 + close_request + req1)
+            data = b''
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+            client.close()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+        self.assertEqual(data.count(b'HTTP/1.1 200 OK\r\n'), 2)
+        response = data.split(b'HTTP/1.1 200 OK\r\n')[2]
+        head, content = response.split(b'\r\n\r\n', 1)
+        self.assertIn(b'Connection: close', head)
+        self.assertOCSP(HttpResponse(content, content_type='application/ocsp-response'),
+                        requested=[self.cert], nonce=req1_nonce)
+
+    def test_command(self):
+        with patch('django_ca.ocsp_server.serve') as serve_mock:
+            stdout, stderr = self.cmd(
+                'ocsp_server', '--index', self.index, '--responder-key', settings.OCSP_KEY_PATH,
+                '--responder-cert', settings.OCSP_PEM_PATH, ca=self.ca, port=0, processes=1)
+        self.assertEqual(stdout, 'Listening on 127.0.0.1:0 with 1 process(es)...\n')
+        self.assertEqual(serve_mock.call_count, 1)
+        serve_mock.call_args[0][1].close()
+
+        with self.assertRaisesRegex(CommandError, r'^/does/not/exist: File not found\.$'):
+            self.cmd('ocsp_server', '--index', '/does/not/exist', '--responder-key',
+                     settings.OCSP_KEY_PATH, '--responder-cert', settings.OCSP_PEM_PATH, ca=self.ca)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of django-ca (https://github.com/mathiasertl/django-ca).
+#
+# django-ca is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# django-ca is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with django-ca.  If not,
+# see <http://www.gnu.org/licenses/>.
+
+import base64
+import os
+from datetime import datetime
+
+import asn1crypto
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from .. import ca_settings
+from ..models import Certificate
+from ..snapshot import Snapshot
+from ..snapshot import get_snapshot
+from ..snapshot import is_snapshot
+from ..snapshot import write_snapshot
+from ..views import OCSPView
+from .base import DjangoCAWithCertTestCase
+from .base import override_tmpcadir
+from .tests_views_ocsp import OCSPViewTestMixin
+from .tests_views_ocsp import req1
+from .tests_views_ocsp import req1_nonce
+
+revoked_date = datetime(2018, 1, 10, 12, 30)
+
+
+@override_tmpcadir()
+class SnapshotTestCase(DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(SnapshotTestCase, self).setUp()
+        self.path = os.path.join(ca_settings.CA_DIR, 'test.snapshot')
+
+    def test_basic(self):
+        write_snapshot(self.path, [
+            ('AB:CD', False, None, ''),
+            ('12', True, revoked_date, ''),
+            ('FF:00:11', True, revoked_date, 'key_compromise'),
+        ])
+        self.assertTrue(is_snapshot(self.path))
+
+        snapshot = Snapshot(self.path)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(snapshot.get('AB:CD'), ('good', None))
+        self.assertEqual(snapshot.get(0xabcd), ('good', None))
+        self.assertEqual(snapshot.get('12'), ('revoked', revoked_date))
+        self.assertEqual(snapshot.get('FF:00:11'), ('key_compromise', revoked_date))
+        self.assertIsNone(snapshot.get('AB:CE'))
+        self.assertIsNone(snapshot.get('00'))
+        self.assertEqual(snapshot.get('FF' * 21, 'foo'), 'foo')  # does not fit into a snapshot
+        snapshot.close()
+
+    def test_empty(self):
+        write_snapshot(self.path, [])
+        snapshot = Snapshot(self.path)
+        self.assertEqual(len(snapshot), 0)
+        self.assertIsNone(snapshot.get('AB:CD'))
+        snapshot.close()
+
+    def test_errors(self):
+        with self.assertRaisesRegex(ValueError, r'Serial does not fit into 20 bytes\.$'):
+            write_snapshot(self.path, [('FF' * 21, False, None, '')])
+        self.assertEqual([f for f in os.listdir(ca_settings.CA_DIR) if f.startswith('.snapshot-')], [])
+
+        with open(self.path, 'wb') as stream:
+            stream.write(b'foobar' * 4)
+        self.assertFalse(is_snapshot(self.path))
+        with self.assertRaisesRegex(ValueError, r': Not a revocation snapshot\.$'):
+            Snapshot(self.path)
+
+        write_snapshot(self.path, [('AB:CD', False, None, '')])
+        with open(self.path, 'ab') as stream:
+            stream.write(b'\0')
+        with self.assertRaisesRegex(ValueError, r': Snapshot is truncated\.$'):
+            Snapshot(self.path)
+
+    def test_get_snapshot(self):
+        write_snapshot(self.path, [('AB:CD', False, None, '')])
+        snapshot = get_snapshot(self.path)
+        self.assertIs(get_snapshot(self.path), snapshot)
+
+        # Replacing the file reopens the snapshot
+        write_snapshot(self.path, [('AB:CD', True, revoked_date, 'superseded')])
+        os.utime(self.path, (0, 0))  # make sure that the mtime changes
+        self.assertIsNot(get_snapshot(self.path), snapshot)
+        self.assertEqual(get_snapshot(self.path).get('AB:CD'), ('superseded', revoked_date))
+
+    def test_command(self):
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+
+        stdout, stderr = self.cmd('dump_ocsp_snapshot', self.path, ca=self.ca)
+        self.assertEqual(stdout, '')
+        self.assertEqual(stderr, '')
+
+        snapshot = Snapshot(self.path)
+        self.assertEqual(len(snapshot), 1)
+        status, date = snapshot.get(self.cert.serial)
+        self.assertEqual(status, 'key_compromise')
+        self.assertEqual(date, cert.revoked_date.replace(microsecond=0))
+        snapshot.close()
+
+        # no child CAs
+        self.cmd('dump_ocsp_snapshot', self.path, ca=self.ca, ca_ocsp=True)
+        snapshot = Snapshot(self.path)
+        self.assertEqual(len(snapshot), 0)
+        snapshot.close()
+
+
+@override_tmpcadir()
+class SnapshotViewTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(SnapshotViewTestCase, self).setUp()
+        self.path = os.path.join(ca_settings.CA_DIR, '%(serial)s.snapshot')
+        self.snapshot = self.path % {'serial': self.ca.serial.replace(':', '')}
+        self.view = OCSPView.as_view(ca=self.ca.serial, responder_key=settings.OCSP_KEY_PATH,
+                                     responder_cert=settings.OCSP_PEM_PATH, snapshot=self.path)
+
+    def tearDown(self):
+        cache.clear()
+        super(SnapshotViewTestCase, self).tearDown()
+
+    def get(self):
+        data = base64.b64encode(req1).decode('utf-8')
+        return self.view(RequestFactory().get('/ocsp/%s' % data), data=data)
+
+    def test_basic(self):
+        self.cmd('dump_ocsp_snapshot', self.snapshot, ca=self.ca)
+        self.get()  # opens the snapshot and caches the CA
+
+        # the certificate status is read from the snapshot, so there is no database query at all
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+    def test_revoked(self):
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+        self.cmd('dump_ocsp_snapshot', self.snapshot, ca=self.ca)
+
+        # assertOCSP() also verifies revocation date and reason
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+    def test_unknown(self):
+        write_snapshot(self.snapshot, [])
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        responses = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']['responses']
+        self.assertEqual([r['cert_status'].name for r in responses], ['unknown'])
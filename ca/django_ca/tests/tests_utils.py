@@ -382,6 +382,26 @@ class IntToHexTestCase(TestCase):
         self.assertEqual(utils.int_to_hex(long(1513282104)), '5A:32:DA:38')  # NOQA
 
 
+class HexToIntTestCase(TestCase):
+    def test_basic(self):
+        for i in [0, 1, 15, 16, 255, 12345678, 1513282113, 2 ** 159 - 1]:
+            self.assertEqual(utils.hex_to_int(utils.int_to_hex(i)), i)
+
+
+class GetRevokedCertificateTestCase(TestCase):
+    def test_basic(self):
+        revoked_date = datetime(2018, 1, 10, 12, 30)
+        revoked = utils.get_revoked_certificate('5A:32:DA:38', revoked_date)
+        self.assertEqual(revoked.serial_number, 1513282104)
+        self.assertEqual(revoked.revocation_date, revoked_date)
+        self.assertEqual(len(revoked.extensions), 0)
+
+    def test_reason(self):
+        revoked = utils.get_revoked_certificate('5A:32:DA:38', datetime(2018, 1, 10), 'key_compromise')
+        self.assertEqual(revoked.extensions.get_extension_for_class(x509.CRLReason).value.reason,
+                         x509.ReasonFlags.key_compromise)
+
+
 class MultilineURLValidatorTestCase(TestCase):
     def test_basic(self):
         multiline_url_validator('')
@@ -13,18 +13,34 @@
 # You should have received a copy of the GNU General Public License along with django-ca.  If not,
 # see <http://www.gnu.org/licenses/>.
 
+import os
+import time
+from datetime import timedelta
+
+from mock import patch
+
+import asn1crypto.crl
+import asn1crypto.x509
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import ExtensionOID
 
 from django.conf.urls import url
 from django.core.cache import cache
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 
+from .. import ca_settings
+from ..crl import ISSUING_DISTRIBUTION_POINT_OID
+from ..crl import get_crl_cache_key
 from ..models import Certificate
+from ..models import CertificateAuthority
 from ..views import CertificateRevocationListView
 from .base import DjangoCAWithCertTestCase
+from .base import cert2_pubkey
 from .base import override_settings
 from .base import override_tmpcadir
 
@@ -48,6 +64,10 @@ urlpatterns = [
     url(r'^crl/ca/(?P<serial>[0-9A-F:]+)/$', CertificateRevocationListView.as_view(
         ca_crl=True, type=Encoding.PEM
     ), name='ca_crl'),
+    url(r'^crl/(?P<serial>[0-9A-F:]+)/delta/$', CertificateRevocationListView.as_view(delta=True),
+        name='delta'),
+    url(r'^crl/(?P<serial>[0-9A-F:]+)/shard/(?P<shard>[0-9]+)/$', CertificateRevocationListView.as_view(),
+        name='shard'),
 ]
 
 
@@ -75,13 +95,14 @@ class GenericCRLViewTests(DjangoCAWithCertTestCase):
         cert = Certificate.objects.get(serial=self.cert.serial)
         cert.revoke()
 
-        # fetch again - we should see a cached response
+        # fetch again - revoking the certificate invalidated the cached CRL
         response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/pkix-crl')
         crl = x509.load_der_x509_crl(response.content, default_backend())
         self.assertIsInstance(crl.signature_hash_algorithm, hashes.SHA512)
-        self.assertEqual(list(crl), [])
+        self.assertEqual(len(list(crl)), 1)
+        self.assertEqual(crl[0].serial_number, cert.x509.serial)
 
         # clear the cache and fetch again
         cache.clear()
@@ -97,6 +118,330 @@ class GenericCRLViewTests(DjangoCAWithCertTestCase):
     def test_basic_with_use_tz(self):
         self.test_basic()
 
+    def test_queries(self):
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('key_compromise')
+
+        # One query for revoked certificates, but the PEM of certificates is not loaded
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
+        queries = [q['sql'] for q in context.captured_queries if 'FROM "django_ca_certificate"' in q['sql']]
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"pub"', queries[0])
+
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+        self.assertEqual(crl[0].extensions.get_extension_for_class(x509.CRLReason).value.reason,
+                         x509.ReasonFlags.key_compromise)
+
+    def get_crl(self, name='default'):
+        response = self.client.get(reverse(name, kwargs={'serial': self.ca.serial}))
+        self.assertEqual(response.status_code, 200)
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        number = crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number
+        return crl, number
+
+    def revoked_after_base(self, cert):
+        # make sure that the revocation date is after the base CRL, even if the clock is frozen in tests
+        base = self.ca.crls.order_by('-number').first()
+        Certificate.objects.filter(pk=cert.pk).update(revoked_date=base.last_update + timedelta(seconds=1))
+
+    def test_delta(self):
+        # no base CRL was generated yet
+        response = self.client.get(reverse('delta', kwargs={'serial': self.ca.serial}))
+        self.assertEqual(response.status_code, 404)
+
+        base, base_number = self.get_crl()
+        self.assertEqual(list(base), [])
+        with self.assertRaises(x509.ExtensionNotFound):
+            base.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('key_compromise')
+        self.revoked_after_base(cert)
+
+        delta, number = self.get_crl('delta')
+        self.assertEqual(number, base_number + 1)
+        self.assertEqual([c.serial_number for c in delta], [cert.x509.serial])
+        indicator = delta.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertTrue(indicator.critical)
+        self.assertEqual(indicator.value.crl_number, base_number)
+
+        # A new base CRL contains the certificate, a delta CRL still refers to the oldest valid base CRL
+        cache.clear()
+        base2, base2_number = self.get_crl()
+        self.assertEqual(base2_number, number + 1)
+        self.assertEqual([c.serial_number for c in base2], [cert.x509.serial])
+        delta, number = self.get_crl('delta')
+        self.assertEqual(number, base2_number + 1)
+        indicator = delta.extensions.get_extension_for_class(x509.DeltaCRLIndicator)
+        self.assertEqual(indicator.value.crl_number, base_number)
+        self.assertEqual(self.ca.crls.count(), 2)
+
+    def test_freshest_crl(self):
+        # Without delta CRL URLs, base CRLs have no Freshest CRL extension
+        crl, number = self.get_crl()
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_oid(ExtensionOID.FRESHEST_CRL)
+
+        urls = ['http://crl.example.com/delta/', 'http://crl.example.org/delta/']
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(delta_crl_url='\n'.join(urls))
+        cache.clear()
+        crl, number = self.get_crl()
+
+        # cryptography does not support the Freshest CRL extension in CRLs
+        ext = crl.extensions.get_extension_for_oid(ExtensionOID.FRESHEST_CRL)
+        self.assertFalse(ext.critical)
+        dps = asn1crypto.x509.CRLDistributionPoints.load(ext.value.value).native
+        self.assertEqual([dp['distribution_point'] for dp in dps], [[url] for url in urls])
+
+        # Delta CRLs do not refer to themselves
+        delta, number = self.get_crl('delta')
+        with self.assertRaises(x509.ExtensionNotFound):
+            delta.extensions.get_extension_for_oid(ExtensionOID.FRESHEST_CRL)
+
+    def cache_key(self):
+        return get_crl_cache_key(self.ca.serial, Encoding.DER, hashes.SHA512())
+
+    def test_invalidate(self):
+        self.get_crl()
+        cache_key = self.cache_key()
+        self.assertIsNotNone(cache.get(cache_key))
+
+        # revoking a certificate of a different CA does not invalidate the CRL
+        child = self.create_ca(name='child', parent=self.ca)
+        cert = self.load_cert(child, x509=cert2_pubkey)
+        cert.revoke()
+        self.assertEqual(self.cache_key(), cache_key)
+
+        # revoking a certificate of this CA does, so the next request sees the revocation immediately
+        Certificate.objects.get(serial=self.cert.serial).revoke()
+        self.assertNotEqual(self.cache_key(), cache_key)
+        crl, number = self.get_crl()
+        self.assertEqual([c.serial_number for c in crl], [self.cert.x509.serial])
+
+    def test_refresh(self):
+        crl, number = self.get_crl()
+        refresh_at, cached = cache.get(self.cache_key())
+        self.assertAlmostEqual(refresh_at, time.time() + 300, delta=5)
+
+        # CRL is not yet due for refresh
+        self.assertEqual(self.get_crl()[1], number)
+
+        # CRL is due for refresh, so a new one is generated
+        cache.set(self.cache_key(), (time.time() - 1, cached), 600)
+        self.assertEqual(self.get_crl()[1], number + 1)
+        self.assertIsNone(cache.get('%s_lock' % self.cache_key()))
+
+    def test_refresh_locked(self):
+        crl, number = self.get_crl()
+        refresh_at, cached = cache.get(self.cache_key())
+
+        # Another process is generating the CRL, so the previous CRL is served
+        cache.set(self.cache_key(), (time.time() - 1, cached), 600)
+        cache.set('%s_lock' % self.cache_key(), True)
+        self.assertEqual(self.get_crl()[1], number)
+
+    def test_refresh_error(self):
+        crl, number = self.get_crl()
+        refresh_at, cached = cache.get(self.cache_key())
+        cache.set(self.cache_key(), (time.time() - 1, cached), 600)
+
+        # Errors while refreshing the CRL are logged, the previous CRL is still valid
+        with patch('django_ca.views.get_crl', side_effect=Exception('foo')), \
+                patch('django_ca.views.log') as log_mock:
+            self.assertEqual(self.get_crl()[1], number)
+        self.assertEqual(log_mock.exception.call_count, 1)
+        self.assertIsNone(cache.get('%s_lock' % self.cache_key()))
+
+    def test_wait_for_lock(self):
+        cache.set('%s_lock' % self.cache_key(), True)
+
+        # Another process is generating the CRL and finishes while we are waiting
+        def sleep(seconds):
+            artifact = {'crl': b'foobar', 'path': None, 'chunks': None, 'etag': '"foo"', 'last_update': 0,
+                        'next_update': 600}
+            cache.set(self.cache_key(), (time.time() + 300, artifact), 600)
+
+        with patch('django_ca.views.time.sleep', side_effect=sleep) as sleep_mock:
+            response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'foobar')
+        self.assertEqual(sleep_mock.call_count, 1)
+
+    def test_wait_for_lock_timeout(self):
+        cache.set('%s_lock' % self.cache_key(), True)
+
+        with patch('django_ca.views.time') as time_mock, patch('django_ca.views.log') as log_mock:
+            time_mock.time.side_effect = [0, 30, 61]
+            response = self.client.get(reverse('default', kwargs={'serial': self.ca.serial}))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(time_mock.sleep.call_count, 2)
+        self.assertEqual(log_mock.error.call_count, 1)
+
+    def test_conditional(self):
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+        self.assertIn('Expires', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # ETag takes precedence over If-Modified-Since
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"foo"', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_crl_dir(self):
+        crl_dir = os.path.join(ca_settings.CA_DIR, 'crl')
+        if not os.path.exists(crl_dir):
+            os.mkdir(crl_dir)
+        path = os.path.join(crl_dir, '%s_sha512.crl' % self.ca.serial.replace(':', ''))
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+
+        with patch.object(CertificateRevocationListView, 'crl_dir', crl_dir):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            crl = b''.join(response.streaming_content)
+            response.close()
+
+            with open(path, 'rb') as stream:
+                self.assertEqual(stream.read(), crl)
+            refresh_at, artifact = cache.get(self.cache_key())
+            self.assertIsNone(artifact['crl'])
+            self.assertEqual(artifact['path'], path)
+
+            # a missing file (e.g. if crl_dir is not shared by all hosts) is regenerated
+            os.remove(path)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(cache.get(self.cache_key())[1]['number'], artifact['number'] + 1)
+
+            with patch.object(CertificateRevocationListView, 'sendfile_header', 'X-Sendfile'):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Sendfile'], path)
+            self.assertEqual(response.content, b'')
+
+            with patch.object(CertificateRevocationListView, 'sendfile_header', 'X-Accel-Redirect'), \
+                    patch.object(CertificateRevocationListView, 'sendfile_prefix', '/internal/'):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Accel-Redirect'], '/internal/%s' % os.path.basename(path))
+            self.assertEqual(response['Content-Type'], 'application/pkix-crl')
+
+    @patch.object(CertificateRevocationListView, 'chunk_size', 100)
+    def test_chunks(self):
+        url = reverse('default', kwargs={'serial': self.ca.serial})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        crl = response.content
+
+        refresh_at, artifact = cache.get(self.cache_key())
+        self.assertIsNone(artifact['crl'])
+        self.assertEqual(len(artifact['chunks']), (len(crl) + 99) // 100)
+        self.assertEqual(cache.get(artifact['chunks'][0]), crl[:100])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), crl)
+
+        # All chunks are fetched at once
+        with patch.object(cache, 'get_many', side_effect=cache.get_many) as get_many_mock:
+            self.assertEqual(b''.join(self.client.get(url).streaming_content), crl)
+        self.assertEqual(get_many_mock.call_count, 1)
+
+        # If a chunk is missing, the CRL is regenerated instead of sending an incomplete CRL
+        cache.delete(artifact['chunks'][-1])
+        with patch('django_ca.views.log') as log_mock:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(log_mock.error.call_count, 1)
+        regenerated = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertEqual(regenerated.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number,
+                         artifact['number'] + 1)
+        self.assertEqual(cache.get(self.cache_key())[1]['number'], artifact['number'] + 1)
+
+        # Another process regenerated the CRL, but its chunks are missing as well
+        cached = cache.get(self.cache_key())[1]
+        with patch.object(CertificateRevocationListView, 'get_crl', return_value=cached), \
+                patch.object(cache, 'get_many', return_value={}), patch('django_ca.views.log') as log_mock:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(log_mock.error.call_count, 2)
+
+    @patch.object(CertificateRevocationListView, 'chunk_size', 100)
+    def test_cache_error(self):
+        # The cache backend reports that chunks could not be stored (Django 2.0+)
+        with patch.object(cache, 'set_many', return_value=['foo']), \
+                patch('django_ca.views.log') as log_mock:
+            crl, number = self.get_crl()
+        self.assertEqual(log_mock.error.call_count, 1)
+        self.assertIsNone(cache.get(self.cache_key()))
+
+        with patch.object(cache, 'set', side_effect=Exception('foo')), \
+                patch('django_ca.views.log') as log_mock:
+            self.assertEqual(self.get_crl()[1], number + 1)
+        self.assertEqual(log_mock.error.call_count, 1)
+
+    def test_shard(self):
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(
+            crl_shards=2, crl_url='http://crl.example.com/{shard}/')
+        cert = Certificate.objects.get(serial=self.cert.serial)
+        cert.revoke('key_compromise')
+        Certificate.objects.filter(pk=cert.pk).update(crl_shard=1)
+
+        response = self.client.get(reverse('shard', kwargs={'serial': self.ca.serial, 'shard': 1}))
+        self.assertEqual(response.status_code, 200)
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+
+        # cryptography does not yet know the Issuing Distribution Point extension
+        ext = crl.extensions.get_extension_for_oid(ISSUING_DISTRIBUTION_POINT_OID)
+        self.assertTrue(ext.critical)
+        idp = asn1crypto.crl.IssuingDistributionPoint.load(ext.value.value).native
+        self.assertEqual(idp['distribution_point'], ['http://crl.example.com/1/'])
+        self.assertTrue(idp['only_contains_user_certs'])
+
+        response = self.client.get(reverse('shard', kwargs={'serial': self.ca.serial, 'shard': 0}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(x509.load_der_x509_crl(response.content, default_backend())), [])
+
+        # Shards do not refer to delta CRLs
+        delta_crl_url = 'http://crl.example.com/delta/'
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(delta_crl_url=delta_crl_url)
+        cache.clear()
+        response = self.client.get(reverse('shard', kwargs={'serial': self.ca.serial, 'shard': 1}))
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_oid(ExtensionOID.FRESHEST_CRL)
+
+        # The full CRL contains all certificates and no Issuing Distribution Point
+        crl, number = self.get_crl()
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+        with self.assertRaises(x509.ExtensionNotFound):
+            crl.extensions.get_extension_for_oid(ISSUING_DISTRIBUTION_POINT_OID)
+
+        response = self.client.get(reverse('shard', kwargs={'serial': self.ca.serial, 'shard': 2}))
+        self.assertEqual(response.status_code, 404)
+
+        # If the number of shards is reduced, shards of existing certificates are still available
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(crl_shards=1)
+        cache.clear()
+        response = self.client.get(reverse('shard', kwargs={'serial': self.ca.serial, 'shard': 1}))
+        self.assertEqual(response.status_code, 200)
+        crl = x509.load_der_x509_crl(response.content, default_backend())
+        self.assertEqual([c.serial_number for c in crl], [cert.x509.serial])
+
     def test_ca_crl(self):
         child = self.create_ca(name='child', parent=self.ca)
 
@@ -110,13 +455,14 @@ class GenericCRLViewTests(DjangoCAWithCertTestCase):
         child.revoke()
         child.save()
 
-        # fetch again - we should see a cached response
+        # fetch again - revoking the child CA invalidated the cached CRL
         response = self.client.get(reverse('ca_crl', kwargs={'serial': self.ca.serial}))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'text/plain')
         crl = x509.load_pem_x509_crl(response.content, default_backend())
         self.assertIsInstance(crl.signature_hash_algorithm, hashes.SHA512)
-        self.assertEqual(len(list(crl)), 0)
+        self.assertEqual(len(list(crl)), 1)
+        self.assertEqual(crl[0].serial_number, child.x509.serial)
 
         # clear the cache and fetch again
         cache.clear()
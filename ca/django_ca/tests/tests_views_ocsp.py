@@ -14,23 +14,32 @@
 # see <http://www.gnu.org/licenses/>
 
 import base64
+import hashlib
 import logging
 import os
 from datetime import timedelta
 
+from mock import patch
+
 import asn1crypto
 from oscrypto import asymmetric
 
 from django.conf import settings
 from django.conf.urls import url
+from django.core.cache import cache
 from django.test import Client
 from django.utils.encoding import force_text
 
+from .. import ca_settings
+from .. import ocsp
 from ..models import Certificate
+from ..models import CertificateAuthority
 from ..utils import int_to_hex
 from ..views import OCSPView
 from .base import DjangoCAWithCertTestCase
+from .base import cert1_pubkey
 from .base import certs
+from .base import child_pubkey
 from .base import ocsp_pubkey
 from .base import override_settings
 
@@ -54,7 +63,6 @@ req1 = _load_req('req1')
 req1_nonce = b'5ul\xc4\xb6\xccP\xe8\xd8\xbd\x16xA \r9'
 no_nonce_req = _load_req('req-no-nonce')
 unknown_req = _load_req('unknown-serial')
-multiple_req = _load_req('multiple-serial')
 
 urlpatterns = [
     url(r'^ocsp/$', OCSPView.as_view(
@@ -90,6 +98,45 @@ urlpatterns = [
         expires=1200,
     ), name='false-key'),
 
+    url(r'^ocsp/cached/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=certs['root']['serial'],
+        responder_key=settings.OCSP_KEY_PATH,
+        responder_cert=settings.OCSP_PEM_PATH,
+        cache_responses=True,
+    ), name='cached'),
+
+    url(r'^ocsp/cached-expires/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=certs['root']['serial'],
+        responder_key=settings.OCSP_KEY_PATH,
+        responder_cert=settings.OCSP_PEM_PATH,
+        cache_responses=True,
+        expires=1200,
+    ), name='cached-expires'),
+
+    url(r'^ocsp/cached-ca-key/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=certs['root']['serial'],
+        cache_responses=True,
+    ), name='cached-ca-key'),
+
+    url(r'^ocsp/unknown-responder-cert/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=certs['root']['serial'],
+        responder_key=settings.OCSP_KEY_PATH,
+        responder_cert='AB:CD',
+    ), name='unknown-responder-cert'),
+
+    url(r'^ocsp/all/$', OCSPView.as_view(
+        responder_key=settings.OCSP_KEY_PATH,
+        responder_cert=settings.OCSP_PEM_PATH,
+    ), name='all'),
+
+    url(r'^ocsp/all-ca-key/$', OCSPView.as_view(), name='all-ca-key'),
+
+    url(r'^ocsp/db-pem/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
+        ca=certs['root']['serial'],
+        responder_key=settings.OCSP_KEY_PATH,
+        responder_cert=certs['ocsp']['serial'],
+    ), name='db-pem'),
+
     url(r'^ocsp/false-pem/(?P<data>[a-zA-Z0-9=+/]+)$', OCSPView.as_view(
         ca=certs['root']['serial'],
         responder_key=settings.OCSP_KEY_PATH,
@@ -280,6 +327,10 @@ class OCSPTestGenericView(OCSPViewTestMixin, DjangoCAWithCertTestCase):
 
 @override_settings(ROOT_URLCONF=__name__)
 class OCSPTestView(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def tearDown(self):
+        cache.clear()
+        super(OCSPTestView, self).tearDown()
+
     def test_get(self):
         data = base64.b64encode(req1).decode('utf-8')
         response = self.client.get(reverse('get', kwargs={'data': data}))
@@ -334,16 +385,42 @@ class OCSPTestView(OCSPViewTestMixin, DjangoCAWithCertTestCase):
         ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
         self.assertEqual(ocsp_response['response_status'].native, 'internal_error')
 
-    def test_unknown(self):
-        data = base64.b64encode(unknown_req).decode('utf-8')
-        response = self.client.get(reverse('get', kwargs={'data': data}))
+    def assertUnknown(self, response, count=1):
         self.assertEqual(response.status_code, 200)
         ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
-        self.assertEqual(ocsp_response['response_status'].native, 'internal_error')
+        self.assertEqual(ocsp_response['response_status'].native, 'successful')
+        responses = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']['responses']
+        self.assertEqual([r['cert_status'].name for r in responses], ['unknown'] * count)
 
-    def test_bad_responder_cert(self):
-        data = base64.b64encode(unknown_req).decode('utf-8')
+    def unknown_data(self, *serials):
+        ca_cert = ocsp.load_pem_certificate(CertificateAuthority.objects.get(pk=self.ca.pk).pub)
+        req = asn1crypto.ocsp.OCSPRequest({'tbs_request': {'request_list': [
+            {'req_cert': ocsp.get_cert_id(ca_cert, serial)} for serial in serials
+        ]}})
+        return base64.b64encode(req.dump()).decode('utf-8')
+
+    def test_unknown(self):
+        data = self.unknown_data('7B')
+        self.assertUnknown(self.client.get(reverse('get', kwargs={'data': data})))
+
+        # unknown serial and the CA are cached, so there is no database query at all
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get', kwargs={'data': data}))
+        self.assertUnknown(response)
+
+    def test_unknown_created(self):
+        data = base64.b64encode(req1).decode('utf-8')
+        Certificate.objects.filter(pk=self.cert.pk).delete()
+        self.assertUnknown(self.client.get(reverse('get', kwargs={'data': data})))
+
+        # creating the certificate removes it from the cache
+        self.load_cert(ca=self.ca, x509=cert1_pubkey)
         response = self.client.get(reverse('get', kwargs={'data': data}))
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+    def test_bad_responder_cert(self):
+        data = base64.b64encode(req1).decode('utf-8')
+        response = self.client.get(reverse('unknown-responder-cert', kwargs={'data': data}))
         self.assertEqual(response.status_code, 200)
         ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
         self.assertEqual(ocsp_response['response_status'].native, 'internal_error')
@@ -356,11 +433,29 @@ class OCSPTestView(OCSPViewTestMixin, DjangoCAWithCertTestCase):
         self.assertEqual(ocsp_response['response_status'].native, 'malformed_request')
 
     def test_multiple(self):
-        data = base64.b64encode(multiple_req).decode('utf-8')
-        response = self.client.get(reverse('get', kwargs={'data': data}))
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)  # test_bad_ca_cert() modifies self.ca
+        ca_cert = ocsp.load_pem_certificate(ca.pub)
+        req = asn1crypto.ocsp.OCSPRequest({
+            'tbs_request': {
+                'request_list': [
+                    {'req_cert': ocsp.get_cert_id(ca_cert, self.cert.serial)},
+                    {'req_cert': ocsp.get_cert_id(ca_cert, self.ocsp_cert.serial)},
+                ],
+            },
+        })
+
+        self.client.post(reverse('post'), req.dump(), content_type='application/ocsp-request')
+
+        # The CA is cached per process, so all certificates are fetched with a single query
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('post'), req.dump(),
+                                        content_type='application/ocsp-request')
         self.assertEqual(response.status_code, 200)
-        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
-        self.assertEqual(ocsp_response['response_status'].native, 'malformed_request')
+        self.assertOCSP(response, requested=[self.cert, self.ocsp_cert], expires=1200)
+
+    def test_multiple_unknown(self):
+        data = self.unknown_data('7B', '01:59')
+        self.assertUnknown(self.client.get(reverse('get', kwargs={'data': data})), count=2)
 
     def test_bad_ca_cert(self):
         self.ca.pub = 'foobar'
@@ -387,3 +482,355 @@ class OCSPTestView(OCSPViewTestMixin, DjangoCAWithCertTestCase):
         self.assertEqual(response.status_code, 200)
         ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
         self.assertEqual(ocsp_response['response_status'].native, 'internal_error')
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OCSPResponderCacheTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(OCSPResponderCacheTestCase, self).setUp()
+        ocsp.clear_responder_cache()
+
+    def tearDown(self):
+        ocsp.clear_responder_cache()
+        super(OCSPResponderCacheTestCase, self).tearDown()
+
+    def get(self, name='get'):
+        data = base64.b64encode(req1).decode('utf-8')
+        response = self.client.get(reverse(name, kwargs={'data': data}))
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+    def test_files_loaded_once(self):
+        with patch('django_ca.ocsp.load_private_key', wraps=ocsp.load_private_key) as key_mock, \
+                patch('django_ca.ocsp.load_certificate', wraps=ocsp.load_certificate) as cert_mock:
+            self.get()
+            self.get()
+
+        self.assertEqual(key_mock.call_count, 1)
+        self.assertEqual(cert_mock.call_count, 2)  # responder and CA certificate
+
+    def test_reload_on_mtime_change(self):
+        self.get()
+        mtime = os.path.getmtime(settings.OCSP_KEY_PATH)
+
+        with patch('django_ca.ocsp.os.path.getmtime', return_value=mtime + 1), \
+                patch('django_ca.ocsp.load_private_key', wraps=ocsp.load_private_key) as key_mock:
+            self.get()
+            self.get()
+        self.assertEqual(key_mock.call_count, 1)
+
+    def test_responder_cert_from_db(self):
+        self.get('db-pem')
+
+        # only the certificate lookup, the CA and the responder certificate are cached
+        data = base64.b64encode(req1).decode('utf-8')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('db-pem', kwargs={'data': data}))
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+
+    def test_clear(self):
+        self.get()
+
+        ocsp.clear_responder_cache()
+        with patch('django_ca.ocsp.load_private_key', wraps=ocsp.load_private_key) as key_mock:
+            self.get()
+        self.assertEqual(key_mock.call_count, 1)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OCSPCachedResponseTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def tearDown(self):
+        cache.clear()
+        super(OCSPCachedResponseTestCase, self).tearDown()
+
+    def get(self, name='cached'):
+        data = base64.b64encode(req1).decode('utf-8')
+        return self.client.get(reverse(name, kwargs={'data': data}))
+
+    def test_cached(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])  # nonce is ignored
+
+        # Second request does not cause any database query
+        with self.assertNumQueries(0):
+            cached = self.get()
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(response.content, cached.content)
+
+    def test_responder_settings(self):
+        # Responders with a different responder certificate or expires do not share cached responses
+        response = self.get()
+        self.assertOCSP(response, requested=[self.cert])
+
+        response = self.get('cached-expires')
+        self.assertOCSP(response, requested=[self.cert], expires=1200)
+        self.assertEqual(self.get('cached-expires').content, response.content)
+
+        response = self.get('cached-ca-key')
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'successful')
+        basic_response = ocsp_response['response_bytes']['response'].parsed
+        self.assertEqual([int_to_hex(c.serial_number) for c in basic_response['certs']], [self.ca.serial])
+        self.assertEqual(self.get('cached-ca-key').content, response.content)
+
+        # all responses are invalidated on revocation
+        Certificate.objects.get(pk=self.cert.pk).revoke()
+        for name in ['cached', 'cached-expires', 'cached-ca-key']:
+            ocsp_response = asn1crypto.ocsp.OCSPResponse.load(self.get(name).content)
+            single_response = ocsp_response['response_bytes']['response'].parsed['tbs_response_data'][
+                'responses'][0]
+            self.assertEqual(single_response['cert_status'].name, 'revoked')
+
+    def test_revoked_while_signing(self):
+        # A response signed before the certificate was revoked is never used
+        responder_cert = ocsp.load_responder_cert(settings.OCSP_PEM_PATH)
+        cached, version = ocsp.get_cached_response(self.ca.serial, self.cert.serial, responder_cert, 600)
+        self.assertIsNone(cached)
+        Certificate.objects.get(pk=self.cert.pk).revoke()
+        ocsp.set_cached_responses(self.ca.serial, [(self.cert.serial, version, b'stale')], responder_cert,
+                                  600)
+        self.assertIsNone(ocsp.get_cached_response(self.ca.serial, self.cert.serial, responder_cert, 600)[0])
+
+    def test_foreign_issuer(self):
+        self.get()  # response is now cached
+
+        # A CertID with the same serial but a different issuer must not get the cached response
+        cert_id = ocsp.get_cert_id(ocsp.load_pem_certificate(self.cert.pub), self.cert.serial)
+        req = asn1crypto.ocsp.OCSPRequest({'tbs_request': {'request_list': [{'req_cert': cert_id}]}})
+        data = base64.b64encode(req.dump()).decode('utf-8')
+        response = self.client.get(reverse('cached', kwargs={'data': data}))
+        self.assertEqual(response.status_code, 200)
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+    def test_revoked(self):
+        response = self.get()
+        self.assertOCSP(response, requested=[self.cert])
+
+        cert = Certificate.objects.get(pk=self.cert.pk)
+        cert.revoke('key_compromise')
+
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        single_response = ocsp_response['response_bytes']['response'].parsed['tbs_response_data'][
+            'responses'][0]
+        self.assertEqual(single_response['cert_status'].name, 'revoked')
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OCSPIssuerIndexTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def setUp(self):
+        super(OCSPIssuerIndexTestCase, self).setUp()
+        ocsp.invalidate_issuer_index()
+        self.ca_cert = ocsp.load_pem_certificate(self.ca.pub)
+
+    def post(self, *cert_ids, **kwargs):
+        req = asn1crypto.ocsp.OCSPRequest({
+            'tbs_request': {'request_list': [{'req_cert': cert_id} for cert_id in cert_ids]},
+        })
+        return self.client.post(reverse(kwargs.get('name', 'all')), req.dump(),
+                                content_type='application/ocsp-request')
+
+    def test_basic(self):
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial))
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+        # index is built only once, so there is only the query for the certificates
+        with self.assertNumQueries(1):
+            response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial))
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_sha256(self):
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial, algorithm='sha256'))
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_ca_key(self):
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial), name='all-ca-key')
+        self.assertEqual(response.status_code, 200)
+
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'successful')
+        basic_response = ocsp_response['response_bytes']['response'].parsed
+        self.assertEqual([int_to_hex(c.serial_number) for c in basic_response['certs']], [self.ca.serial])
+        responses = basic_response['tbs_response_data']['responses']
+        self.assertEqual([r['cert_status'].name for r in responses], ['good'])
+
+    def test_unknown_ca(self):
+        # a CertID computed from a certificate that is not a CA
+        cert_id = ocsp.get_cert_id(ocsp.load_pem_certificate(self.cert.pub), self.cert.serial)
+        response = self.post(cert_id)
+        self.assertEqual(response.status_code, 200)
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+    def test_foreign_issuer(self):
+        # The view has a fixed CA, but the CertID names a different issuer
+        cert_id = ocsp.get_cert_id(ocsp.load_pem_certificate(self.cert.pub), self.cert.serial)
+        response = self.post(cert_id, name='post')
+        self.assertEqual(response.status_code, 200)
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+        # ... also if only one of multiple CertIDs names a different issuer
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial), cert_id, name='post')
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+        # A sha256 CertID of the right CA is accepted
+        cert_id = ocsp.get_cert_id(self.ca_cert, self.cert.serial, algorithm='sha256')
+        response = self.post(cert_id, name='post')
+        self.assertOCSP(response, requested=[self.cert], expires=1200)
+
+    def test_multiple_cas(self):
+        child = self.load_ca(name='child', x509=child_pubkey, parent=self.ca)
+        child_cert = ocsp.load_pem_certificate(child.pub)
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial),
+                             ocsp.get_cert_id(child_cert, self.cert.serial))
+        self.assertEqual(response.status_code, 200)
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+    def test_refresh_on_save(self):
+        self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial))  # builds the index
+
+        child = self.load_ca(name='child', x509=child_pubkey, parent=self.ca)
+        cert_id = ocsp.get_cert_id(ocsp.load_pem_certificate(child.pub), '12:34')
+        self.assertEqual(ocsp.get_issuer(cert_id), child.pk)
+
+        child.delete()
+        self.assertIsNone(ocsp.get_issuer(cert_id))
+
+    def test_get_ca(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(ocsp.get_ca(self.ca.pk), self.ca)
+            self.assertIsNone(ocsp.get_ca(0))
+        with self.assertNumQueries(1):
+            self.assertEqual(ocsp.get_ca_by_serial_or_cn(self.ca.serial), self.ca)
+            self.assertEqual(ocsp.get_ca_by_serial_or_cn(self.ca.serial), self.ca)
+        with self.assertRaises(CertificateAuthority.DoesNotExist):
+            ocsp.get_ca_by_serial_or_cn('unknown')
+
+        # saving a CA invalidates the cached instances
+        ca = CertificateAuthority.objects.get(pk=self.ca.pk)
+        ca.crl_url = 'http://crl.example.com'
+        ca.save()
+        self.assertEqual(ocsp.get_ca(self.ca.pk).crl_url, 'http://crl.example.com')
+        self.assertEqual(ocsp.get_ca_by_serial_or_cn(self.ca.serial).crl_url, 'http://crl.example.com')
+
+    def test_disabled(self):
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(enabled=False)
+        self.assertIsNone(ocsp.get_ca(self.ca.pk))
+        self.assertIsNone(ocsp.get_issuer(ocsp.get_cert_id(self.ca_cert, self.cert.serial)))
+        with self.assertRaises(CertificateAuthority.DoesNotExist):
+            ocsp.get_ca_by_serial_or_cn(self.ca.serial)
+
+        response = self.post(ocsp.get_cert_id(self.ca_cert, self.cert.serial))
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        self.assertEqual(ocsp_response['response_status'].native, 'unauthorized')
+
+    def test_timeout(self):
+        # Changes made in other processes are noticed after the timeout, even if the cache is not shared
+        with patch('django_ca.ocsp.time.time', return_value=1000):
+            self.assertEqual(ocsp.get_ca(self.ca.pk), self.ca)
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(enabled=False)
+
+        timeout = ca_settings.CA_OCSP_INDEX_TIMEOUT
+        with patch('django_ca.ocsp.time.time', return_value=1000 + timeout - 1):
+            self.assertEqual(ocsp.get_ca(self.ca.pk), self.ca)
+        with patch('django_ca.ocsp.time.time', return_value=1000 + timeout):
+            self.assertIsNone(ocsp.get_ca(self.ca.pk))
+
+    @override_settings(CA_OCSP_INDEX_TIMEOUT=None)
+    def test_no_timeout(self):
+        with patch('django_ca.ocsp.time.time', return_value=1000):
+            self.assertEqual(ocsp.get_ca(self.ca.pk), self.ca)
+        CertificateAuthority.objects.filter(pk=self.ca.pk).update(enabled=False)
+        with patch('django_ca.ocsp.time.time', return_value=10 ** 10):
+            self.assertEqual(ocsp.get_ca(self.ca.pk), self.ca)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OCSPHTTPCacheTestCase(OCSPViewTestMixin, DjangoCAWithCertTestCase):
+    def tearDown(self):
+        cache.clear()
+        super(OCSPHTTPCacheTestCase, self).tearDown()
+
+    def get(self, name='cached', req=req1, **kwargs):
+        data = base64.b64encode(req).decode('utf-8')
+        return self.client.get(reverse(name, kwargs={'data': data}), **kwargs)
+
+    def test_headers(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+        self.assertEqual(response['ETag'], '"%s"' % hashlib.sha1(response.content).hexdigest())
+        self.assertIn('Last-Modified', response)
+        self.assertIn('Expires', response)
+
+        cache_control = response['Cache-Control'].split(', ')
+        self.assertEqual(cache_control[1:], ['public', 'no-transform', 'must-revalidate'])
+        max_age = int(cache_control[0].split('=')[1])
+        self.assertTrue(590 < max_age <= 600)
+
+    def test_nonce(self):
+        # Responses with a nonce are only valid for a single client
+        response = self.get(name='get')
+        self.assertOCSP(response, requested=[self.cert], nonce=req1_nonce)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Expires', response)
+
+    def test_not_cached(self):
+        # Without cache_responses, every request gets a newly signed response, so there are no validators
+        cert_id = ocsp.get_cert_id(ocsp.load_pem_certificate(self.ca.pub), self.cert.serial)
+        req = asn1crypto.ocsp.OCSPRequest({'tbs_request': {'request_list': [{'req_cert': cert_id}]}})
+        response = self.get(name='get', req=req.dump(),
+                            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Expires', response)
+        self.assertTrue(response['Cache-Control'].endswith(', public, no-transform, must-revalidate'))
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.get(HTTP_IF_NONE_MATCH='"foobar", %s' % etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(HTTP_IF_NONE_MATCH='"foobar"')
+        self.assertEqual(response.status_code, 200)
+        self.assertOCSP(response, requested=[self.cert])
+
+    def test_if_modified_since(self):
+        last_modified = self.get()['Last-Modified']
+
+        response = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.get(HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_post(self):
+        response = self.client.post(reverse('post'), req1, content_type='application/ocsp-request')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Cache-Control', response)
+        self.assertNotIn('ETag', response)
+
+    def test_failure(self):
+        response = self.get(req=b'foobar')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Cache-Control', response)
+        self.assertNotIn('ETag', response)
@@ -30,6 +30,18 @@ if ca_settings.CA_PROVIDE_GENERIC_CRL is True:  # pragma: no branch
     urlpatterns.append(
         url(r'^crl/ca/(?P<serial>[0-9A-F:]+)/$', views.CertificateRevocationListView.as_view(ca_crl=True),
             name='ca-crl'))
+    urlpatterns.append(
+        url(r'^crl/(?P<serial>[0-9A-F:]+)/delta/$',
+            views.CertificateRevocationListView.as_view(delta=True, expires=ca_settings.CA_DELTA_CRL_EXPIRES),
+            name='delta-crl'))
+    urlpatterns.append(
+        url(r'^crl/ca/(?P<serial>[0-9A-F:]+)/delta/$',
+            views.CertificateRevocationListView.as_view(ca_crl=True, delta=True,
+                                                        expires=ca_settings.CA_DELTA_CRL_EXPIRES),
+            name='ca-delta-crl'))
+    urlpatterns.append(
+        url(r'^crl/(?P<serial>[0-9A-F:]+)/shard/(?P<shard>[0-9]+)/$',
+            views.CertificateRevocationListView.as_view(), name='crl-shard'))
 
 for name, kwargs in getattr(settings, 'CA_OCSP_URLS', {}).items():
     kwargs.setdefault('ca', name)
@@ -26,6 +26,7 @@ from ipaddress import ip_network
 import idna
 
 from cryptography import x509
+from cryptography.hazmat.backends import default_backend
 from cryptography.x509 import TLSFeatureType
 from cryptography.x509.oid import ExtendedKeyUsageOID
 from cryptography.x509.oid import NameOID
@@ -228,6 +229,15 @@ def int_to_hex(i):
     return add_colons(s)
 
 
+def hex_to_int(s):
+    """Parse a serial as created by :py:func:`int_to_hex`.
+
+    >>> hex_to_int('BC:61:4E')
+    12345678
+    """
+    return int(s.replace(':', ''), 16)
+
+
 def parse_name(name):
     """Parses a subject string as used in OpenSSLs command line utilities.
 
@@ -475,7 +485,7 @@ def parse_general_name(name):
         return x509.DNSName(name)
 
 
-def get_cert_builder(expires, now=None):
+def get_cert_builder(expires, now=None, serial=None):
     """Get a basic X509 cert object.
 
     Parameters
@@ -485,6 +495,8 @@ def get_cert_builder(expires, now=None):
         When this certificate will expire.
     now : datetime
         The functions notion of "now", used for testing.
+    serial : int, optional
+        The serial of the certificate. The default is a random serial.
     """
     if now is None:
         now = datetime.utcnow()
@@ -494,11 +506,34 @@ def get_cert_builder(expires, now=None):
     builder = x509.CertificateBuilder()
     builder = builder.not_valid_before(now)
     builder = builder.not_valid_after(expires)
-    builder = builder.serial_number(x509.random_serial_number())
+    builder = builder.serial_number(x509.random_serial_number() if serial is None else serial)
 
     return builder
 
 
+def get_revoked_certificate(serial, revoked_date, reason=None):
+    """Get a revoked certificate (an entry in a CRL) from the values stored in the database.
+
+    Parameters
+    ----------
+
+    serial : str
+        The serial of the certificate as created by :py:func:`int_to_hex`.
+    revoked_date : datetime
+        When the certificate was revoked.
+    reason : str, optional
+        The reason for revocation, one of the values of
+        :py:class:`cryptography:cryptography.x509.ReasonFlags`.
+    """
+    builder = x509.RevokedCertificateBuilder().serial_number(hex_to_int(serial)).revocation_date(revoked_date)
+
+    if reason:
+        reason_flag = getattr(x509.ReasonFlags, reason)
+        builder = builder.add_extension(x509.CRLReason(reason_flag), critical=False)
+
+    return builder.build(default_backend())
+
+
 def get_cert_profile_kwargs(name=None):
     """Get kwargs suitable for get_cert X509 keyword arguments from the given profile."""
 
@@ -14,35 +14,59 @@
 # <http://www.gnu.org/licenses/>.
 
 import base64
+import calendar
+import hashlib
 import logging
 import os
+import time
 from datetime import datetime
-from datetime import timedelta
 
 import asn1crypto
+from asn1crypto.util import timezone
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import Encoding
 from ocspbuilder import OCSPResponseBuilder
-from oscrypto.asymmetric import load_certificate
-from oscrypto.asymmetric import load_private_key
 
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.http import FileResponse
+from django.http import Http404
 from django.http import HttpResponse
+from django.http import HttpResponseNotModified
 from django.http import HttpResponseServerError
+from django.http import StreamingHttpResponse
 from django.utils.decorators import method_decorator
-from django.utils.encoding import force_bytes
-from django.utils.encoding import force_text
+from django.utils.http import http_date
+from django.utils.http import parse_http_date_safe
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.edit import UpdateView
 
 from .crl import get_crl
+from .crl import get_crl_cache_key
+from .crl import get_crl_chunks
+from .crl import set_crl_chunks
+from .crl import write_crl
 from .forms import RevokeCertificateForm
 from .models import Certificate
 from .models import CertificateAuthority
-from .utils import int_to_hex
+from .ocsp import get_ca
+from .ocsp import get_ca_by_serial_or_cn
+from .ocsp import get_cached_response
+from .ocsp import get_cert_id_hashes
+from .ocsp import get_issuer
+from .ocsp import get_issuer_hashes
+from .ocsp import get_unknown_cache_key
+from .ocsp import is_cacheable_response
+from .ocsp import load_cached_certificate
+from .ocsp import load_pem_certificate
+from .ocsp import load_responder_cert
+from .ocsp import load_responder_key
+from .ocsp import parse_request
+from .ocsp import set_cached_responses
+from .ocsp import sign_response
+from .snapshot import get_snapshot
 
 log = logging.getLogger(__name__)
 try:
@@ -51,12 +75,25 @@ except ImportError:  # pragma: only django<=1.8
     from django.core.urlresolvers import reverse
 
 
+def is_not_modified(request, etag, last_modified):
+    """Return ``True`` if the request contains a matching ``If-None-Match`` or ``If-Modified-Since`` header.
+
+    ``If-Modified-Since`` is only considered if the request does not contain ``If-None-Match``.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [e.strip() for e in if_none_match.split(',')] or if_none_match == '*'
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
 class CertificateRevocationListView(View, SingleObjectMixin):
     """Generic view that provides Certificate Revocation Lists (CRLs)."""
 
     slug_field = 'serial'
     slug_url_kwarg = 'serial'
-    queryset = CertificateAuthority.objects.all().prefetch_related('certificate_set')
+    queryset = CertificateAuthority.objects.all()
 
     password = None
     """Password used to load the private key of the certificate authority. If not set, the private key is
@@ -69,28 +106,175 @@ class CertificateRevocationListView(View, SingleObjectMixin):
     ca_crl = False
     """If set to ``True``, return a CRL for child CAs instead."""
 
+    delta = False
+    """If set to ``True``, return a delta CRL containing only certificates revoked since the last base CRL.
+    If no base CRL was generated yet, a "404 Not Found" response is returned."""
+
+    shard = None
+    """Return the CRL for only this shard (see :py:attr:`~django_ca.models.CertificateAuthority.crl_shards`).
+    Usually passed as ``shard`` URL keyword argument. If the CA does not have this shard, a "404 Not Found"
+    response is returned."""
+
     expires = 600
     """CRL expires in this many seconds."""
 
+    refresh = None
+    """Regenerate the CRL after this many seconds. Until the new CRL is ready, the previous one is still
+    served. The default is half of ``expires``."""
+
+    lock_timeout = 60
+    """Maximum time in seconds that generating a CRL may take. Only one process generates a CRL at any
+    given time, if no CRL is available yet, other processes wait up to this long for it."""
+
     digest = hashes.SHA512()
     """Digest used for generating the CRL."""
 
+    chunk_size = 512 * 1024
+    """CRLs larger than this many bytes are split into multiple cache entries, as cache backends usually
+    limit the size of a single item (memcached: 1 MB by default)."""
+
+    crl_dir = None
+    """If set, generated CRLs are stored in this directory and served from there instead of from the cache.
+    The directory must be writable and shared by all processes serving CRLs."""
+
+    sendfile_header = None
+    """Let the web server send CRLs stored in ``crl_dir`` by setting this header, e.g. ``X-Sendfile``
+    (Apache, lighttpd) or ``X-Accel-Redirect`` (nginx)."""
+
+    sendfile_prefix = None
+    """Prefix for the filename sent in ``sendfile_header``, the default is ``crl_dir``. For
+    ``X-Accel-Redirect``, set this to the internal location that serves ``crl_dir``."""
+
     # header used in the request
     content_type = None
     """Value of the Content-Type header used in the response. For CRLs in PEM format, use ``text/plain``."""
 
-    def get(self, request, serial):
-        cache_key = 'crl_%s_%s_%s' % (serial, self.type, self.digest.name)
-        if self.ca_crl is True:
-            cache_key += '_ca'
+    def get_filename(self, serial):
+        """Get the filename used for storing the CRL in ``crl_dir``."""
 
-        crl = cache.get(cache_key)
-        if crl is None:
-            ca = self.get_object()
+        filename = '%s_%s' % (serial.replace(':', ''), self.digest.name)
+        if self.ca_crl is True:
+            filename += '_ca'
+        if self.delta is True:
+            filename += '_delta'
+        if self.shard is not None:
+            filename += '_shard%s' % self.shard
+        return '%s.%s' % (filename, 'pem' if self.type == Encoding.PEM else 'crl')
+
+    def generate_crl(self, cache_key):
+        """Generate a new CRL and store it in the cache (or in ``crl_dir``).
+
+        Returns
+        -------
+
+        A dictionary with the CRL number, the thisUpdate and nextUpdate timestamps, the ETag and the CRL
+        itself (key ``crl``) or the path where it was stored (key ``path``). In the cache, large CRLs are
+        replaced with the list of keys of their chunks (key ``chunks``).
+        """
+        ca = self.get_object()
+        last_update = int(time.time())
+        try:
             crl = get_crl(ca, encoding=self.type, expires=self.expires, algorithm=self.digest,
-                          password=self.password, ca_crl=self.ca_crl)
-            cache.set(cache_key, crl, self.expires)
+                          password=self.password, ca_crl=self.ca_crl, delta=self.delta, shard=self.shard)
+        except ValueError as e:  # no base CRL for a delta CRL or invalid shard
+            raise Http404(e)
+
+        artifact = {
+            'number': ca.crl_number,
+            'last_update': last_update,
+            'next_update': last_update + self.expires,
+            'etag': '"%s"' % hashlib.sha256(crl).hexdigest(),
+            'crl': crl,
+            'path': None,
+            'chunks': None,
+        }
+        if self.crl_dir is not None:
+            artifact['path'] = os.path.join(self.crl_dir, self.get_filename(ca.serial))
+            write_crl(artifact['path'], crl)
+            artifact['crl'] = None  # the cache only holds the metadata
+
+        refresh = self.expires / 2 if self.refresh is None else self.refresh
+        try:
+            cached = artifact
+            if artifact['crl'] is not None and len(crl) > self.chunk_size:
+                # Chunks outlive the cached metadata, so they are always available while it is cached
+                chunks = set_crl_chunks(crl, self.expires + self.lock_timeout, self.chunk_size)
+                cached = dict(artifact, crl=None, chunks=chunks)
+            cache.set(cache_key, (time.time() + refresh, cached), self.expires)
+        except Exception as e:
+            log.error('%s: Could not store CRL in the cache: %s', cache_key, e)
+        return artifact
 
+    def get_cached(self, cache_key):
+        cached = cache.get(cache_key)
+
+        # The stored CRL might be missing if crl_dir is not shared by all hosts
+        if cached is not None and cached[1]['path'] is not None and not os.path.exists(cached[1]['path']):
+            return None
+        return cached
+
+    def get_chunks(self, cache_key, chunks):
+        """Fetch all chunks of a CRL from the cache.
+
+        Returns
+        -------
+
+        The list of chunks or ``None`` if a chunk is missing. In this case, the cached CRL is removed so that
+        it is regenerated.
+        """
+        try:
+            return get_crl_chunks(chunks)
+        except KeyError as e:
+            log.error('%s: CRL chunk %s is missing from the cache.', cache_key, e)
+            cache.delete(cache_key)
+
+    def get_crl(self, cache_key):
+        """Get the CRL from the cache, (re-)generating it if necessary.
+
+        A cache lock makes sure that only one process generates a CRL. Other processes serve the previous
+        CRL in the meantime or wait for the new CRL if there is none.
+
+        Returns
+        -------
+
+        The dictionary returned by :py:meth:`generate_crl` or ``None`` if waiting for the CRL timed out.
+        """
+        lock_key = '%s_lock' % cache_key
+        cached = self.get_cached(cache_key)
+
+        if cached is not None:
+            refresh_at, artifact = cached
+            if refresh_at <= time.time() and cache.add(lock_key, True, self.lock_timeout):
+                try:
+                    artifact = self.generate_crl(cache_key)
+                except Exception as e:  # the previous CRL is still valid
+                    log.exception(e)
+                finally:
+                    cache.delete(lock_key)
+            return artifact
+
+        deadline = time.time() + self.lock_timeout
+        while True:
+            if cache.add(lock_key, True, self.lock_timeout):
+                try:
+                    return self.generate_crl(cache_key)
+                finally:
+                    cache.delete(lock_key)
+
+            # Another process is generating the CRL
+            time.sleep(0.1)
+            cached = self.get_cached(cache_key)
+            if cached is not None:
+                return cached[1]
+            elif time.time() > deadline:
+                return None
+
+    def get(self, request, serial, shard=None):
+        if shard is not None:
+            self.shard = int(shard)
+
+        cache_key = get_crl_cache_key(serial, self.type, self.digest, ca_crl=self.ca_crl, delta=self.delta,
+                                      shard=self.shard)
         content_type = self.content_type
         if content_type is None:
             if self.type == Encoding.DER:
@@ -101,7 +285,42 @@ class CertificateRevocationListView(View, SingleObjectMixin):
                 # DER/PEM are all known encoding types, so this shouldn't happen
                 return HttpResponseServerError()
 
-        return HttpResponse(crl, content_type=content_type)
+        # All chunks are fetched before sending the response, so an incomplete CRL is never sent. If a chunk
+        # is missing, the CRL is regenerated once.
+        for attempt in range(2):
+            artifact = self.get_crl(cache_key)
+            if artifact is None:
+                log.error('%s: Timeout while waiting for CRL to be generated.', cache_key)
+                return HttpResponse(status=503)
+
+            chunks = None
+            not_modified = is_not_modified(request, artifact['etag'], artifact['last_update'])
+            if not_modified or artifact['chunks'] is None:
+                break
+
+            chunks = self.get_chunks(cache_key, artifact['chunks'])
+            if chunks is not None:
+                break
+        else:  # chunks of the regenerated CRL are missing as well
+            return HttpResponse(status=503)
+
+        if not_modified:
+            response = HttpResponseNotModified()
+        elif artifact['crl'] is not None:
+            response = HttpResponse(artifact['crl'], content_type=content_type)
+        elif chunks is not None:
+            response = StreamingHttpResponse(chunks, content_type=content_type)
+        elif self.sendfile_header is not None:
+            prefix = self.crl_dir if self.sendfile_prefix is None else self.sendfile_prefix
+            response = HttpResponse(content_type=content_type)
+            response[self.sendfile_header] = os.path.join(prefix, os.path.basename(artifact['path']))
+        else:
+            response = FileResponse(open(artifact['path'], 'rb'), content_type=content_type)
+
+        response['ETag'] = artifact['etag']
+        response['Last-Modified'] = http_date(artifact['last_update'])
+        response['Expires'] = http_date(artifact['next_update'])
+        return response
 
 
 class RevokeCertificateView(UpdateView):
@@ -142,14 +361,17 @@ class OCSPView(View):
         https://github.com/threema-ch/ocspresponder/blob/master/ocspresponder/__init__.py.
     """
     ca = None
-    """The name or serial of your Certificate Authority."""
+    """The name or serial of your Certificate Authority. If ``None``, the certificate authority is
+    identified by the hash of its name and public key in the request, so the view can serve responses for
+    all certificate authorities."""
 
     responder_key = None
-    """Absolute path to the private key used for signing OCSP responses."""
+    """Absolute path to the private key used for signing OCSP responses. If ``None``, responses are signed
+    with the private key of the certificate authority, which must not be encrypted."""
 
     responder_cert = None
     """Absolute path to the public key used for signing OCSP responses. May also be a serial identifying a
-    certificate from the database."""
+    certificate from the database. If ``None``, the certificate of the certificate authority is used."""
 
     expires = 600
     """Time in seconds that the responses remain valid. The default is 600 seconds or ten minutes."""
@@ -157,12 +379,71 @@ class OCSPView(View):
     ca_ocsp = False
     """If set to ``True``, validate child CAs instead."""
 
+    cache_responses = False
+    """If set to ``True``, signed responses are cached and reused for subsequent requests for the same
+    certificate, as suggested by :rfc:`5019`. Responses are regenerated after half of ``expires`` seconds or
+    immediately if the certificate is revoked. Responders with a different responder certificate,
+    ``expires`` or ``ca_ocsp`` setting never share cached responses.
+
+    Responses to GET requests only include the ``ETag`` and ``Last-Modified`` headers (and conditional
+    requests are only supported) if this is enabled.
+
+    .. WARNING:: In this mode, the nonce extension of requests is ignored.
+    """
+
+    unknown_expires = 60
+    """Time in seconds that serials not found in the database are cached. Requests for such serials
+    receive a response with the "unknown" status, which is valid for this long."""
+
+    snapshot = None
+    """Path to a revocation snapshot written by ``manage.py dump_ocsp_snapshot``. If set, the status of
+    certificates is read from the snapshot instead of the database. The path may contain ``%(serial)s``,
+    which is replaced with the serial of the certificate authority (without colons)."""
+
     @method_decorator(csrf_exempt)
     def dispatch(self, *args, **kwargs):
         return super(OCSPView, self).dispatch(*args, **kwargs)
 
     def get(self, request, data):
-        return self.process_ocsp_request(base64.b64decode(data))
+        response = self.process_ocsp_request(base64.b64decode(data))
+        if response.status_code == 200:
+            response = self.add_cache_headers(request, response)
+        return response
+
+    def add_cache_headers(self, request, response):
+        """Add HTTP caching headers to a GET response as described in :rfc:`5019`, section 6.
+
+        Only successful OCSP responses without a nonce (see ``cache_responses``) are cacheable, responses
+        with a nonce are marked as private. The ``ETag`` and ``Last-Modified`` headers are only added if
+        ``cache_responses`` is ``True``, since otherwise every request returns a newly signed response. If
+        the request contains a matching ``If-None-Match`` or ``If-Modified-Since`` header, an empty "304 Not
+        Modified" response is returned instead.
+        """
+        ocsp_response = asn1crypto.ocsp.OCSPResponse.load(response.content)
+        if ocsp_response['response_status'].native != 'successful':
+            return response
+        elif not is_cacheable_response(ocsp_response):
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+
+        response_data = ocsp_response['response_bytes']['response'].parsed['tbs_response_data']
+        next_update = min(r['next_update'].native for r in response_data['responses'])
+        max_age = max(0, int((next_update - datetime.now(timezone.utc)).total_seconds()))
+
+        if self.cache_responses is True:
+            produced_at = response_data['produced_at'].native
+            etag = '"%s"' % hashlib.sha1(response.content).hexdigest()
+            last_modified = calendar.timegm(produced_at.utctimetuple())
+
+            if is_not_modified(request, etag, last_modified):
+                response = HttpResponseNotModified()
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+
+        response['Expires'] = http_date(calendar.timegm(next_update.utctimetuple()))
+        response['Cache-Control'] = 'max-age=%s, public, no-transform, must-revalidate' % max_age
+        return response
 
     def post(self, request):
         return self.process_ocsp_request(request.body)
@@ -184,108 +465,142 @@ class OCSPView(View):
         return HttpResponse(response.dump(), status=status,
                             content_type='application/ocsp-response')
 
-    def get_responder_key(self):
-        with open(self.responder_key, 'rb') as stream:
-            responder_key = stream.read()
-
-        # try to load responder key and cert with oscrypto, to make sure they are actually usable
-        return load_private_key(responder_key)
+    def get_responder_key(self, ca):
+        # The key is cached per process, see django_ca.ocsp.load_responder_key()
+        if self.responder_key is None:
+            return load_responder_key(ca.private_key_path)
+        return load_responder_key(self.responder_key)
+
+    def get_responder_cert(self, ca):
+        if self.responder_cert is None:
+            return load_pem_certificate(ca.pub)
+        elif os.path.exists(self.responder_cert):
+            return load_responder_cert(self.responder_cert)
+
+        serial = self.responder_cert
+        return load_cached_certificate(serial, lambda: Certificate.objects.get(serial=serial).pub)
+
+    def get_snapshot_statuses(self, ca, serials):
+        """Get the status of the given serials from the revocation snapshot (see ``snapshot``)."""
+
+        snapshot = get_snapshot(self.snapshot % {'serial': ca.serial.replace(':', '')})
+        statuses = {}
+        for serial in set(serials):
+            status = snapshot.get(serial)
+            if status is not None:
+                statuses[serial] = status
+        unknown_serials = set(serials) - set(statuses)
+        if unknown_serials:
+            log.warning('OCSP request for unknown serial(s) received: %s', ', '.join(sorted(unknown_serials)))
+        return statuses, unknown_serials
+
+    def get_db_statuses(self, ca, serials):
+        """Get the status of the given serials from the database with a single query."""
 
-    def get_responder_cert(self):
-        if os.path.exists(self.responder_cert):
-            with open(self.responder_cert, 'rb') as stream:
-                responder_cert = stream.read()
+        if self.ca_ocsp is True:
+            qs = CertificateAuthority.objects.filter(parent=ca)
         else:
-            responder_cert = Certificate.objects.get(serial=self.responder_cert)
-
-        return load_certificate(responder_cert)
+            qs = Certificate.objects.filter(ca=ca)
+
+        # Serials that are known to not exist are cached for a short time (see unknown_expires), so
+        # repeated requests for them do not cause any database query.
+        unknown_keys = {get_unknown_cache_key(ca.serial, serial, self.ca_ocsp): serial
+                        for serial in set(serials)}
+        unknown_serials = set(unknown_keys[k] for k in cache.get_many(list(unknown_keys)))
+        lookup = set(serials) - unknown_serials
+
+        statuses = {}
+        if lookup:
+            qs = qs.filter(serial__in=lookup).only('serial', 'revoked', 'revoked_date', 'revoked_reason')
+            statuses = {c.serial: (c.ocsp_status, c.revoked_date) for c in qs}
+
+        missing = lookup - set(statuses)
+        if missing:
+            log.warning('OCSP request for unknown serial(s) received: %s', ', '.join(sorted(missing)))
+            cache.set_many({k: True for k, serial in unknown_keys.items() if serial in missing},
+                           self.unknown_expires)
+            unknown_serials |= missing
+        return statuses, unknown_serials
 
     def get_ocsp_response(self, data):
         try:
-            ocsp_request = asn1crypto.ocsp.OCSPRequest.load(data)
-
-            tbs_request = ocsp_request['tbs_request']
-            request_list = tbs_request['request_list']
-            if len(request_list) != 1:
-                log.error('Received OCSP request with multiple sub requests')
-                raise NotImplemented('Combined requests not yet supported')
-            single_request = request_list[0]  # TODO: Support more than one request
-            req_cert = single_request['req_cert']
-            serial = int_to_hex(req_cert['serial_number'].native)
+            req_certs, serials, nonce = parse_request(data)
         except Exception as e:
             log.exception('Error parsing OCSP request: %s', e)
             return self.fail(u'malformed_request')
 
         # Get CA and certificate
-        try:
-            ca = CertificateAuthority.objects.get_by_serial_or_cn(self.ca)
-        except CertificateAuthority.DoesNotExist:
-            log.error('%s: Certificate Authority could not be found.')
-            return self.fail(u'internal_error')
-
-        if self.ca_ocsp is True:
-            try:
-                cert = CertificateAuthority.objects.filter(parent=ca).get(serial=serial)
-            except CertificateAuthority.DoesNotExist:
-                log.warn('OCSP request for unknown CA received.')
+        if self.ca is None:
+            issuers = set(get_issuer(c) for c in req_certs)
+            if len(issuers) != 1 or None in issuers:
+                log.warning('OCSP request for unknown CA or for certificates of multiple CAs received.')
+                return self.fail(u'unauthorized')
+
+            ca = get_ca(issuers.pop())
+            if ca is None:  # pragma: no cover - CA deleted in another process
+                log.error('Certificate Authority was deleted.')
                 return self.fail(u'internal_error')
         else:
+            # The CA is cached per process, so the certificate status is the only database query
             try:
-                cert = Certificate.objects.filter(ca=ca).get(serial=serial)
-            except Certificate.DoesNotExist:
-                log.warn('OCSP request for unknown cert received.')
+                ca = get_ca_by_serial_or_cn(self.ca)
+            except CertificateAuthority.DoesNotExist:
+                log.error('%s: Certificate Authority could not be found.', self.ca)
                 return self.fail(u'internal_error')
 
         # load ca cert and responder key/cert
         try:
-            ca_cert = load_certificate(force_bytes(ca.pub))
+            ca_cert = load_pem_certificate(ca.pub)
         except Exception:
             log.error('Could not load CA certificate.')
             return self.fail(u'internal_error')
 
+        # The CertIDs are copied to the response, so they must identify this CA
+        if self.ca is not None:
+            issuer_hashes = get_issuer_hashes(ca_cert)
+            if any(get_cert_id_hashes(c) not in issuer_hashes for c in req_certs):
+                log.warning('OCSP request for a different CA received.')
+                return self.fail(u'unauthorized')
+
         try:
-            responder_key = self.get_responder_key()
-            responder_cert = self.get_responder_cert()
+            responder_key = self.get_responder_key(ca)
+            responder_cert = self.get_responder_cert(ca)
         except Exception:
             log.error('Could not read responder key/cert.')
             return self.fail(u'internal_error')
 
-        builder = OCSPResponseBuilder(
-            response_status=u'successful',  # ResponseStatus.successful.value,
-            certificate=load_certificate(force_bytes(cert.pub)),
-            certificate_status=force_text(cert.ocsp_status),
-            revocation_date=cert.revoked_date,
-        )
-
-        # Parse extensions
-        for extension in tbs_request['request_extensions']:
-            extn_id = extension['extn_id'].native
-            critical = extension['critical'].native
-            value = extension['extn_value'].parsed
-
-            # This variable tracks whether any unknown extensions were encountered
-            unknown = False
-
-            # Handle nonce extension
-            if extn_id == 'nonce':
-                builder.nonce = value.native
-
-            # That's all we know
-            else:  # pragma: no cover
-                unknown = True
-
-            # If an unknown critical extension is encountered (which should not
-            # usually happen, according to RFC 6960 4.1.2), we should throw our
-            # hands up in despair and run.
-            if unknown is True and critical is True:  # pragma: no cover
-                log.warning('Could not parse unknown critical extension: %r',
-                            dict(extension.native))
-                return self._fail('internal_error')
-
-            # If it's an unknown non-critical extension, we can safely ignore it.
-            elif unknown is True:  # pragma: no cover
-                log.info('Ignored unknown non-critical extension: %r', dict(extension.native))
-
-        builder.certificate_issuer = ca_cert
-        builder.next_update = datetime.utcnow() + timedelta(seconds=self.expires)
-        return builder.build(responder_key, responder_cert)
+        # Only responses for a single certificate are cached. Pre-generated responses (see the
+        # dump_ocsp_responses command) always use SHA1 for the CertID, as required by RFC 5019.
+        use_cache = self.cache_responses is True and len(req_certs) == 1 \
+            and req_certs[0]['hash_algorithm']['algorithm'].native == 'sha1'
+        if use_cache is True:
+            cached, version = get_cached_response(ca.serial, serials[0], responder_cert, self.expires,
+                                                  self.ca_ocsp)
+            if cached is not None:
+                return asn1crypto.ocsp.OCSPResponse.load(cached)
+
+        if self.snapshot is not None:
+            statuses, unknown_serials = self.get_snapshot_statuses(ca, serials)
+        else:
+            statuses, unknown_serials = self.get_db_statuses(ca, serials)
+
+        if self.cache_responses is True:
+            nonce = None  # nonce is ignored if responses are cached
+
+        expires = self.expires
+        responses = []
+        for req_cert, serial in zip(req_certs, serials):
+            if serial in unknown_serials:
+                responses.append((req_cert, 'unknown', None))
+                expires = min(expires, self.unknown_expires)
+            else:
+                status, revoked_date = statuses[serial]
+                responses.append((req_cert, status, revoked_date))
+
+        response = sign_response(ca_cert, responses, responder_key=responder_key,
+                                 responder_cert=responder_cert, expires=expires, nonce=nonce)
+
+        if use_cache is True:
+            set_cached_responses(ca.serial, [(serials[0], version, response.dump())], responder_cert,
+                                 self.expires, self.ca_ocsp, timeout=int(expires / 2))
+        return response
@@ -69,7 +69,7 @@ class BaseCommand(Command):
     def finalize_options(self):
         pass
 
-    def run_tests(self):
+    def run_tests(self, **kwargs):
         work_dir = os.path.join(_rootdir, 'ca')
 
         os.chdir(work_dir)
@@ -84,7 +84,7 @@ class BaseCommand(Command):
             suite += '.tests.%s' % self.suite
 
         from django.core.management import call_command
-        call_command('test', suite)
+        call_command('test', suite, **kwargs)
 
 
 class TestCommand(BaseCommand):
@@ -94,6 +94,13 @@ class TestCommand(BaseCommand):
         self.run_tests()
 
 
+class BenchmarkCommand(BaseCommand):
+    description = 'Run benchmarks for django-ca.'
+
+    def run(self):
+        self.run_tests(pattern='benchmarks*.py')
+
+
 class CoverageCommand(BaseCommand):
     description = 'Generate test-coverage for django-ca.'
 
@@ -206,6 +213,7 @@ setup(
     zip_safe=False,  # because of the static files
     install_requires=install_requires,
     cmdclass={
+        'benchmark': BenchmarkCommand,
         'coverage': CoverageCommand,
         'test': TestCommand,
         'code_quality': QualityCommand,